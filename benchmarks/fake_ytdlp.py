@@ -0,0 +1,170 @@
+"""
+Поддельный yt-dlp для бенчмарков пула: без сети и без записи файлов.
+
+Понимает ровно то, что запускает VideoDownloader в режиме процесса:
+экстракцию (--dump-single-json) и загрузку (--progress-template/--print).
+Печатает JSON-строки в формате PROGRESS_TEMPLATE, POSTPROCESS_TEMPLATE и
+MOVED_TEMPLATE. Поведение задаётся переменными окружения:
+
+    FAKE_YTDLP_LINES     строк прогресса на загрузку (50)
+    FAKE_YTDLP_INTERVAL  пауза между строками, сек (0.02)
+    FAKE_YTDLP_SIZE      «размер» файла, байт (10 МиБ)
+    FAKE_YTDLP_STDERR    строк мусора в stderr на строку прогресса (0)
+    FAKE_YTDLP_FAIL      доля задач, завершающихся ошибкой, 0..1 (0)
+    FAKE_YTDLP_TRACE     папка для меток времени строк прогресса (не задана — без меток)
+    FAKE_YTDLP_SILENT    1 — фрагменты (--download-sections) «зависают»: файл не растёт
+
+Фрагменты yt-dlp качает через ffmpeg, и прогресса нет до конца загрузки:
+заглушка так же молча дописывает файл LINES * INTERVAL секунд.
+
+Какие задачи падают, решает хэш ссылки: от запуска к запуску одни и те же.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+
+_FIELD_RE = re.compile(r"%\((\w+)\)[sd]")
+
+
+def _env(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _arg(argv, flag, default=None):
+    try:
+        return argv[argv.index(flag) + 1]
+    except (ValueError, IndexError):
+        return default
+
+
+def _url(argv) -> str:
+    """Ссылка задачи: после неё VideoDownloader дописывает ещё флаги вывода."""
+    return next((a for a in argv if "://" in a), "")
+
+
+def _fraction(text: str) -> float:
+    """Детерминированное число [0, 1) по строке."""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+
+
+def _info(url: str) -> dict:
+    video_id = hashlib.sha1(url.encode("utf-8")).hexdigest()[:11]
+    return {
+        "_type": "video",
+        "id": video_id,
+        "title": f"bench_{video_id}",
+        "extractor": "fake",
+        "extractor_key": "Fake",
+        "webpage_url": url,
+        "duration": 60,
+        "ext": "mp4",
+        "formats": [{"format_id": "18", "url": url, "ext": "mp4", "vcodec": "avc1", "acodec": "mp4a"}],
+    }
+
+
+def _print(data: dict) -> None:
+    # NA вместо null — как у шаблонов yt-dlp для отсутствующих полей
+    line = json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace(":null", ":NA")
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def extract(argv) -> int:
+    sys.stdout.write(json.dumps(_info(_url(argv))) + "\n")
+    return 0
+
+
+def download(argv) -> int:
+    source = _arg(argv, "--load-info-json")
+    if source:
+        with open(source, "r", encoding="utf-8") as f:
+            info = json.load(f)
+    else:
+        info = _info(_url(argv))
+    template = _arg(argv, "--output", "%(title)s.%(ext)s")
+    name = _FIELD_RE.sub(lambda m: str(info.get(m.group(1), "NA")), template)
+    filename = os.path.join(_arg(argv, "--paths", "."), name)
+
+    lines = max(1, int(_env("FAKE_YTDLP_LINES", 50)))
+    interval = _env("FAKE_YTDLP_INTERVAL", 0.02)
+    size = int(_env("FAKE_YTDLP_SIZE", 10 * 1024 * 1024))
+    noise = int(_env("FAKE_YTDLP_STDERR", 0))
+    fails = _fraction(info["webpage_url"]) < _env("FAKE_YTDLP_FAIL", 0)
+    if "--download-sections" in argv:
+        return download_section(filename, lines, interval, size, fails)
+    trace_dir = os.environ.get("FAKE_YTDLP_TRACE")
+    trace = open(os.path.join(trace_dir, f"{os.getpid()}.tsv"), "a", encoding="utf-8") if trace_dir else None
+    speed = size / (lines * interval) if interval else None
+
+    try:
+        for k in range(1, lines + 1):
+            if interval:
+                time.sleep(interval)
+            if fails and k > lines // 2:
+                sys.stderr.write("ERROR: [fake] simulated failure\n")
+                return 1
+            downloaded = size * k // lines
+            if trace:
+                # та же формула процента, что в VideoDownloader._progress_from_event
+                trace.write(f"{filename}\t{downloaded}\t{size}\t{time.time()!r}\n")
+            _print({
+                "status": "downloading",
+                "downloaded": downloaded,
+                "total": size,
+                "speed": speed,
+                "eta": (lines - k) * interval,
+                "fragments": None,
+                "filename": filename,
+                "format_id": "18",
+            })
+            for _ in range(noise):
+                sys.stderr.write(f"[download] {filename}: fake diagnostic line {'x' * 60}\n")
+        _print({
+            "status": "finished", "downloaded": size, "total": size, "speed": None, "eta": None,
+            "fragments": None, "filename": filename, "format_id": "18",
+        })
+        _print({"postprocessor": None, "status": "started"})
+        _print({"filepath": filename})
+        return 0
+    finally:
+        if trace:
+            trace.close()
+
+
+def download_section(filename: str, lines: int, interval: float, size: int, fails: bool) -> int:
+    """Как FFmpegFD: файл растёт без строк прогресса, одно событие в конце."""
+    silent = os.environ.get("FAKE_YTDLP_SILENT") == "1"
+    with open(filename, "wb") as f:
+        for _ in range(lines):
+            if interval:
+                time.sleep(interval)
+            if not silent:
+                f.write(b"\0" * (size // lines))
+                f.flush()
+    if fails:
+        sys.stderr.write("ERROR: [fake] simulated failure\n")
+        return 1
+    _print({
+        "status": "finished", "downloaded": size, "total": size, "speed": None, "eta": None,
+        "fragments": None, "filename": filename, "format_id": "18",
+    })
+    _print({"filepath": filename})
+    return 0
+
+
+def main(argv) -> int:
+    if "--dump-single-json" in argv:
+        return extract(argv)
+    if "--progress-template" in argv:
+        return download(argv)
+    sys.stderr.write(f"ERROR: [fake] unsupported command: {' '.join(argv)}\n")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,330 @@
+"""
+Бенчмарк пула загрузок на поддельном yt-dlp (benchmarks/fake_ytdlp.py).
+
+Сеть не нужна: cfg.yt_dlp_path указывает на заглушку, которая печатает строки
+прогресса с заданной частотой, объёмом stderr и долей ошибок. Каждый прогон —
+отдельный процесс со своей временной папкой (кэши, архив, журнал, настройки),
+так что пиковая память одного прогона не смешивается с другими.
+
+Для каждой комбинации UI × движок × размер пачки печатается JSON-строка:
+    tasks_per_sec     — задач в секунду от постановки до последнего итога
+    slot_utilization  — средняя доля занятых слотов загрузки
+    latency_ms        — задержка прогресса: от строки yt-dlp до обработчика UI
+                        (headless — обратный вызов, qt — сигнал task_progress)
+    peak_rss_mb       — пиковая память процесса приложения
+
+Примеры:
+    python benchmarks/pool_benchmark.py --tasks 10 100 1000
+    python benchmarks/pool_benchmark.py --ui qt --engine asyncio --tasks 10000 -j 32 --interval 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.config import cfg, VIDEO_QUALITIES  # noqa: E402 — до импорта services (см. configure)
+
+FAKE_YTDLP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ytdlp.py")
+SAMPLE_INTERVAL = 0.02
+Key = Tuple[str, float]  # (файл, процент) — строка прогресса
+
+
+# ---------- окружение прогона ----------
+def write_launcher(folder: str) -> str:
+    """Исполняемый файл для cfg.yt_dlp_path: запуск заглушки текущим интерпретатором."""
+    if os.name == "nt":
+        path = os.path.join(folder, "yt-dlp.cmd")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f'@"{sys.executable}" -S "{FAKE_YTDLP}" %*\n')
+        return path
+    path = os.path.join(folder, "yt-dlp")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" -S "{FAKE_YTDLP}" "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+def configure(base: str, args) -> None:
+    """
+    Направить приложение во временную папку. Вызывается до импорта services:
+    пути кэшей и баз берутся из cfg.base_dir при импорте модулей.
+    """
+    cfg.base_dir = base
+    cfg.config_file = os.path.join(base, "settings.json")
+    cfg.cookies_path = os.path.join(base, "cookies.txt")
+    cfg.yt_dlp_path = write_launcher(base)
+    open(cfg.cookies_path, "w").close()  # без поиска cookies в браузерах
+    settings = {
+        "ytdlp_engine": args.engine,
+        "async_max_downloads": args.jobs,
+        "skip_downloaded": False,
+        "stream_cache_mb": 0,
+        "bandwidth_limit_mbit": 0,
+    }
+    with open(cfg.config_file, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    os.environ.update({
+        "FAKE_YTDLP_LINES": str(args.lines),
+        "FAKE_YTDLP_INTERVAL": str(args.interval),
+        "FAKE_YTDLP_SIZE": str(args.size),
+        "FAKE_YTDLP_STDERR": str(args.stderr_lines),
+        "FAKE_YTDLP_FAIL": str(args.fail_ratio),
+        "FAKE_YTDLP_TRACE": os.path.join(base, "trace"),
+    })
+    os.makedirs(os.environ["FAKE_YTDLP_TRACE"])
+
+
+def build_tasks(n: int, path: str) -> list:
+    from core.models import DownloadTask
+
+    return [
+        DownloadTask(
+            url=f"https://bench.invalid/watch/{i}",
+            path=path,
+            mode="together",
+            quality_format=VIDEO_QUALITIES["Авто"],
+        )
+        for i in range(n)
+    ]
+
+
+# ---------- измерения ----------
+class Sampler:
+    """Фоновый замер занятости слотов и памяти процесса."""
+
+    def __init__(self, busy: Callable[[], int]):
+        import psutil
+
+        self.busy = busy
+        self.process = psutil.Process()
+        self.samples: List[int] = []
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.samples.append(self.busy())
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+
+def read_trace(folder: str) -> Dict[Key, float]:
+    """Метки времени строк прогресса, записанные заглушкой."""
+    sent: Dict[Key, float] = {}
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), "r", encoding="utf-8") as f:
+            for line in f:
+                filename, downloaded, total, at = line.rstrip("\n").split("\t")
+                sent[(filename, (int(downloaded) / int(total)) * 100)] = float(at)
+    return sent
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_stats(received: Dict[Key, float], sent: Dict[Key, float]) -> dict:
+    delays = [(at - sent[key]) * 1000 for key, at in received.items() if key in sent]
+    if not delays:
+        return {"samples": 0}
+    return {
+        "samples": len(delays),
+        "p50": round(percentile(delays, 0.5), 2),
+        "p95": round(percentile(delays, 0.95), 2),
+        "max": round(max(delays), 2),
+    }
+
+
+# ---------- прогоны ----------
+def run_headless(args, tasks: list, received: Dict[Key, float]) -> dict:
+    from services.headless_pool import HeadlessDownloadPool
+
+    statuses: Dict[str, int] = {}
+
+    def on_progress(index, progress):
+        if progress.status == "downloading" and progress.filename:
+            received[(progress.filename, progress.percent)] = time.time()
+
+    def on_finished(index, task, result):
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+
+    pool = HeadlessDownloadPool(
+        max_threads=args.jobs,
+        on_progress=on_progress,
+        on_finished=on_finished,
+        engine=args.engine,
+        bandwidth_limit_mbit=0,
+        skip_downloaded=False,
+    )
+    sampler = Sampler(lambda: len(pool.active_tasks))
+    sampler.start()
+    started = time.monotonic()
+    try:
+        pool.add_tasks(tasks)
+        completed = pool.wait(timeout=args.timeout)
+        elapsed = time.monotonic() - started
+        if not completed:
+            pool.cancel_all()
+            pool.wait()
+    finally:
+        sampler.stop()
+        pool.shutdown()
+    return {"elapsed": elapsed, "completed": completed, "statuses": statuses, "sampler": sampler}
+
+
+def run_qt(args, tasks: list, received: Dict[Key, float]) -> dict:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtCore import QTimer
+    from PySide6.QtWidgets import QApplication
+    from services.download_pool_manager import DownloadPoolManager
+
+    app = QApplication.instance() or QApplication([])
+    pool = DownloadPoolManager(max_threads=args.jobs)
+    statuses: Dict[str, int] = {}
+    done = {"at": None}
+
+    def on_progress(index, state):
+        if state.status == "downloading" and state.filename:
+            received[(state.filename, state.percent)] = time.time()
+
+    def on_finished(index, result):
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+        if sum(statuses.values()) == len(tasks):
+            done["at"] = time.monotonic()
+            app.quit()
+
+    pool.task_progress.connect(on_progress)
+    pool.task_finished.connect(on_finished)
+    sampler = Sampler(lambda: len(pool.active_tasks))
+    sampler.start()
+    started = time.monotonic()
+    QTimer.singleShot(0, lambda: pool.add_tasks(tasks))
+    QTimer.singleShot(int(args.timeout * 1000), app.quit)
+    try:
+        app.exec()
+        if done["at"] is None:
+            pool.cancel_all()
+    finally:
+        sampler.stop()
+        pool.shutdown()
+    elapsed = (done["at"] or time.monotonic()) - started
+    return {"elapsed": elapsed, "completed": done["at"] is not None, "statuses": statuses, "sampler": sampler}
+
+
+def run_batch(args) -> dict:
+    """Один прогон в текущем процессе."""
+    base = tempfile.mkdtemp(prefix="omnipresent_bench_")
+    try:
+        configure(base, args)
+        tasks = build_tasks(args.tasks[0], os.path.join(base, "downloads"))
+        received: Dict[Key, float] = {}
+        runner = run_qt if args.ui[0] == "qt" else run_headless
+        outcome = runner(args, tasks, received)
+        sampler: Sampler = outcome["sampler"]
+        statuses = outcome["statuses"]
+        return {
+            "event": "result",
+            "ui": args.ui[0],
+            "engine": args.engine,
+            "tasks": len(tasks),
+            "jobs": args.jobs,
+            "completed": outcome["completed"],
+            "elapsed": round(outcome["elapsed"], 3),
+            "tasks_per_sec": round(sum(statuses.values()) / outcome["elapsed"], 2),
+            "success": statuses.get("success", 0),
+            "failed": sum(statuses.values()) - statuses.get("success", 0),
+            "slot_utilization": round(
+                sum(sampler.samples) / (len(sampler.samples) * args.jobs), 3
+            ) if sampler.samples else None,
+            "latency_ms": latency_stats(received, read_trace(os.environ["FAKE_YTDLP_TRACE"])),
+            "peak_rss_mb": round(sampler.peak_rss / (1024 * 1024), 1),
+        }
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def child_command(args, ui: str, engine: str, n: int) -> List[str]:
+    return [
+        sys.executable, os.path.abspath(__file__), "--single",
+        "--ui", ui, "--engine", engine, "--tasks", str(n),
+        "-j", str(args.jobs),
+        "--lines", str(args.lines),
+        "--interval", str(args.interval),
+        "--size", str(args.size),
+        "--stderr-lines", str(args.stderr_lines),
+        "--fail-ratio", str(args.fail_ratio),
+        "--timeout", str(args.timeout),
+    ]
+
+
+# ---------- запуск ----------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк пула загрузок на поддельном yt-dlp. Итоги — JSON-строки в stdout.",
+    )
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 100, 1000],
+                        help="размеры пачек (10 100 1000)")
+    parser.add_argument("--ui", nargs="+", choices=("headless", "qt"), default=["headless", "qt"],
+                        help="headless — HeadlessDownloadPool, qt — DownloadPoolManager (offscreen)")
+    parser.add_argument("--engine", nargs="+", choices=("binary", "asyncio"), default=["binary"],
+                        help="движки (ферма library запускает настоящий yt_dlp и здесь не подходит)")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="слотов загрузки (8)")
+    parser.add_argument("--lines", type=int, default=50, help="строк прогресса на задачу (50)")
+    parser.add_argument("--interval", type=float, default=0.02,
+                        help="пауза между строками прогресса, сек (0.02)")
+    parser.add_argument("--size", type=int, default=10 * 1024 * 1024, help="размер «файла», байт")
+    parser.add_argument("--stderr-lines", type=int, default=0,
+                        help="строк stderr на строку прогресса (0)")
+    parser.add_argument("--fail-ratio", type=float, default=0.0, help="доля падающих задач (0)")
+    parser.add_argument("--timeout", type=float, default=1800, help="предел одного прогона, сек")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1 or args.lines < 1 or not 0 <= args.fail_ratio <= 1:
+        parser.error("нужно -j >= 1, --lines >= 1 и 0 <= --fail-ratio <= 1")
+
+    if args.single:
+        args.engine = args.engine[0]
+        print(json.dumps(run_batch(args), ensure_ascii=False), flush=True)
+        return 0
+
+    failed = False
+    for ui in args.ui:
+        for engine in args.engine:
+            for n in args.tasks:
+                proc = subprocess.run(child_command(args, ui, engine, n), capture_output=True, text=True)
+                lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+                if proc.returncode or not lines:
+                    failed = True
+                    error = proc.stderr.strip()[-300:]
+                    print(json.dumps({"event": "error", "ui": ui, "engine": engine, "tasks": n,
+                                      "error": error}, ensure_ascii=False), flush=True)
+                    continue
+                print(lines[-1], flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
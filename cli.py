@@ -0,0 +1,242 @@
+"""
+Консольный режим Omnipresent: пакетная загрузка без GUI (cron, серверы).
+
+Qt не импортируется. Прогресс и итоги печатаются в stdout по одному
+JSON-объекту на строку, код выхода:
+    0   — все задачи успешны (или уже скачаны)
+    1   — хотя бы одна задача завершилась ошибкой
+    2   — неверные аргументы / нет ссылок
+    130 — прервано (Ctrl+C, SIGTERM)
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+from core.config import cfg, VIDEO_QUALITIES
+from core.models import DownloadTask, DownloadTaskResult
+from core.utils import parse_urls, parse_time
+
+EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_INTERRUPTED = 0, 1, 2, 130
+MODES = ("together", "audio", "video", "none")
+
+
+# ---------- разбор аргументов ----------
+def _quality(value: str) -> str:
+    """'1080p', '2160p', 'auto' или ключ VIDEO_QUALITIES -> селектор формата."""
+    value = value.strip().lower()
+    if value == "auto":
+        return VIDEO_QUALITIES["Авто"]
+    for key, fmt in VIDEO_QUALITIES.items():
+        if value in (key.lower(), key.split()[0].lower()):
+            return fmt
+    raise argparse.ArgumentTypeError(
+        f"неизвестное качество: {value} (варианты: auto, {', '.join(VIDEO_QUALITIES)})"
+    )
+
+
+def _section(value: str) -> Tuple[int, int]:
+    """'НАЧАЛО-КОНЕЦ' (ЧЧ:ММ:СС, ММ:СС или секунды) -> (сек, сек)."""
+    start, _, end = value.partition("-")
+    start_sec, end_sec = parse_time(start), parse_time(end)
+    if start_sec is None or end_sec is None or end_sec <= start_sec:
+        raise argparse.ArgumentTypeError(f"неверный фрагмент: {value} (пример: 1:30-2:45)")
+    return start_sec, end_sec
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="omnipresent-cli",
+        description="Пакетная загрузка видео без GUI. Прогресс — JSON-строки в stdout.",
+    )
+    parser.add_argument("urls", nargs="*", help="ссылки на видео, плейлисты или каналы")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="FILE",
+                        help="файл со ссылками ('-' — stdin), можно несколько раз")
+    parser.add_argument("-o", "--output", default=None, metavar="DIR",
+                        help="папка загрузки (по умолчанию из настроек или текущая)")
+    parser.add_argument("-m", "--mode", action="append", choices=MODES, default=None,
+                        help="что скачать; можно несколько раз (по умолчанию together)")
+    parser.add_argument("-q", "--quality", type=_quality, default="auto",
+                        help="auto, 1080p, 720p, 2160p")
+    parser.add_argument("-s", "--section", type=_section, action="append", default=[],
+                        metavar="START-END",
+                        help="скачать только фрагмент, например 1:30-2:45; можно несколько раз "
+                             "(все фрагменты ссылки — за один проход)")
+    parser.add_argument("--precise-cuts", action="store_true",
+                        help="точные границы фрагментов с перекодированием "
+                             "(по умолчанию — копия потоков по ключевым кадрам)")
+    parser.add_argument("--split", type=int, default=0, metavar="N",
+                        help="качать каждое видео N частями параллельно (границы по ключевым "
+                             "кадрам) и склеить без перекодирования; части занимают слоты -j")
+    parser.add_argument("--cover", action="store_true", help="сохранить обложку")
+    parser.add_argument("-j", "--jobs", type=int, default=3, help="параллельных загрузок (3)")
+    parser.add_argument("--limit", type=int, default=None, metavar="MBIT",
+                        help="общий лимит скорости, Мбит/с (0 — без лимита)")
+    parser.add_argument("--engine", choices=("library", "binary", "asyncio"), default=None,
+                        help="library — прогретые процессы yt_dlp, binary — yt-dlp на задачу "
+                             "в потоке, asyncio — все процессы на одном цикле событий "
+                             "(подходит для сотен параллельных загрузок)")
+    parser.add_argument("--no-skip", action="store_true",
+                        help="не пропускать уже скачанное")
+    parser.add_argument("--quiet", action="store_true",
+                        help="печатать только итоги задач и сводку")
+    return parser
+
+
+def _read_urls(args) -> List[str]:
+    urls = parse_urls(" ".join(args.urls))
+    for source in args.input:
+        if source == "-":
+            urls.extend(parse_urls(sys.stdin.read()))
+            continue
+        with open(source, "r", encoding="utf-8") as f:
+            urls.extend(parse_urls(f.read()))
+    return list(dict.fromkeys(urls))  # без повторов, порядок сохраняется
+
+
+def build_tasks(args, urls: List[str]) -> List[DownloadTask]:
+    """Задачи как в GUI: по одной на ссылку и режим, обложка — с первой."""
+    path = args.output or cfg.load_setting("download_path") or os.getcwd()
+    modes = list(dict.fromkeys(args.mode or (["none"] if args.cover else ["together"])))
+    tasks = []
+    for url in urls:
+        for mode in modes:
+            tasks.append(DownloadTask(
+                url=url,
+                path=path,
+                mode=mode,
+                quality_format=args.quality,
+                time_sections=tuple(sorted(set(args.section))),
+                precise_cuts=args.precise_cuts,
+                split_parts=args.split,
+                download_cover=args.cover and mode == modes[0],
+            ))
+    return tasks
+
+
+# ---------- вывод ----------
+class JsonReporter:
+    """Печать событий в stdout: одна JSON-строка на событие, прогресс — не чаще PROGRESS_INTERVAL."""
+
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, quiet: bool = False, stream=None):
+        self.quiet = quiet
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self._last: Dict[int, Tuple[str, float]] = {}  # index -> (статус, время печати)
+        self.counts = {"success": 0, "failed": 0, "cancelled": 0}
+
+    def emit(self, event: str, **fields) -> None:
+        line = json.dumps({"event": event, **fields}, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def on_progress(self, index: int, progress) -> None:
+        if self.quiet:
+            return
+        now = time.monotonic()
+        status, printed = self._last.get(index, (None, 0.0))
+        # Смена статуса печатается всегда, проценты — с ограничением частоты
+        if progress.status == status and now - printed < self.PROGRESS_INTERVAL:
+            return
+        self._last[index] = (progress.status, now)
+        self.emit(
+            "progress",
+            index=index,
+            status=progress.status,
+            percent=round(progress.percent, 1),
+            speed=progress.speed,
+            eta=progress.eta,
+            file=progress.filename,
+            message=progress.message,
+        )
+
+    def on_finished(self, index: int, task: DownloadTask, result: DownloadTaskResult) -> None:
+        self._last.pop(index, None)
+        if result.status in ("success", "cancelled"):
+            self.counts[result.status] += 1
+        else:
+            self.counts["failed"] += 1
+        self.emit(
+            "finished",
+            index=index,
+            url=task.url,
+            mode=task.mode,
+            status=result.status,
+            message=result.message,
+        )
+
+
+# ---------- запуск ----------
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs должен быть не меньше 1")
+    if args.split < 0:
+        parser.error("--split не может быть отрицательным")
+    try:
+        urls = _read_urls(args)
+    except OSError as e:
+        parser.error(f"не удалось прочитать список ссылок: {e}")
+    if not urls:
+        parser.error("не указано ни одной ссылки")
+
+    # Импорт после разбора аргументов: --help не поднимает SQLite и воркеры
+    from services.download_planner import plan_tasks
+    from services.headless_pool import HeadlessDownloadPool
+
+    reporter = JsonReporter(quiet=args.quiet)
+    pool = HeadlessDownloadPool(
+        max_threads=args.jobs,
+        on_progress=reporter.on_progress,
+        on_finished=reporter.on_finished,
+        engine=args.engine,
+        bandwidth_limit_mbit=args.limit,
+        skip_downloaded=False if args.no_skip else None,
+    )
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    started = time.monotonic()
+    interrupted = False
+    try:
+        tasks = plan_tasks(build_tasks(args, urls))
+        reporter.emit("start", urls=len(urls), tasks=len(tasks), jobs=args.jobs)
+        pool.add_tasks(tasks)
+        # Ожидание с таймаутом, чтобы сигналы обрабатывались без задержки
+        while not pool.wait(timeout=0.5):
+            pass
+    except KeyboardInterrupt:
+        interrupted = True
+        pool.cancel_all()
+        pool.wait()
+    finally:
+        pool.shutdown()
+
+    reporter.emit(
+        "summary",
+        total=sum(reporter.counts.values()),
+        elapsed=round(time.monotonic() - started, 1),
+        interrupted=interrupted,
+        **reporter.counts,
+    )
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_FAILED if reporter.counts["failed"] else EXIT_OK
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
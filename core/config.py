@@ -1,8 +1,15 @@
 import os
 import sys
+import copy
 import json
+import time
+import atexit
+import threading
 
 class Config:
+    SAVE_DELAY = 1.0  # сек: серия save_setting — одна запись файла
+    CHECK_INTERVAL = 1.0  # сек: как часто сверять mtime файла (правки извне)
+
     def __init__(self):
         self.base_dir = self._get_base_dir()
         self.config_file = os.path.join(self.base_dir, "settings.json")
@@ -11,6 +18,16 @@ class Config:
         self.icon_path = os.path.join(self.base_dir, "ic.ico")
         self.cookies_path = os.path.join(self.base_dir, "cookies.txt")
 
+        # Настройки в памяти: файл читается один раз и заново — только если
+        # его изменили извне (mtime/размер) или сменился путь
+        self._lock = threading.RLock()
+        self._data: dict = {}
+        self._stamp = None  # (путь, mtime_ns, размер) прочитанного файла
+        self._checked = 0.0
+        self._pending: dict = {}  # сохранённое, но ещё не записанное
+        self._timer = None
+        atexit.register(self.flush)
+
     @staticmethod
     def _get_base_dir():
         if getattr(sys, 'frozen', False):
@@ -18,30 +35,85 @@ class Config:
         return os.path.dirname(os.path.abspath(__file__))
 
     def load_setting(self, key, default=None):
-        try:
-            if not os.path.exists(self.config_file):
-                return default
-            with open(self.config_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data.get(key, default)
-        except (json.JSONDecodeError, OSError):
-            return default
+        with self._lock:
+            value = self._settings().get(key, default)
+        # списки и словари — копией, чтобы правка не меняла кэш
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
 
     def save_setting(self, key, value):
-        data = {}
+        """Значение доступно сразу; в файл оно попадёт через SAVE_DELAY вместе с соседними."""
+        with self._lock:
+            self._settings()[key] = value
+            self._pending[key] = value
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.SAVE_DELAY, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> bool:
+        """
+        Записать несохранённые настройки сейчас (вызывается и при выходе).
+        Запись атомарная: временный файл + замена, прерванная запись не портит
+        settings.json. При ошибке изменения остаются в очереди до следующей попытки.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return True
+            # поверх текущего файла: его могли изменить извне после чтения
+            data = {**self._read(), **self._pending}
+            tmp = f"{self.config_file}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=4)
+                os.replace(tmp, self.config_file)
+            except OSError as e:
+                print(f"Ошибка сохранения конфига: {e}")
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return False
+            self._pending.clear()
+            self._data = data
+            self._stamp = self._file_stamp()
+            self._checked = time.monotonic()
+            return True
+
+    # ---------- кэш ----------
+    def _settings(self) -> dict:
+        """Актуальный словарь настроек (вызывается под self._lock)."""
+        now = time.monotonic()
+        path_changed = self._stamp is None or self._stamp[0] != self.config_file
+        if path_changed or now - self._checked >= self.CHECK_INTERVAL:
+            self._checked = now
+            stamp = self._file_stamp()
+            if stamp != self._stamp:
+                # несохранённые значения важнее прочитанных
+                self._data = {**self._read(), **self._pending}
+                self._stamp = stamp
+        return self._data
+
+    def _file_stamp(self):
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-        except Exception:
-            pass
+            st = os.stat(self.config_file)
+            return self.config_file, st.st_mtime_ns, st.st_size
+        except OSError:
+            return self.config_file, None, None
 
-        data[key] = value
+    def _read(self) -> dict:
         try:
-            with open(self.config_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4)
-        except OSError as e:
-            print(f"Ошибка сохранения конфига: {e}")
+            with open(self.config_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Ошибка чтения конфига: {e}")
+            return {}
 
 
 # Глобальный экземпляр конфига
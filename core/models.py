@@ -19,12 +19,17 @@ class DownloadTask:
     path: str
     mode: Literal["audio", "video", "together", "none"]
     quality_format: str
-    time_section: Optional[Tuple[int, int]] = None
+    time_sections: Tuple[Tuple[float, float], ...] = ()  # фрагменты (начало, конец), сек — одним проходом
+    precise_cuts: bool = False                 # перекодировать границы; иначе копия по ключевым кадрам
     download_cover: bool = False
+    split_parts: int = 0                       # качать N частями параллельно и склеить (0 — целиком)
+    outputs: Optional[Tuple[str, ...]] = None  # несколько режимов за одну загрузку (планировщик)
+    output_template: Optional[str] = None      # фиксируется при постановке в очередь (докачка)
+    resume: bool = False                       # задача восстановлена из журнала
 
 @dataclass
 class DownloadTaskResult:
     index: int
-    status: Literal["success", "auth_error", "network_error", "unknown"]
+    status: Literal["success", "auth_error", "network_error", "cancelled", "unknown"]
     message: str
     cookie_source: Optional[str] = None
\ No newline at end of file
@@ -1,6 +1,11 @@
 ﻿# utils.py
 import os
+import re
 import sys
+import copy
+import json
+import atexit
+import contextvars
 import subprocess
 import platform
 import urllib.request
@@ -9,8 +14,10 @@ import logging
 import threading
 import queue
 import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Iterator, Tuple
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, List, Optional, Tuple
 from .config import cfg
 
 # ---------- ссылки для скачивания ----------
@@ -23,30 +30,153 @@ YT_DLP_URL = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp.e
 
 
 # ---------- логгер ----------
+LOG_PROGRESS_INTERVAL = 2.0  # повторяющийся прогресс одной задачи — не чаще, сек
+
+# Поля записи из контекста выполнения: номер задачи, ссылка, фаза.
+# contextvars: у каждого потока и каждой корутины asyncio — свои
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Добавлять поля (task, url, phase...) ко всем записям внутри блока."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def set_log_phase(phase: str) -> None:
+    """Сменить фазу задачи внутри log_context (вне контекста ничего не делает)."""
+    context = _log_context.get()
+    if context:
+        _log_context.set({**context, "phase": phase})
+
+
+class _JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, модуль, текст и поля контекста."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """Кладёт запись в очередь без форматирования JSON: это делает фоновый поток."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # трассировку — здесь, пока объекты исключения живы
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Throttle:
+    """Сколько записей по ключу пропущено с последней выведенной."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last: Dict[tuple, list] = {}  # ключ -> [время вывода, пропущено]
+
+    def allow(self, key: tuple) -> Optional[int]:
+        """None — запись пропускается, иначе число пропущенных до неё."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._last.get(key)
+            if state is not None and now - state[0] < self.interval:
+                state[1] += 1
+                return None
+            suppressed = state[1] if state else 0
+            if len(self._last) > 1000:  # задачи давно завершились
+                self._last = {k: v for k, v in self._last.items() if now - v[0] < self.interval}
+            self._last[key] = [now, 0]
+            return suppressed
+
+
+_pipeline_lock = threading.Lock()
+_queue_handler: Optional[QueueHandler] = None
+_throttle = _Throttle(LOG_PROGRESS_INTERVAL)
+
+
+def _log_handler() -> QueueHandler:
+    """
+    Единственный на процесс вход в download.log: записи идут через очередь,
+    файл пишет и ротирует один фоновый поток (QueueListener).
+    """
+    global _queue_handler
+    with _pipeline_lock:
+        if _queue_handler is None:
+            from logging.handlers import RotatingFileHandler
+
+            records: queue.SimpleQueue = queue.SimpleQueue()
+            file_handler = RotatingFileHandler(
+                os.path.join(cfg.base_dir, "download.log"),
+                maxBytes=5 * 1024 * 1024,
+                backupCount=3,
+                encoding="utf-8",
+                delay=True,
+            )
+            file_handler.setFormatter(_JsonFormatter())
+            listener = QueueListener(records, file_handler)
+            listener.start()
+            atexit.register(listener.stop)  # дописать очередь при выходе
+            _queue_handler = _QueueHandler(records)
+        return _queue_handler
+
+
 class Logger:
     def __init__(self, name: str = "app"):
         self._log = logging.getLogger(name)
-        self._log.setLevel(logging.DEBUG)
-
-        from logging.handlers import RotatingFileHandler
-        handler = RotatingFileHandler(
-            os.path.join(cfg.base_dir, "download.log"),
-            maxBytes=5 * 1024 * 1024,
-            backupCount=3,
-            encoding="utf-8"
-        )
-        fmt = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-        handler.setFormatter(fmt)
-        self._log.addHandler(handler)
+        self._log.setLevel(str(cfg.load_setting("log_level", "INFO")).upper())
+        handler = _log_handler()
+        if handler not in self._log.handlers:  # одно имя в нескольких модулях
+            self._log.addHandler(handler)
 
-    def info(self, msg: str) -> None:
-        self._log.info(msg)
+    def debug(self, msg: str, **fields) -> None:
+        self._emit(logging.DEBUG, msg, fields)
 
-    def warning(self, msg: str) -> None:
-        self._log.warning(msg)
+    def info(self, msg: str, **fields) -> None:
+        self._emit(logging.INFO, msg, fields)
 
-    def error(self, msg: str, *, exc: bool = False) -> None:
-        self._log.error(msg, exc_info=exc)
+    def warning(self, msg: str, **fields) -> None:
+        self._emit(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, *, exc: bool = False, **fields) -> None:
+        self._emit(logging.ERROR, msg, fields, exc)
+
+    def progress(self, msg: str, **fields) -> None:
+        """Повторяющийся прогресс: по задаче не чаще LOG_PROGRESS_INTERVAL, с числом пропущенных."""
+        if not self._log.isEnabledFor(logging.INFO):
+            return
+        task = fields.get("task", _log_context.get().get("task"))
+        suppressed = _throttle.allow((self._log.name, task))
+        if suppressed is None:
+            return
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self._emit(logging.INFO, msg, fields)
+
+    def _emit(self, level: int, msg: str, fields: dict, exc: bool = False) -> None:
+        if not self._log.isEnabledFor(level):
+            return
+        context = _log_context.get()
+        if context:
+            fields = {**context, **fields}
+        self._log.log(level, msg, exc_info=exc, extra={"fields": fields})
 
 
 # ---------- прогресс-загрузка ----------
@@ -319,4 +449,32 @@ def play_sound(success: bool = True) -> None:
         import winsound
         winsound.MessageBeep(winsound.MB_OK if success else winsound.MB_ICONHAND)
     except Exception:
-        pass
\ No newline at end of file
+        pass
+
+
+# ---------- разбор ввода ----------
+_URL_RE = re.compile(r"https?://\S+", re.IGNORECASE)
+
+
+def parse_urls(text: str) -> List[str]:
+    """Ссылки из произвольного текста (буфер обмена, .txt): по одной на слово."""
+    return [m.group(0).rstrip(",;\"')]>") for m in _URL_RE.finditer(text)]
+
+
+def format_time(seconds: Optional[int]) -> str:
+    if seconds is None:
+        return ""
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{sec:02d}"
+
+
+def parse_time(text: str) -> Optional[int]:
+    """'ЧЧ:ММ:СС', 'ММ:СС' или секунды -> секунды; None, если не разобрать."""
+    parts = text.strip().split(":")
+    if not parts or len(parts) > 3 or not all(p.strip().isdigit() for p in parts):
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds
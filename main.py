@@ -3,6 +3,7 @@ Entry-point для YouTube-Downloader.
 """
 
 import sys
+import multiprocessing
 from PySide6.QtWidgets import QApplication, QMessageBox
 
 # Импорт в порядке слоёв
@@ -68,6 +69,13 @@ QPushButton#DownloadBtn {
     background: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #00d4ff, stop:1 #0099cc);
 }
 QScrollArea { border: none; background-color: transparent; }
+QTableView {
+    background-color: #252d42; border: 2px solid #3a4a6b; border-radius: 6px;
+    selection-background-color: rgba(0, 212, 255, 0.3); color: #eaeaea;
+}
+QHeaderView::section {
+    background-color: #1a1a2e; color: #00d4ff; border: none; padding: 4px 8px;
+}
 QScrollBar:vertical {
     background-color: #1a1a2e; width: 12px; border-radius: 6px;
 }
@@ -116,6 +124,9 @@ def show_splash_and_download(app: QApplication) -> bool:
 
 
 def main() -> None:
+    # Воркеры yt-dlp запускаются через spawn — нужно для сборки PyInstaller
+    multiprocessing.freeze_support()
+
     app = QApplication(sys.argv)
     app.setStyleSheet(STYLESHEET)
 
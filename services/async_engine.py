@@ -0,0 +1,354 @@
+# services/async_engine.py
+import os
+import json
+import time
+import asyncio
+import contextvars
+import threading
+import subprocess
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from core.config import cfg
+from core.models import DownloadTask, DownloadTaskResult
+from services.metadata_cache import canonical_key
+from services.metrics import PHASE_SECONDS
+from services.download_planner import is_single_pass
+from services.process_output import RingBuffer, kill_process_tree
+from services.video_downloader import (
+    VideoDownloader,
+    DownloadProgress,
+    DownloadRun,
+    SUBPROCESS_OUTPUT_ARGS,
+    output_logger,
+)
+from core.utils import Logger, log_context, set_log_phase
+
+logger = Logger("AsyncEngine")
+
+_CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+STREAM_LIMIT = 1024 * 1024  # строка stdout (JSON метаданных) может быть длинной
+
+
+class AsyncDownloadEngine:
+    """
+    Движок загрузок на asyncio.
+
+    Задачи — корутины одного цикла событий в отдельном потоке, yt-dlp запускается
+    через asyncio.create_subprocess_exec: пока процесс качает, поток не занят,
+    поэтому сотни загрузок и экстракций не требуют сотен потоков.
+    Одновременно не больше max_concurrency загрузок и max_probes экстракций;
+    задача, перешедшая на стадию постобработки, свой слот загрузки отдаёт.
+
+    Команды, кэш метаданных, архив, наблюдатель и отмена — общие с VideoDownloader,
+    события те же: DownloadProgress по ходу и DownloadTaskResult в конце.
+    Ферма yt_dlp не используется: каждая загрузка — отдельный процесс.
+    """
+
+    PROBE_TIMEOUT = 120
+
+    def __init__(
+        self,
+        downloader: Optional[VideoDownloader] = None,
+        max_concurrency: int = 64,
+        max_probes: int = 8,
+    ):
+        self.downloader = downloader or VideoDownloader()
+        if self.downloader.farm:
+            raise ValueError("Движку asyncio нужен VideoDownloader без фермы yt_dlp")
+        self.max_concurrency = max_concurrency
+        self.max_probes = max_probes
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._download_slots: Optional[asyncio.Semaphore] = None
+        self._probe_slots: Optional[asyncio.Semaphore] = None
+        self._probes: Dict[str, asyncio.Future] = {}  # ключ видео -> общая экстракция
+
+    # ---------- цикл событий ----------
+    def start(self) -> None:
+        """Запустить поток с циклом событий (повторный вызов ничего не делает)."""
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run_loop, name="async-engine", daemon=True)
+            self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._download_slots = asyncio.Semaphore(self.max_concurrency)
+        self._probe_slots = asyncio.Semaphore(self.max_probes)
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def shutdown(self) -> None:
+        """
+        Прервать корутины (их процессы убиваются) и остановить цикл.
+        Задачи не помечаются отменёнными: .part остаются для докачки.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_pending(), self._loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Задачи движка asyncio не остановились: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        thread.join(timeout=5)
+        logger.info("Движок asyncio остановлен")
+
+    @staticmethod
+    async def _cancel_pending() -> None:
+        current = asyncio.current_task()
+        pending = [t for t in asyncio.all_tasks() if t is not current]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # ---------- публичные методы ----------
+    def submit(
+        self,
+        task: DownloadTask,
+        idx: int,
+        on_progress: Optional[Callable[[DownloadProgress], None]] = None,
+    ) -> "Future[DownloadTaskResult]":
+        """
+        Поставить задачу из любого потока. on_progress вызывается в потоке цикла
+        событий и не должен блокироваться.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.run_task(task, idx, on_progress), self._loop)
+
+    def cancel(self, idx: Optional[int] = None) -> None:
+        """Отменить задачу idx (или все): процессы убиваются, задача завершается "cancelled"."""
+        self.downloader.cancel(idx)
+
+    async def run_task(
+        self,
+        task: DownloadTask,
+        idx: int,
+        on_progress: Optional[Callable[[DownloadProgress], None]] = None,
+    ) -> DownloadTaskResult:
+        """Выполнить задачу на текущем цикле событий и вернуть итог."""
+        self.downloader._begin_job(idx)
+        # контекст журнала — свой у каждой задачи asyncio
+        with log_context(task=idx, url=task.url):
+            try:
+                last: Optional[DownloadProgress] = None
+                async for progress in self._download(task, idx):
+                    last = progress
+                    if on_progress:
+                        on_progress(progress)
+                return self.downloader._task_result(idx, last)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Критическая ошибка в задаче #{idx}: {e}", exc=True)
+                return DownloadTaskResult(index=idx, status="unknown", message=f"Сбой: {e}")
+            finally:
+                self.downloader._end_job(idx)
+
+    async def probe(self, url: str) -> Optional[str]:
+        """
+        Путь к info.json ссылки (из кэша или новой экстракцией).
+        Параллельные задачи по одному видео ждут единственную экстракцию.
+        """
+        cache = self.downloader.metadata_cache
+        path = cache.get(url)
+        if path:
+            return path
+        key = canonical_key(url)
+        future = self._probes.get(key)
+        if future is None:
+            future = self._probes[key] = asyncio.ensure_future(self._extract(url))
+            future.add_done_callback(lambda _: self._probes.pop(key, None))
+        try:
+            # shield: отмена одной задачи не прерывает экстракцию для остальных
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось получить метаданные {url}: {e}")
+            return None
+
+    # ---------- загрузка ----------
+    async def _download(self, task: DownloadTask, idx: int) -> AsyncIterator[DownloadProgress]:
+        d = self.downloader
+        if d._is_cancelled(idx):  # отменена, пока ждала старта
+            yield d._cancelled_progress(idx)
+            return
+        if task.mode == "none":  # только обложка: без экстракции и yt-dlp
+            set_log_phase("cover")
+            if task.download_cover and not d._is_cancelled(idx):
+                yield await self._cover_progress(idx, d.cover_fetcher.submit(task.url, task.path))
+            if d._is_cancelled(idx):
+                yield d._cancelled_progress(idx)
+            return
+
+        set_log_phase("extract")
+        info_json = await self.probe(task.url)
+        set_log_phase("download")
+        # Обложка качается в фоне; её событие — перед итогом основной загрузки
+        cover = None
+        if task.download_cover and not d._is_cancelled(idx):
+            cover = d.cover_fetcher.submit(task.url, task.path, info_json)
+        media = self._download_media(task, idx, info_json)
+        try:
+            async for progress in media:
+                if progress.status in ("finished", "error", "cancelled") and cover is not None:
+                    if not d._is_cancelled(idx):
+                        yield await self._cover_progress(idx, cover)
+                    cover = None
+                yield progress
+        finally:
+            await media.aclose()  # слот загрузки — сразу, даже при отмене посреди ожидания обложки
+
+    @staticmethod
+    async def _cover_progress(idx: int, cover: "Future[str]") -> DownloadProgress:
+        """Дождаться обложки, не занимая поток цикла событий."""
+        try:
+            await asyncio.wrap_future(cover)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        return VideoDownloader._cover_progress(idx, cover)
+
+    async def _download_media(
+        self, task: DownloadTask, idx: int, info_json: Optional[str]
+    ) -> AsyncIterator[DownloadProgress]:
+        d = self.downloader
+        if d._is_cancelled(idx):
+            yield d._cancelled_progress(idx)
+            return
+
+        if self._download_slots.locked():
+            yield DownloadProgress(index=idx, status="pending", message="В очереди...")
+        await self._download_slots.acquire()
+        holds_slot = True  # слот отдаётся раньше, если задача ушла на стадию постобработки
+        run = DownloadRun(is_single_pass(task))
+        try:
+            # cookies могут извлекаться из браузера, итог попытки пишется в архив и кэш —
+            # это не для цикла событий; в потоке исполнителя — контекст журнала задачи
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            cmd = await loop.run_in_executor(
+                None, context.run, d.prepare_command, task, idx, None, info_json, run
+            )
+            yield DownloadProgress(index=idx, status="downloading", message="Старт...")
+
+            for progress in d.attempts(task, idx, run):
+                if progress is not None:
+                    yield progress
+                    continue
+                async for event in self._run_process(cmd, idx, run.output):
+                    if event.get("event") == "done":
+                        await loop.run_in_executor(
+                            None, context.run, d.finish_attempt, task, idx, run, event, info_json
+                        )
+                        continue
+                    progress = d.apply_event(idx, run, event)
+                    if run.postprocessing and holds_slot:
+                        holds_slot = False
+                        self._download_slots.release()
+                    if progress:
+                        yield progress
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Критическая ошибка #{idx}: {e}")
+            yield DownloadProgress(index=idx, status="error", message=f"Сбой: {e}")
+        finally:
+            d._release_resources(idx, run)
+            if holds_slot:
+                self._download_slots.release()
+
+    async def _run_process(self, cmd: List[str], idx: int, output: RingBuffer) -> AsyncIterator[dict]:
+        """События процесса yt-dlp; последним всегда идёт {"event": "done"}."""
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, *SUBPROCESS_OUTPUT_ARGS,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            creationflags=_CREATION_FLAGS,
+        )
+        on_line = None
+        if cfg.load_setting("log_ytdlp_output", False):
+            on_line = output_logger(idx)
+        # stderr читается параллельно, иначе заполненный канал остановит yt-dlp
+        stderr_task = asyncio.ensure_future(self._drain(proc.stderr, output, on_line))
+        self.downloader._processes[idx] = proc
+        try:
+            async for raw in proc.stdout:
+                event = VideoDownloader._parse_output_line(
+                    raw.decode("utf-8", errors="replace"), output, on_line
+                )
+                if event:
+                    yield event
+            await proc.wait()
+        finally:
+            self.downloader._processes.pop(idx, None)
+            if proc.returncode is None:
+                kill_process_tree(proc.pid)  # задача отменена посреди чтения
+                await proc.wait()
+            await stderr_task
+
+        err = output.summary() if proc.returncode else ""
+        yield {"event": "done", "returncode": proc.returncode, "error": err}
+
+    @staticmethod
+    async def _drain(stream: asyncio.StreamReader, output: RingBuffer, on_line=None) -> None:
+        async for raw in stream:
+            line = raw.decode("utf-8", errors="replace").rstrip()
+            if line:
+                output.append(line)
+                if on_line:
+                    on_line(line)
+
+    # ---------- метаданные ----------
+    async def _extract(self, url: str) -> Optional[str]:
+        """Экстракция в отдельном процессе; результат кладётся в кэш метаданных."""
+        loop = asyncio.get_running_loop()
+        cmd = await loop.run_in_executor(None, self.downloader._extract_command, url)
+        async with self._probe_slots:
+            started = time.monotonic()
+            stdout, stderr, returncode = await self._communicate(
+                cmd + ["--dump-single-json", "--no-warnings"], self.PROBE_TIMEOUT
+            )
+        if returncode:
+            raise RuntimeError(stderr.strip()[-150:])
+        PHASE_SECONDS.observe(time.monotonic() - started, phase="extract")
+        info = self.downloader._single_video(json.loads(stdout))
+        if info is None:
+            return None
+        return self.downloader.metadata_cache.put(url, info)
+
+    @staticmethod
+    async def _communicate(cmd: List[str], timeout: float):
+        """(stdout, stderr, код возврата) короткого процесса; по таймауту процесс убивается."""
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            creationflags=_CREATION_FLAGS,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            kill_process_tree(proc.pid)
+            await proc.wait()
+            raise
+        return (
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"),
+            proc.returncode,
+        )
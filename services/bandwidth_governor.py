@@ -0,0 +1,134 @@
+# services/bandwidth_governor.py
+import time
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from core.utils import Logger
+
+logger = Logger("BandwidthGovernor")
+
+RateCallback = Callable[[int], None]
+
+
+class BandwidthGovernor:
+    """
+    Общий лимит скорости для всех загрузок пула.
+
+    Бюджет делится между активными задачами по принципу max-min:
+    задача, которая стабильно качает медленнее своей доли (упирается в сервер),
+    получает чуть больше своей фактической скорости, остаток делится между
+    остальными. Перераспределение идёт при старте/завершении задач и не чаще
+    раза в REBALANCE_INTERVAL по замерам скорости.
+    """
+
+    REBALANCE_INTERVAL = 2.0
+    HEADROOM = 1.25       # запас над фактической скоростью «медленной» задачи
+    UNDERUSE = 0.8        # доля выделенного, ниже которой задача считается медленной
+    MIN_CHANGE = 0.1      # изменения меньше 10% не рассылаются
+
+    def __init__(self, total_rate: int = 0):
+        self.total_rate = total_rate  # байт/с, 0 — без ограничения
+        self._lock = threading.Lock()
+        self._alloc: Dict[int, float] = {}
+        self._speed: Dict[int, float] = {}
+        self._callbacks: Dict[int, RateCallback] = {}
+        self._last_rebalance = 0.0
+
+    # ---------- публичные методы ----------
+    @property
+    def enabled(self) -> bool:
+        return self.total_rate > 0
+
+    def set_total(self, total_rate: int) -> None:
+        """Изменить общий лимит на лету."""
+        with self._lock:
+            self.total_rate = max(0, int(total_rate))
+            changes = self._rebalance()
+        logger.info(f"Общий лимит скорости: {self.total_rate // 1024} KiB/s")
+        self._notify(changes)
+
+    def acquire(self, idx: int, on_change: Optional[RateCallback] = None) -> Optional[int]:
+        """Зарегистрировать задачу. Returns: стартовый лимит задачи (байт/с) или None."""
+        with self._lock:
+            self._alloc[idx] = 0.0
+            if on_change:
+                self._callbacks[idx] = on_change
+            changes = self._rebalance()
+            rate = self._alloc.get(idx)
+        changes.pop(idx, None)
+        self._notify(changes)
+        return int(rate) if self.enabled and rate else None
+
+    def release(self, idx: int) -> None:
+        with self._lock:
+            self._alloc.pop(idx, None)
+            self._speed.pop(idx, None)
+            self._callbacks.pop(idx, None)
+            changes = self._rebalance()
+        self._notify(changes)
+
+    def report(self, idx: int, speed: Optional[float]) -> None:
+        """Замер текущей скорости задачи (из событий прогресса)."""
+        if not speed or idx not in self._alloc:
+            return
+        with self._lock:
+            self._speed[idx] = speed
+            now = time.monotonic()
+            if not self.enabled or now - self._last_rebalance < self.REBALANCE_INTERVAL:
+                return
+            changes = self._rebalance()
+        self._notify(changes)
+
+    def usage(self) -> Tuple[int, int]:
+        """Returns: (фактическая суммарная скорость, общий лимит) в байт/с."""
+        with self._lock:
+            return int(sum(self._speed.values())), self.total_rate
+
+    # ---------- вспомогательные методы ----------
+    def _demand(self, idx: int) -> float:
+        speed = self._speed.get(idx)
+        alloc = self._alloc.get(idx) or 0.0
+        if speed and alloc and speed < alloc * self.UNDERUSE:
+            return speed * self.HEADROOM
+        return float("inf")
+
+    def _rebalance(self) -> Dict[int, int]:
+        """Пересчитать доли (под блокировкой). Returns: заметно изменившиеся лимиты."""
+        self._last_rebalance = time.monotonic()
+        if not self.enabled:
+            # Лимит снят — снимаем его и с запущенных задач
+            changes = {idx: 0 for idx, rate in self._alloc.items() if rate}
+            self._alloc = dict.fromkeys(self._alloc, 0.0)
+            return changes
+
+        demands = {idx: self._demand(idx) for idx in self._alloc}
+        pending = sorted(self._alloc, key=lambda i: demands[i])
+        remaining = float(self.total_rate)
+        new_alloc: Dict[int, float] = {}
+        while pending:
+            fair = remaining / len(pending)
+            head = pending[0]
+            if demands[head] >= fair:
+                for idx in pending:
+                    new_alloc[idx] = fair
+                break
+            new_alloc[head] = demands[head]
+            remaining -= demands[head]
+            pending.pop(0)
+
+        changes = {}
+        for idx, rate in new_alloc.items():
+            old = self._alloc.get(idx) or 0.0
+            if not old or abs(rate - old) > old * self.MIN_CHANGE:
+                changes[idx] = int(rate)
+            self._alloc[idx] = rate
+        return changes
+
+    def _notify(self, changes: Dict[int, int]) -> None:
+        for idx, rate in changes.items():
+            callback = self._callbacks.get(idx)
+            if callback:
+                try:
+                    callback(rate)
+                except Exception as e:
+                    logger.warning(f"Не удалось применить лимит для #{idx}: {e}")
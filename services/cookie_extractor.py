@@ -9,6 +9,7 @@ from dataclasses import dataclass
 from enum import Enum
 
 from core.config import cfg
+from services.metrics import COOKIE_STRATEGY
 from core.utils import Logger
 
 logger = Logger("CookieExtractor")
@@ -24,7 +25,7 @@ class CookieSource(Enum):
 class CookieResult:
     success: bool
     cookies: List[dict]
-    source: Optional[CookieSource]
+    source: Optional[CookieSource] = None
     error: Optional[str] = None
     age_hours: Optional[float] = None
 
@@ -222,7 +223,13 @@ class CookieExtractorService:
                 return cached
 
         for strategy in self.strategies:
+            started = time.monotonic()
             result = strategy.extract()
+            COOKIE_STRATEGY.observe(
+                time.monotonic() - started,
+                strategy=type(strategy).__name__,
+                result="success" if result.success else "failed",
+            )
             if result.success:
                 result.age_hours = 0
                 CookieCache.set(result)
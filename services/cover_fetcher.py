@@ -0,0 +1,246 @@
+# services/cover_fetcher.py
+import io
+import os
+import json
+import time
+import shutil
+import subprocess
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from core.config import cfg
+from services.metadata_cache import MetadataCache, canonical_key, extract_video_id
+from services.metrics import PHASE_SECONDS
+from core.utils import Logger, set_log_phase
+
+logger = Logger("CoverFetcher")
+
+InfoResolver = Callable[[str], Optional[str]]  # ссылка -> путь к info.json
+
+_JPEG_MAGIC = b"\xff\xd8\xff"
+# Замены символов, недопустимых в имени файла, — как у yt-dlp, чтобы обложка
+# называлась так же, как раньше при --write-thumbnail
+_FILENAME_CHARS = str.maketrans({
+    '"': "＂", "*": "＊", ":": "：", "<": "＜", ">": "＞",
+    "?": "？", "|": "｜", "/": "⧸", "\\": "⧹",
+})
+_YOUTUBE_THUMBS = ("maxresdefault", "sddefault", "hqdefault")
+
+
+def cover_filename(title: str) -> str:
+    name = "".join(ch for ch in title.translate(_FILENAME_CHARS) if ord(ch) >= 32).strip()
+    return f"{name or 'cover'}.jpg"
+
+
+def to_jpeg(data: bytes) -> bytes:
+    """
+    Картинка любого формата -> JPEG в памяти: Pillow, если установлен,
+    иначе один вызов ffmpeg через каналы. JPEG возвращается как есть.
+    """
+    if data.startswith(_JPEG_MAGIC):
+        return data
+    try:
+        from PIL import Image
+    except ImportError:
+        return _ffmpeg_to_jpeg(data)
+    with Image.open(io.BytesIO(data)) as image:
+        out = io.BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=95)
+        return out.getvalue()
+
+
+def _ffmpeg_to_jpeg(data: bytes) -> bytes:
+    proc = subprocess.run(
+        [
+            cfg.ffmpeg_path, "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-frames:v", "1", "-q:v", "2", "-f", "image2pipe", "-c:v", "mjpeg",
+            "pipe:1",
+        ],
+        input=data,
+        capture_output=True,
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+        timeout=30,
+    )
+    if proc.returncode or not proc.stdout.startswith(_JPEG_MAGIC):
+        raise RuntimeError(proc.stderr.decode("utf-8", errors="replace").strip()[-150:] or "ffmpeg")
+    return proc.stdout
+
+
+class CoverFetcher:
+    """
+    Обложки без yt-dlp: параллельно с загрузкой видео, через общую
+    keep-alive сессию HTTP.
+
+    Ссылка на картинку и название берутся из уже известных метаданных
+    (info.json задачи или кэш), для YouTube без метаданных — из oEmbed и
+    i.ytimg.com. Экстракция yt-dlp (resolve_info) — только если иначе никак.
+    Готовые JPEG хранятся в кэше по ID видео: повторная обложка — копия файла.
+    """
+
+    CACHE_DIR = os.path.join(cfg.base_dir, ".cover_cache")
+    MAX_ENTRIES = 500
+    WORKERS = 4
+    TIMEOUT = 15
+
+    def __init__(
+        self,
+        metadata_cache: Optional[MetadataCache] = None,
+        resolve_info: Optional[InfoResolver] = None,
+        cache_dir: Optional[str] = None,
+    ):
+        self.metadata_cache = metadata_cache or MetadataCache()
+        self.resolve_info = resolve_info
+        self.cache_dir = cache_dir or self.CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="cover")
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    # ---------- публичные методы ----------
+    def submit(self, url: str, path: str, info_json: Optional[str] = None) -> "Future[str]":
+        """Сохранить обложку в фоне. Future — путь к файлу или исключение."""
+        # записи журнала из потока обложек — с номером и ссылкой задачи
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self.fetch, url, path, info_json)
+
+    def fetch(self, url: str, path: str, info_json: Optional[str] = None) -> str:
+        """Сохранить обложку видео в папку path. Returns: путь к .jpg."""
+        started = time.monotonic()
+        set_log_phase("cover")
+        info = self._load_info(url, info_json)
+        title, candidates = self._describe(url, info)
+        target = os.path.join(path, cover_filename(title))
+        if os.path.exists(target):
+            return target  # как --no-overwrites у yt-dlp
+
+        cached = os.path.join(self.cache_dir, f"{canonical_key(url)}.jpg")
+        if self._touch(cached):
+            shutil.copyfile(cached, target)
+            PHASE_SECONDS.observe(time.monotonic() - started, phase="cover")
+            logger.info(f"Обложка {os.path.basename(target)} взята из кэша")
+            return target
+
+        data = self._download_first(candidates)
+        jpeg = to_jpeg(data)
+        self._write(cached, jpeg)
+        self._write(target, jpeg)
+        self._evict()
+        PHASE_SECONDS.observe(time.monotonic() - started, phase="cover")
+        logger.info(f"Обложка {os.path.basename(target)} сохранена")
+        return target
+
+    # ---------- метаданные ----------
+    def _load_info(self, url: str, info_json: Optional[str]) -> Optional[dict]:
+        """Метаданные без сети: info.json задачи или кэш; экстракция — если нет ID YouTube."""
+        if not info_json:
+            info = self.metadata_cache.load(url)
+            if info or extract_video_id(url) or not self.resolve_info:
+                return info
+            info_json = self.resolve_info(url)
+        if not info_json:
+            return None
+        try:
+            with open(info_json, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _describe(self, url: str, info: Optional[dict]) -> Tuple[str, List[str]]:
+        """(название, ссылки на картинки от лучшей к худшей)."""
+        video_id = extract_video_id(url)
+        candidates: List[str] = []
+        if video_id:
+            candidates += [f"https://i.ytimg.com/vi/{video_id}/{name}.jpg" for name in _YOUTUBE_THUMBS]
+        if info:
+            thumbnails = sorted(
+                info.get("thumbnails") or [],
+                key=lambda t: (t.get("preference") or 0, t.get("width") or 0),
+                reverse=True,
+            )
+            candidates += [t["url"] for t in thumbnails if t.get("url")]
+            if info.get("thumbnail"):
+                candidates.append(info["thumbnail"])
+            return info.get("title") or video_id or "cover", list(dict.fromkeys(candidates))
+        if video_id:
+            return self._oembed_title(url) or video_id, candidates
+        raise RuntimeError("нет метаданных для обложки")
+
+    def _oembed_title(self, url: str) -> Optional[str]:
+        try:
+            response = self._get("https://www.youtube.com/oembed", params={"url": url, "format": "json"})
+            return response.json().get("title")
+        except Exception as e:
+            logger.warning(f"oEmbed {url}: {e}")
+            return None
+
+    # ---------- сеть ----------
+    def _get(self, url: str, **kwargs):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.WORKERS, pool_maxsize=self.WORKERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+        response = self._session.get(url, timeout=self.TIMEOUT, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _download_first(self, candidates: List[str]) -> bytes:
+        """Первая доступная картинка (maxres есть не у всех видео)."""
+        error: Optional[Exception] = None
+        for link in candidates:
+            try:
+                data = self._get(link).content
+            except Exception as e:
+                error = e
+                continue
+            if data:
+                return data
+        raise RuntimeError(f"обложка недоступна: {error}" if error else "у видео нет обложки")
+
+    # ---------- кэш ----------
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Есть ли файл в кэше; отметить обращение (atime — для LRU)."""
+        try:
+            st = os.stat(path)
+            os.utime(path, (time.time(), st.st_mtime))
+            return True
+        except OSError:
+            return False
+
+    def _evict(self) -> None:
+        """Удалить самые давно использованные обложки сверх лимита."""
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".jpg")]
+        except OSError:
+            return
+        if len(names) <= self.MAX_ENTRIES:
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.stat(path).st_atime, path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, path in entries[:len(entries) - self.MAX_ENTRIES]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,119 @@
+# services/download_archive.py
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from core.config import cfg
+from core.models import DownloadTask
+from services.metadata_cache import canonical_key
+from core.utils import Logger
+
+logger = Logger("DownloadArchive")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive (
+    video_key TEXT NOT NULL,
+    mode      TEXT NOT NULL,
+    quality   TEXT NOT NULL,
+    section   TEXT NOT NULL,
+    folder    TEXT NOT NULL,
+    precise   INTEGER NOT NULL,
+    path      TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    PRIMARY KEY (video_key, mode, quality, section, folder, precise)
+) WITHOUT ROWID;
+"""
+
+_KEY_WHERE = (
+    "video_key = ? AND mode = ? AND quality = ? AND section = ? AND folder = ? AND precise = ?"
+)
+
+
+def _key(task: DownloadTask, mode: str) -> tuple:
+    # Аудио скачивается одним и тем же селектором при любом качестве видео
+    quality = "" if mode == "audio" else task.quality_format
+    section = ",".join(f"{start}-{end}" for start, end in task.time_sections)
+    # Тот же фрагмент в другой папке или с точными границами — другой файл
+    folder = os.path.normcase(os.path.abspath(task.path))
+    precise = int(bool(task.time_sections) and task.precise_cuts)
+    return canonical_key(task.url), mode, quality, section, folder, precise
+
+
+class DownloadArchive:
+    """
+    Архив скачанного: (видео, режим, качество, фрагмент, папка, точная нарезка) -> файл.
+    Задача, все выходы которой уже есть на диске, пропускается до запуска
+    yt-dlp и экстракции. Запись проверяется одним stat: файл удалён
+    или изменился размер — запись устарела и удаляется.
+    """
+
+    DB_FILE = os.path.join(cfg.base_dir, "download_archive.sqlite3")
+
+    def __init__(self, db_file: Optional[str] = None):
+        self.db_file = db_file or self.DB_FILE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(archive)")}
+        if columns and "folder" not in columns:
+            # архив старого формата: ключ без папки и точной нарезки
+            self._conn.execute("DROP TABLE archive")
+        self._conn.executescript(_SCHEMA)
+
+    # ---------- публичные методы ----------
+    def find(self, task: DownloadTask) -> Optional[str]:
+        """Файл задачи, если все её выходы уже скачаны, иначе None."""
+        modes = [m for m in (task.outputs or (task.mode,)) if m != "none"]
+        if not modes:
+            return None
+        found = None
+        for mode in modes:
+            found = self._lookup(_key(task, mode))
+            if found is None:
+                return None
+        return found
+
+    def record(self, task: DownloadTask, paths: Dict[str, str]) -> None:
+        """Запомнить итоговые файлы задачи: {режим: путь}."""
+        now = time.time()
+        rows = []
+        for mode, path in paths.items():
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+            rows.append((*_key(task, mode), path, size, now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---------- вспомогательные методы ----------
+    def _lookup(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT path, size FROM archive WHERE {_KEY_WHERE}",
+                key,
+            ).fetchone()
+        if row is None:
+            return None
+        path, size = row
+        try:
+            if os.stat(path).st_size == size:
+                return path
+        except OSError:
+            pass
+        logger.info(f"Устаревшая запись архива: {path}")
+        with self._lock:
+            self._conn.execute(f"DELETE FROM archive WHERE {_KEY_WHERE}", key)
+        return None
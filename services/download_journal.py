@@ -0,0 +1,130 @@
+# services/download_journal.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import asdict
+from typing import List, Optional, Tuple
+
+from core.config import cfg
+from core.models import DownloadTask
+from core.utils import Logger
+
+logger = Logger("DownloadJournal")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    task        TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    output_path TEXT,
+    part_path   TEXT,
+    message     TEXT,
+    created     REAL NOT NULL,
+    updated     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state);
+"""
+
+UNFINISHED_STATES = ("queued", "running")
+
+
+def _task_to_json(task: DownloadTask) -> str:
+    return json.dumps(asdict(task), ensure_ascii=False)
+
+
+def _task_from_json(raw: str) -> DownloadTask:
+    data = json.loads(raw)
+    if data.get("time_section"):
+        data["time_sections"] = [data["time_section"]]  # запись до поддержки нескольких фрагментов
+    data["time_sections"] = tuple(tuple(s) for s in data.get("time_sections") or ())
+    if data.get("outputs") is not None:
+        data["outputs"] = tuple(data["outputs"])
+    known = DownloadTask.__dataclass_fields__
+    return DownloadTask(**{k: v for k, v in data.items() if k in known})
+
+
+class DownloadJournal:
+    """
+    Журнал задач в SQLite: состояние, итоговый и .part-файл каждой задачи.
+    Переживает падение и закрытие программы, чтобы докачать незавершённое.
+    """
+
+    DB_FILE = os.path.join(cfg.base_dir, "download_journal.sqlite3")
+    KEEP_FINISHED_DAYS = 7
+
+    def __init__(self, db_file: Optional[str] = None):
+        self.db_file = db_file or self.DB_FILE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._prune()
+
+    # ---------- запись ----------
+    def add(self, task: DownloadTask) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO tasks (task, state, created, updated) VALUES (?, 'queued', ?, ?)",
+                (_task_to_json(task), now, now),
+            )
+            return cur.lastrowid
+
+    def set_state(self, journal_id: int, state: str, message: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, message = COALESCE(?, message), updated = ? WHERE id = ?",
+                (state, message, time.time(), journal_id),
+            )
+
+    def set_output(self, journal_id: int, output_path: str) -> None:
+        """Запомнить итоговый файл и его .part (yt-dlp докачивает его при --continue)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET output_path = ?, part_path = ?, updated = ? WHERE id = ?",
+                (output_path, output_path + ".part", time.time(), journal_id),
+            )
+
+    def cancel_unfinished(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = 'cancelled', updated = ? WHERE state IN (?, ?)",
+                (time.time(), *UNFINISHED_STATES),
+            )
+
+    # ---------- чтение ----------
+    def unfinished(self) -> List[Tuple[int, DownloadTask]]:
+        """Задачи, оставшиеся в очереди или в работе после прошлого запуска."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, task, part_path FROM tasks WHERE state IN (?, ?) ORDER BY id",
+                UNFINISHED_STATES,
+            ).fetchall()
+
+        result = []
+        for journal_id, raw, part_path in rows:
+            try:
+                task = _task_from_json(raw)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Повреждённая запись журнала #{journal_id}: {e}")
+                continue
+            if part_path and os.path.exists(part_path):
+                logger.info(f"Журнал #{journal_id}: найден частичный файл {part_path}")
+            result.append((journal_id, task))
+        return result
+
+    # ---------- обслуживание ----------
+    def _prune(self) -> None:
+        border = time.time() - self.KEEP_FINISHED_DAYS * 86400
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM tasks WHERE state NOT IN (?, ?) AND updated < ?",
+                (*UNFINISHED_STATES, border),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,124 @@
+# services/download_planner.py
+import os
+import re
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+from core.models import DownloadTask
+from core.utils import Logger
+
+logger = Logger("DownloadPlanner")
+
+AUDIO_FORMAT = "bestaudio[ext=m4a][acodec=aac]/bestaudio"
+VIDEO_FORMAT = "bestvideo"
+
+_PART_RE = re.compile(r"\.f(?P<format_id>[0-9A-Za-z_-]+)\.(?P<ext>\w+)$")
+_AUDIO_EXTS = {"m4a", "mp3", "opus", "ogg", "aac", "wav", "flac"}
+
+
+# ---------- группировка ----------
+def plan_tasks(tasks: List[DownloadTask]) -> List[DownloadTask]:
+    """
+    Объединить задачи по одной ссылке в одну загрузку.
+    Каждый поток скачивается один раз, остальные выходы получаются локально.
+    """
+    groups: Dict[Tuple, List[DownloadTask]] = {}
+    for task in tasks:
+        key = (task.url, task.path, task.quality_format, task.time_sections, task.precise_cuts)
+        groups.setdefault(key, []).append(task)
+
+    planned: List[DownloadTask] = []
+    for group in groups.values():
+        modes = tuple(t.mode for t in group if t.mode != "none")
+        # Фрагменты качает ffmpeg одним проходом без промежуточных файлов — не объединяем
+        if len(modes) < 2 or group[0].time_sections:
+            planned.extend(group)
+            continue
+
+        main_mode = "together" if "together" in modes else "video"
+        planned.append(replace(
+            group[0],
+            mode=main_mode,
+            outputs=modes,
+            download_cover=any(t.download_cover for t in group),
+        ))
+        logger.info(f"{group[0].url}: {', '.join(modes)} — одна загрузка вместо {len(modes)}")
+    return planned
+
+
+# ---------- формат для объединённой задачи ----------
+def _video_part(quality_format: str) -> str:
+    """Видеочасть селектора качества: 'bestvideo*[height<=1080]+bestaudio/best' -> 'bestvideo*[height<=1080]'."""
+    head = quality_format.split("/")[0]
+    return head.split("+")[0] if "+" in head else VIDEO_FORMAT
+
+
+def shares_video(task: DownloadTask) -> bool:
+    """Совпадает ли видеопоток 'together' с потоком режима 'video'."""
+    return _video_part(task.quality_format) == VIDEO_FORMAT
+
+
+def build_format(task: DownloadTask) -> Tuple[str, bool]:
+    """
+    Селектор формата для задачи с несколькими выходами.
+    Returns: (format, keep_parts) — keep_parts означает, что нужен -k.
+    """
+    outputs = task.outputs or (task.mode,)
+    if "together" not in outputs:
+        # Только раздельные потоки: один вызов, два файла, без склейки
+        return f"{VIDEO_FORMAT},{AUDIO_FORMAT}", False
+
+    audio = f"({AUDIO_FORMAT})" if "audio" in outputs else "bestaudio"
+    fmt = f"{_video_part(task.quality_format)}+{audio}/best"
+    if "video" in outputs and not shares_video(task):
+        fmt += f",{VIDEO_FORMAT}"
+    keep = "audio" in outputs or ("video" in outputs and shares_video(task))
+    return fmt, keep
+
+
+def is_single_pass(task: DownloadTask) -> bool:
+    """
+    Скачивает ли задача один элемент формата. Только тогда первая постобработка
+    означает, что сеть задаче больше не нужна ('a,b' и несколько фрагментов —
+    несколько загрузок подряд).
+    """
+    if len(task.time_sections) > 1:
+        return False
+    if not task.outputs:
+        return True
+    return "," not in build_format(task)[0]
+
+
+# ---------- локальное получение выходов ----------
+def _is_audio_part(path: str, format_id: str, info: Optional[dict]) -> bool:
+    for fmt in (info or {}).get("formats") or []:
+        if fmt.get("format_id") == format_id:
+            return fmt.get("vcodec") == "none"
+    return path.rsplit(".", 1)[-1].lower() in _AUDIO_EXTS
+
+
+def derive_outputs(task: DownloadTask, files: List[str], info: Optional[dict]) -> List[str]:
+    """
+    После загрузки с -k переименовать сохранённые потоки в отдельные файлы
+    и удалить ненужные. Returns: список полученных файлов.
+    """
+    outputs = task.outputs or ()
+    produced: List[str] = []
+    for path in dict.fromkeys(files):
+        m = _PART_RE.search(path)
+        if not m or not os.path.exists(path):
+            continue
+        is_audio = _is_audio_part(path, m.group("format_id"), info)
+        wanted = "audio" in outputs if is_audio else ("video" in outputs and shares_video(task))
+        if not wanted:
+            os.remove(path)
+            continue
+
+        suffix = "audio" if is_audio else "video"
+        target = f"{path[:m.start()]}_{suffix}.{m.group('ext')}"
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        produced.append(target)
+    return produced
@@ -1,78 +1,415 @@
-﻿from PySide6.QtCore import QObject, Signal, QThreadPool
-from typing import List, Dict
-from collections import deque
+﻿from PySide6.QtCore import QObject, Signal, QThreadPool, QTimer
+from typing import List, Dict, Optional, Tuple, Union
+from dataclasses import replace
+import itertools
+import time
+import os
 
-from core.models import DownloadTask
-from services.single_download_worker import SingleDownloadRunnable
+from core.config import cfg
+from core.models import DownloadTask, DownloadTaskResult
+from services.single_download_worker import SingleDownloadRunnable, AsyncDownloadJob
+from services.async_engine import AsyncDownloadEngine
 from services.video_downloader import VideoDownloader
+from services.ytdlp_farm import create_farm
+from services.bandwidth_governor import BandwidthGovernor
+from services.download_journal import DownloadJournal
+from services.progress_aggregator import ProgressAggregator
+from services.stall_watchdog import StallWatchdog
+from services.task_scheduler import TaskScheduler
+from services.playlist_expander import is_collection_url
+from services.playlist_worker import PlaylistExpandRunnable
+from services.download_archive import DownloadArchive
+from services.postprocess_stage import create_stage
+from services.split_download import SplitDownload, can_split
+from services.split_worker import SplitPlanRunnable, SplitConcatRunnable
+from services.metrics import start_export, flush_export
 from core.utils import Logger
 
 logger = Logger("DownloadPoolManager")
 
+MBIT = 125_000  # байт/с в 1 Мбит/с
+
 
 class DownloadPoolManager(QObject):
     """Управляет пулом параллельных загрузок"""
 
     # Сигналы для UI
-    task_progress = Signal(int, object)  # index, DownloadProgress
+    task_progress = Signal(int, object)  # index, ProgressState (не чаще PROGRESS_FLUSH_MS)
     task_finished = Signal(int, object)  # index, DownloadTaskResult
     pool_status = Signal(int, int)  # active, queued
+    bandwidth_status = Signal(int, int)  # используемая скорость, общий лимит (байт/с)
+    _postprocess_started = Signal(int)  # из потока загрузки: задача отдала слот
+
+    BANDWIDTH_STATUS_INTERVAL = 1.0
+    PROGRESS_FLUSH_MS = 100  # 10 Гц
 
     def __init__(self, max_threads: int = 3):
         super().__init__()
+        self.max_threads = max_threads
+        # Задачи на стадии постобработки держат поток и воркер, но не слот загрузки
+        self.postprocess = create_stage()
         self.pool = QThreadPool()
-        self.pool.setMaxThreadCount(max_threads)
-        self.downloader = VideoDownloader()
-        self.active_tasks: Dict[int, SingleDownloadRunnable] = {}
-        self.queue = deque()
+        self.pool.setMaxThreadCount(max_threads + self.postprocess.slots)
+        self.farm = create_farm(max_threads, max_size=max_threads + self.postprocess.slots)
+        self.governor = BandwidthGovernor(
+            int(cfg.load_setting("bandwidth_limit_mbit", 0)) * MBIT
+        )
+        self.watchdog = StallWatchdog(
+            stall_timeout=float(cfg.load_setting("stall_timeout_sec", 60)),
+            postprocess_timeout=float(cfg.load_setting("postprocess_timeout_sec", 1800)),
+        )
+        self.archive = DownloadArchive()
+        self.skip_downloaded = bool(cfg.load_setting("skip_downloaded", True))
+        self.downloader = VideoDownloader(
+            farm=self.farm,
+            bandwidth_governor=self.governor,
+            watchdog=self.watchdog,
+            archive=self.archive,
+            postprocess_stage=self.postprocess,
+        )
+        # ytdlp_engine = "asyncio": загрузки — корутины одного цикла событий, а не потоки пула
+        self.engine: Optional[AsyncDownloadEngine] = None
+        if cfg.load_setting("ytdlp_engine", "library") == "asyncio":
+            self.engine = AsyncDownloadEngine(
+                self.downloader,
+                max_concurrency=int(cfg.load_setting("async_max_downloads", 32)),
+            )
+        self._last_bandwidth_emit = 0.0
+        self.active_tasks: Dict[int, Union[SingleDownloadRunnable, AsyncDownloadJob]] = {}
+        self.postprocessing: Dict[int, Union[SingleDownloadRunnable, AsyncDownloadJob]] = {}
+        self.queue = TaskScheduler(self.downloader.metadata_cache)  # короткие задачи первыми
+        self._next_index = itertools.count(1)  # сквозной номер задачи за сессию
+        self._expanders: List[PlaylistExpandRunnable] = []
+        self._splitters: List[SplitPlanRunnable] = []  # ищут границы частей
+        self._split_parts: Dict[int, SplitDownload] = {}  # номер части -> разбитая загрузка
+        self._concats: Dict[int, SplitConcatRunnable] = {}  # номер задачи -> склейка частей
+        self._sources: Dict[int, str] = {}  # номер задачи -> ссылка, которую добавил пользователь
+        self.journal = DownloadJournal()
+        self._journal_ids: Dict[int, int] = {}   # index -> id в журнале
+        self._output_paths: Dict[int, str] = {}
+
+        # Прогресс воркеров сводится в агрегатор и забирается UI по таймеру
+        self.progress = ProgressAggregator()
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(self.PROGRESS_FLUSH_MS)
+        self._flush_timer.timeout.connect(self._flush_progress)
+
+        self._postprocess_started.connect(self._on_postprocess_started)
+        self.postprocess.subscribe(self._postprocess_started.emit)
+        start_export()  # metrics_file / HTTP /metrics, если включены
 
     def add_tasks(self, tasks: List[DownloadTask]):
-        """Добавить список задач в очередь"""
-        for idx, task in enumerate(tasks, 1):
-            self.queue.append((idx, task))
+        """Добавить список задач в очередь. Плейлисты и каналы раскрываются в фоне"""
+        for task in tasks:
+            if is_collection_url(task.url):
+                self._expand(task)
+            else:
+                self._enqueue(task)
+
+        self._process_queue()
+
+    def _enqueue(self, task: DownloadTask, source: Optional[str] = None):
+        """source — ссылка строки очереди (плейлист для его видео): по ней отменяет cancel_source"""
+        idx = next(self._next_index)
+        existing = self.archive.find(task) if self.skip_downloaded else None
+        if existing:
+            # Уже скачано: ни экстракции, ни запуска yt-dlp
+            logger.info(f"#{idx}: пропуск, уже скачано — {existing}")
+            if task.download_cover:
+                # обложку в архиве не ищем: ставим её отдельной задачей
+                self._enqueue(replace(task, mode="none", outputs=None, split_parts=0), source)
+            result = DownloadTaskResult(
+                index=idx,
+                status="success",
+                message=f"⏭ Уже скачано: {os.path.basename(existing)}",
+            )
+            self.task_finished.emit(idx, result)
+            return
+        # Имя файла фиксируется сразу: после перезапуска докачка найдёт тот же .part
+        task = replace(
+            task,
+            output_template=task.output_template or self.downloader.output_template(task, idx),
+        )
+        self._sources[idx] = source or task.url
+        if can_split(task):
+            self._split(idx, task)
+            return
+        self._journal_ids[idx] = self.journal.add(task)
+        self.queue.push(idx, task)
 
+    def _expand(self, task: DownloadTask):
+        """Раскрыть плейлист/канал: видео попадают в очередь по мере перебора"""
+        runnable = PlaylistExpandRunnable(task, self.downloader)
+        runnable.signals.entries.connect(
+            lambda tasks, runnable=runnable: self._on_expanded(runnable, tasks)
+        )
+        runnable.signals.finished.connect(
+            lambda count, runnable=runnable: self._on_expand_finished(runnable)
+        )
+        self._expanders.append(runnable)
+        QThreadPool.globalInstance().start(runnable)
+
+    def _on_expanded(self, runnable: PlaylistExpandRunnable, tasks: List[DownloadTask]):
+        if runnable.is_cancelled():
+            return  # пачка отправлена до отмены
+        for task in tasks:
+            self._enqueue(task, runnable.task.url)
+        self._process_queue()
+
+    def _on_expand_finished(self, runnable: PlaylistExpandRunnable):
+        if runnable in self._expanders:
+            self._expanders.remove(runnable)
+        self._update_status()
+
+    def _split(self, idx: int, task: DownloadTask):
+        """Скачать задачу частями: границы ищутся в фоне, части встают в общую очередь.
+        В журнал попадает исходная задача: после перезапуска она докачивается целиком"""
+        if task.download_cover:
+            # обложка не относится ни к одной части
+            self._enqueue(replace(task, mode="none", split_parts=0), self._sources.get(idx))
+            task = replace(task, download_cover=False)
+        self._journal_ids[idx] = self.journal.add(task)
+        runnable = SplitPlanRunnable(idx, task, self.downloader)
+        runnable.signals.planned.connect(
+            lambda split, runnable=runnable: self._on_split_planned(runnable, split)
+        )
+        self._splitters.append(runnable)
+        QThreadPool.globalInstance().start(runnable)
+
+    def _on_split_planned(self, runnable: SplitPlanRunnable, split: Optional[SplitDownload]):
+        if runnable not in self._splitters:
+            return  # отменено, пока искались границы
+        self._splitters.remove(runnable)
+        if split is None:
+            # короткое видео или длительность неизвестна — одной задачей
+            self.queue.push(runnable.index, runnable.task)
+        else:
+            for part in split.parts:
+                part_idx = next(self._next_index)
+                split.attach(part_idx)
+                self._split_parts[part_idx] = split
+                self.queue.push(part_idx, part)
+        self._process_queue()
+
+    def _report(self, index: int, result: DownloadTaskResult):
+        """Итог задачи — в UI; итоги частей копятся до склейки"""
+        self._sources.pop(index, None)
+        split = self._split_parts.pop(index, None)
+        if split is None:
+            self.task_finished.emit(index, result)
+            return
+        if not split.part_finished(index, result):
+            if result.status != "success":
+                for part in list(split.pending):  # без одной части склеивать нечего
+                    self.cancel_task(part)
+            return
+        runnable = SplitConcatRunnable(split, self.archive)
+        runnable.signals.finished.connect(
+            lambda res, index=split.index: self._on_split_finished(index, res)
+        )
+        self._concats[split.index] = runnable
+        QThreadPool.globalInstance().start(runnable)
+
+    def _on_split_finished(self, index: int, result: DownloadTaskResult):
+        self._concats.pop(index, None)
+        self._on_task_finished(index, result)
+
+    def is_busy(self) -> bool:
+        """Есть ли активные, ожидающие или ещё раскрываемые задачи"""
+        return bool(
+            self.active_tasks or self.postprocessing or self.queue
+            or self._expanders or self._splitters or self._concats
+        )
+
+    def resume_tasks(self, entries: List[Tuple[int, DownloadTask]]):
+        """Вернуть в очередь незавершённые задачи из журнала (докачка с --continue)"""
+        for journal_id, task in entries:
+            idx = next(self._next_index)
+            self._journal_ids[idx] = journal_id
+            self._sources[idx] = task.url
+            self.journal.set_state(journal_id, "queued")
+            self.queue.push(idx, replace(task, resume=True))
+
+        logger.info(f"Восстановлено из журнала: {len(entries)}")
         self._process_queue()
 
     def _process_queue(self):
         """Запускаем задачи из очереди, пока есть свободные слоты"""
-        while self.queue and len(self.active_tasks) < self.pool.maxThreadCount():
-            idx, task = self.queue.popleft()
-
-            worker = SingleDownloadRunnable(
-                task=task,
-                index=idx,
-                downloader=self.downloader
+        slots = self.engine.max_concurrency if self.engine else self.max_threads
+        while self.queue and len(self.active_tasks) < slots:
+            large_running = sum(
+                not self.queue.is_small(w.task) for w in self.active_tasks.values()
             )
+            picked = self.queue.pop(large_running, slots)
+            if picked is None:
+                break  # свободны только слоты мелких задач
+            idx, task = picked
+            self.downloader.expect(idx)  # отмена до старта runnable не потеряется
+
+            if self.engine:
+                worker = AsyncDownloadJob(
+                    task=task, index=idx, engine=self.engine, aggregator=self.progress
+                )
+            else:
+                worker = SingleDownloadRunnable(
+                    task=task,
+                    index=idx,
+                    downloader=self.downloader,
+                    aggregator=self.progress
+                )
 
             # Подключаем сигналы
-            worker.signals.progress.connect(
-                lambda prog, idx=idx: self.task_progress.emit(idx, prog)
-            )
             worker.signals.finished.connect(
                 lambda res, idx=idx: self._on_task_finished(idx, res)
             )
 
             self.active_tasks[idx] = worker
-            self.pool.start(worker)
+            self._journal_state(idx, "running")
+            if self.engine:
+                worker.start()
+            else:
+                self.pool.start(worker)
 
         self._update_status()
 
+    def _flush_progress(self):
+        """Отдать UI последние состояния изменившихся задач"""
+        for state in self.progress.drain():
+            if state.index in self.active_tasks or state.index in self.postprocessing:
+                self._on_task_progress(state.index, state)
+
+    def _on_task_progress(self, index: int, progress):
+        self.task_progress.emit(index, progress)
+        filename = getattr(progress, "filename", None)
+        if filename and self._output_paths.get(index) != filename and index in self._journal_ids:
+            self._output_paths[index] = filename
+            self.journal.set_output(self._journal_ids[index], filename)
+        now = time.monotonic()
+        if now - self._last_bandwidth_emit >= self.BANDWIDTH_STATUS_INTERVAL:
+            self._last_bandwidth_emit = now
+            self.bandwidth_status.emit(*self.governor.usage())
+
+    def set_bandwidth_limit(self, mbit: int):
+        """Общий лимит скорости пула в Мбит/с (0 — без ограничения)"""
+        self.governor.set_total(mbit * MBIT)
+        self.bandwidth_status.emit(*self.governor.usage())
+
+    def _on_postprocess_started(self, index: int):
+        """Задача перешла к склейке/конвертации: её слот загрузки — следующей в очереди"""
+        if index in self.active_tasks:
+            self.postprocessing[index] = self.active_tasks.pop(index)
+            self._process_queue()
+
     def _on_task_finished(self, index: int, result):
         """Когда задача завершена, запускаем следующую из очереди"""
+        # итоговое состояние могло не дождаться таймера — отдаём его сейчас
+        pending = self.progress.discard(index)
+        if pending is not None:
+            self._on_task_progress(index, pending)
         self.active_tasks.pop(index, None)
-        self.task_finished.emit(index, result)
+        self.postprocessing.pop(index, None)
+        self._output_paths.pop(index, None)
+        state = {"success": "done", "cancelled": "cancelled"}.get(result.status, "failed")
+        self._journal_state(index, state, result.message)
+        self._journal_ids.pop(index, None)
+        self._report(index, result)
         self._process_queue()  # Запускаем следующую задачу
         self._update_status()
 
     def _update_status(self):
         """Обновляем статус пула"""
-        active = len(self.active_tasks)
-        queued = len(self.queue)
+        active = len(self.active_tasks) + len(self.postprocessing) + len(self._concats)
+        # раскрываемый плейлист и разбиваемая загрузка — тоже ожидание
+        queued = len(self.queue) + len(self._expanders) + len(self._splitters)
+        self.downloader.fragment_tuner.set_occupancy(len(self.active_tasks))
+        if active and not self._flush_timer.isActive():
+            self._flush_timer.start()
+        elif not active:
+            self._flush_timer.stop()
         self.pool_status.emit(active, queued)
+        self.bandwidth_status.emit(*self.governor.usage())
+
+    def _journal_state(self, index: int, state: str, message: Optional[str] = None):
+        journal_id = self._journal_ids.get(index)
+        if journal_id is not None:
+            self.journal.set_state(journal_id, state, message)
+
+    def cancel_task(self, index: int):
+        """Отменить одну задачу: убрать из очереди или остановить её процессы.
+        У разбитой загрузки отменяются поиск границ, её части и склейка"""
+        if self.queue.remove(index):
+            self._finish_cancelled(index)
+            self._update_status()
+        elif index in self.active_tasks or index in self.postprocessing:
+            # Слот освободится, когда runnable получит событие "cancelled"
+            self.downloader.cancel(index)
+        else:
+            self._cancel_split(index)
+
+    def cancel_source(self, url: str):
+        """Отменить всё, что пришло из одной строки очереди: задачу ссылки или видео плейлиста"""
+        for runnable in self._expanders:
+            if runnable.task.url == url:
+                runnable.cancel()
+        for index in [idx for idx, source in self._sources.items() if source == url]:
+            self.cancel_task(index)
+
+    def _cancel_split(self, index: int):
+        planner = next((r for r in self._splitters if r.index == index), None)
+        if planner is not None:
+            self._splitters.remove(planner)  # найденные границы будут проигнорированы
+            self._finish_cancelled(index)
+            self._update_status()
+        elif index in self._concats:
+            self._cancel_concat(index)
+        else:
+            split = next((s for s in self._split_parts.values() if s.index == index), None)
+            if split is not None:
+                # итог последней части запустит склейку, и она сразу вернёт "cancelled"
+                split.cancel()
+                for part in list(split.pending):
+                    self.cancel_task(part)
+
+    def _cancel_concat(self, index: int):
+        runnable = self._concats[index]
+        runnable.split.cancel()
+        if QThreadPool.globalInstance().tryTake(runnable):
+            # склейка ещё не началась: итог — сразу, временная папка удаляется
+            self._on_split_finished(index, runnable.split.finish(self.archive))
 
     def cancel_all(self):
-        """Отменить все активные задачи"""
-        # QRunnable нельзя принудительно остановить, но можно пометить отмененными
+        """Отменить все задачи: очередь очищается, процессы активных убиваются"""
+        for runnable in self._expanders:
+            runnable.cancel()
+        for split in set(self._split_parts.values()):
+            split.cancel()  # склейка после отмены частей не запустится
+        for index in list(self._concats):
+            self._cancel_concat(index)
+        pending = [idx for idx, _ in self.queue] + [r.index for r in self._splitters]
+        self._splitters.clear()
+        self.queue.clear()
+        for idx in pending:
+            self._finish_cancelled(idx)
         self.downloader.cancel()
+        self._update_status()
+        logger.info("Все загрузки отменены")
+
+    def _finish_cancelled(self, index: int):
+        """Задача отменена до запуска"""
+        result = DownloadTaskResult(index=index, status="cancelled", message="⛔ Отменено")
+        self._journal_state(index, "cancelled")
+        self._journal_ids.pop(index, None)
+        self._report(index, result)
+
+    def shutdown(self):
+        """Остановить воркеры yt-dlp при выходе из приложения.
+        Незавершённые задачи остаются в журнале и докачиваются при следующем запуске."""
+        for runnable in self._expanders:
+            runnable.cancel()
+        self._splitters.clear()
         self.queue.clear()
-        logger.info("Все загрузки отменены")
\ No newline at end of file
+        if self.engine:
+            self.engine.shutdown()
+        if self.farm:
+            self.farm.shutdown()
+        flush_export()
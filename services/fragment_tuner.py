@@ -0,0 +1,72 @@
+# services/fragment_tuner.py
+import threading
+from typing import Dict, Optional
+
+from core.utils import Logger
+
+logger = Logger("FragmentTuner")
+
+
+class FragmentTuner:
+    """
+    Подбор --concurrent-fragments для DASH/HLS.
+
+    Бюджет соединений делится между занятыми слотами пула, а внутри доли
+    выбирается уровень с наибольшей ожидаемой скоростью задачи:
+    уровень × измеренная скорость одного соединения на этом уровне.
+    Неопробованный уровень оценивается по ближайшему меньшему — так тюнер
+    поднимается, пока соединения режутся по отдельности, и останавливается,
+    когда упирается в канал.
+    """
+
+    LEVELS = (1, 2, 4, 8, 16)
+    TOTAL_CONNECTIONS = 16
+    ALPHA = 0.3  # вес нового замера в скользящем среднем
+
+    def __init__(self, total_connections: Optional[int] = None):
+        self.total_connections = total_connections or self.TOTAL_CONNECTIONS
+        self._lock = threading.Lock()
+        self._occupancy = 0
+        self._running: Dict[int, int] = {}        # idx -> выданное число фрагментов
+        self._per_conn: Dict[int, float] = {}     # уровень -> байт/с на соединение
+
+    # ---------- публичные методы ----------
+    def set_occupancy(self, active: int) -> None:
+        """Число занятых слотов пула (обновляется менеджером пула)."""
+        with self._lock:
+            self._occupancy = active
+
+    def acquire(self, idx: int) -> int:
+        """Выбрать число параллельных фрагментов для задачи перед запуском."""
+        with self._lock:
+            self._running[idx] = 0
+            active = max(self._occupancy, len(self._running))
+            n = self._choose(active)
+            self._running[idx] = n
+        logger.info(f"#{idx}: concurrent-fragments={n} (активно {active})")
+        return n
+
+    def release(self, idx: int, avg_speed: Optional[float], fragmented: bool) -> None:
+        """Учесть среднюю скорость завершённой задачи (только для фрагментных форматов)."""
+        with self._lock:
+            n = self._running.pop(idx, 0)
+            if not (n and fragmented and avg_speed):
+                return
+            sample = avg_speed / n
+            prev = self._per_conn.get(n)
+            self._per_conn[n] = sample if prev is None else prev + self.ALPHA * (sample - prev)
+
+    # ---------- вспомогательные методы ----------
+    def _choose(self, active: int) -> int:
+        share = max(1, self.total_connections // max(active, 1))
+        candidates = [n for n in self.LEVELS if n <= share] or [1]
+
+        best, best_speed = candidates[-1], 0.0
+        estimate = None
+        for n in candidates:
+            estimate = self._per_conn.get(n, estimate)
+            if estimate is None:
+                continue
+            if n * estimate > best_speed:
+                best, best_speed = n, n * estimate
+        return best
@@ -0,0 +1,324 @@
+# services/headless_pool.py
+import os
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Set
+
+from core.config import cfg
+from core.models import DownloadTask, DownloadTaskResult
+from services.video_downloader import VideoDownloader, DownloadProgress
+from services.ytdlp_farm import create_farm
+from services.async_engine import AsyncDownloadEngine
+from services.bandwidth_governor import BandwidthGovernor
+from services.stall_watchdog import StallWatchdog
+from services.task_scheduler import TaskScheduler
+from services.playlist_expander import PlaylistExpander, is_collection_url
+from services.download_archive import DownloadArchive
+from services.postprocess_stage import create_stage
+from services.split_download import SplitDownload, can_split, plan_split
+from services.metrics import start_export, flush_export
+from core.utils import Logger
+
+logger = Logger("HeadlessPool")
+
+MBIT = 125_000  # байт/с в 1 Мбит/с
+
+ProgressCallback = Callable[[int, DownloadProgress], None]
+FinishedCallback = Callable[[int, DownloadTask, DownloadTaskResult], None]
+
+
+class HeadlessDownloadPool:
+    """
+    Пул параллельных загрузок без Qt (командная строка, cron).
+
+    Повторяет DownloadPoolManager — короткие задачи первыми, пропуск скачанного,
+    раскрытие плейлистов по мере перебора, стадия постобработки, загрузка
+    частями, — но на
+    ThreadPoolExecutor и обратных вызовах вместо сигналов. Обратные вызовы приходят из потоков пула;
+    on_finished — под блокировкой пула, поэтому ждать других задач в нём нельзя.
+    """
+
+    EXPAND_THREADS = 2
+
+    def __init__(
+        self,
+        max_threads: int = 3,
+        on_progress: Optional[ProgressCallback] = None,
+        on_finished: Optional[FinishedCallback] = None,
+        engine: Optional[str] = None,
+        bandwidth_limit_mbit: Optional[int] = None,
+        skip_downloaded: Optional[bool] = None,
+    ):
+        self.max_threads = max_threads
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        # Задачи на стадии постобработки держат поток, но не слот загрузки
+        self.postprocess = create_stage()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_threads + self.postprocess.slots, thread_name_prefix="download"
+        )
+        self._expand_executor = ThreadPoolExecutor(
+            max_workers=self.EXPAND_THREADS, thread_name_prefix="expand"
+        )
+        self.farm = create_farm(max_threads, engine, max_threads + self.postprocess.slots)
+        if bandwidth_limit_mbit is None:
+            bandwidth_limit_mbit = int(cfg.load_setting("bandwidth_limit_mbit", 0))
+        self.governor = BandwidthGovernor(bandwidth_limit_mbit * MBIT)
+        self.watchdog = StallWatchdog(
+            stall_timeout=float(cfg.load_setting("stall_timeout_sec", 60)),
+            postprocess_timeout=float(cfg.load_setting("postprocess_timeout_sec", 1800)),
+        )
+        self.archive = DownloadArchive()
+        if skip_downloaded is None:
+            skip_downloaded = bool(cfg.load_setting("skip_downloaded", True))
+        self.skip_downloaded = skip_downloaded
+        self.downloader = VideoDownloader(
+            farm=self.farm,
+            bandwidth_governor=self.governor,
+            watchdog=self.watchdog,
+            archive=self.archive,
+            postprocess_stage=self.postprocess,
+        )
+        # engine = "asyncio": загрузки — корутины одного цикла событий вместо потоков
+        self.engine: Optional[AsyncDownloadEngine] = None
+        if (engine or cfg.load_setting("ytdlp_engine", "library")) == "asyncio":
+            self.engine = AsyncDownloadEngine(self.downloader, max_concurrency=max_threads)
+        self.queue = TaskScheduler(self.downloader.metadata_cache)
+        self.active_tasks: Dict[int, DownloadTask] = {}
+        self.postprocessing: Dict[int, DownloadTask] = {}  # отдали слот загрузки, идёт ffmpeg
+        self.results: Dict[int, DownloadTaskResult] = {}
+        self._tasks: Dict[int, DownloadTask] = {}
+        self._expanders: List[PlaylistExpander] = []
+        self._splitting: Dict[int, DownloadTask] = {}  # ищутся границы частей
+        self._split_parts: Dict[int, SplitDownload] = {}  # номер части -> разбитая загрузка
+        self._concats: Set[int] = set()  # склеиваются части
+        self._next_index = itertools.count(1)
+        # RLock: обратные вызовы и отмена могут прийти из потока, уже держащего блокировку
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+        self.postprocess.subscribe(self._on_postprocess)
+        start_export()  # metrics_file / HTTP /metrics, если включены
+
+    # ---------- публичные методы ----------
+    def add_tasks(self, tasks: List[DownloadTask]) -> None:
+        """Добавить задачи. Плейлисты и каналы раскрываются в фоне"""
+        with self._lock:
+            for task in tasks:
+                if is_collection_url(task.url):
+                    self._expand(task)
+                else:
+                    self._enqueue(task)
+            self._process_queue()
+
+    def is_busy(self) -> bool:
+        """Есть ли активные, ожидающие или ещё раскрываемые задачи"""
+        with self._lock:
+            return bool(
+                self.active_tasks or self.postprocessing or self.queue
+                or self._expanders or self._splitting or self._concats
+            )
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться завершения всех задач. Returns: False, если истёк timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.is_busy(), timeout)
+
+    def cancel_all(self) -> None:
+        """Отменить все задачи: очередь очищается, процессы активных убиваются"""
+        with self._lock:
+            for expander in self._expanders:
+                expander.cancel()
+            pending = [idx for idx, _ in self.queue] + list(self._splitting)
+            self._splitting.clear()
+            self.queue.clear()
+            for idx in pending:
+                self._finish(idx, DownloadTaskResult(index=idx, status="cancelled", message="⛔ Отменено"))
+        self.downloader.cancel()
+        logger.info("Все загрузки отменены")
+
+    def shutdown(self) -> None:
+        """Остановить потоки и воркеры yt-dlp."""
+        with self._lock:
+            for expander in self._expanders:
+                expander.cancel()
+            self._splitting.clear()
+            self.queue.clear()
+        self._expand_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+        if self.engine:
+            self.engine.shutdown()
+        if self.farm:
+            self.farm.shutdown()
+        self.archive.close()
+        flush_export()
+
+    # ---------- очередь ----------
+    def _enqueue(self, task: DownloadTask) -> None:
+        idx = next(self._next_index)
+        self._tasks[idx] = task
+        existing = self.archive.find(task) if self.skip_downloaded else None
+        if existing:
+            logger.info(f"#{idx}: пропуск, уже скачано — {existing}")
+            if task.download_cover:
+                # обложку в архиве не ищем: ставим её отдельной задачей
+                self._enqueue(replace(task, mode="none", outputs=None, split_parts=0))
+            self._finish(idx, DownloadTaskResult(
+                index=idx,
+                status="success",
+                message=f"⏭ Уже скачано: {os.path.basename(existing)}",
+            ))
+            return
+        task = replace(
+            task,
+            output_template=task.output_template or self.downloader.output_template(task, idx),
+        )
+        self._tasks[idx] = task
+        if can_split(task):
+            self._split(idx, task)
+            return
+        self.queue.push(idx, task)
+
+    def _process_queue(self) -> None:
+        """Запускаем задачи из очереди, пока есть свободные слоты"""
+        while self.queue and len(self.active_tasks) < self.max_threads:
+            large_running = sum(not self.queue.is_small(t) for t in self.active_tasks.values())
+            picked = self.queue.pop(large_running, self.max_threads)
+            if picked is None:
+                break  # свободны только слоты мелких задач
+            idx, task = picked
+            self.active_tasks[idx] = task
+            self.downloader.expect(idx)
+            on_progress = (lambda p, idx=idx: self.on_progress(idx, p)) if self.on_progress else None
+            if self.engine:
+                future = self.engine.submit(task, idx, on_progress)
+                future.add_done_callback(lambda f, idx=idx: self._on_engine_done(idx, f))
+            else:
+                self._executor.submit(self._run, idx, task, on_progress)
+        self.downloader.fragment_tuner.set_occupancy(len(self.active_tasks))
+
+    def _run(self, idx: int, task: DownloadTask, on_progress) -> None:
+        self._complete(idx, self.downloader.run_task(task, idx, on_progress=on_progress))
+
+    def _on_engine_done(self, idx: int, future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            error = "прервано" if future.cancelled() else future.exception()
+            result = DownloadTaskResult(index=idx, status="unknown", message=f"Сбой: {error}")
+        else:
+            result = future.result()
+        self._complete(idx, result)
+
+    def _on_postprocess(self, idx: int) -> None:
+        """Задача перешла к постобработке: её слот загрузки — следующей в очереди."""
+        with self._lock:
+            if idx in self.active_tasks:
+                self.postprocessing[idx] = self.active_tasks.pop(idx)
+                self._process_queue()
+
+    def _complete(self, idx: int, result: DownloadTaskResult) -> None:
+        with self._lock:
+            self.active_tasks.pop(idx, None)
+            self.postprocessing.pop(idx, None)
+            self._finish(idx, result)
+            self._process_queue()
+
+    def _finish(self, idx: int, result: DownloadTaskResult) -> None:
+        split = self._split_parts.pop(idx, None)
+        if split is not None:
+            # итоги частей копятся до склейки
+            self._tasks.pop(idx, None)
+            self._on_part_finished(split, idx, result)
+            return
+        self.results[idx] = result
+        task = self._tasks.pop(idx)
+        if self.on_finished:
+            self.on_finished(idx, task, result)
+        self._idle.notify_all()
+
+    # ---------- плейлисты ----------
+    def _expand(self, task: DownloadTask) -> None:
+        """Раскрыть плейлист/канал: видео попадают в очередь по мере перебора"""
+        expander = PlaylistExpander(self.downloader)
+        self._expanders.append(expander)
+        self._expand_executor.submit(self._run_expander, expander, task)
+
+    def _run_expander(self, expander: PlaylistExpander, task: DownloadTask) -> None:
+        count = 0
+        error = "видео не найдены"
+        try:
+            for url in expander.urls(task.url):
+                with self._lock:
+                    if expander.is_cancelled():
+                        break
+                    self._enqueue(replace(task, url=url))
+                    self._process_queue()
+                count += 1
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Не удалось раскрыть {task.url}: {e}")
+        finally:
+            logger.info(f"{task.url}: найдено видео {count}")
+            with self._lock:
+                self._expanders.remove(expander)
+                if not count and not expander.is_cancelled():
+                    # Без этого пустой или недоступный плейлист выглядел бы успехом
+                    idx = next(self._next_index)
+                    self._tasks[idx] = task
+                    self._finish(idx, DownloadTaskResult(
+                        index=idx, status="unknown", message=f"❌ Плейлист: {error}"
+                    ))
+                self._idle.notify_all()
+
+    # ---------- загрузка частями ----------
+    def _split(self, idx: int, task: DownloadTask) -> None:
+        """Скачать задачу частями: границы ищутся в фоне, части встают в общую очередь"""
+        if task.download_cover:
+            # обложка не относится ни к одной части
+            self._enqueue(replace(task, mode="none", split_parts=0))
+            task = replace(task, download_cover=False)
+            self._tasks[idx] = task
+        self._splitting[idx] = task
+        self._expand_executor.submit(self._run_split, idx, task)
+
+    def _run_split(self, idx: int, task: DownloadTask) -> None:
+        split = None
+        try:
+            split = plan_split(self.downloader, idx, task)
+        except Exception as e:
+            logger.error(f"#{idx}: не удалось разбить {task.url}: {e}")
+        with self._lock:
+            if self._splitting.pop(idx, None) is None:
+                return  # отменено, пока искались границы
+            if split is None:
+                # короткое видео или длительность неизвестна — одной задачей
+                self.queue.push(idx, task)
+            else:
+                for part in split.parts:
+                    part_idx = next(self._next_index)
+                    split.attach(part_idx)
+                    self._split_parts[part_idx] = split
+                    self._tasks[part_idx] = part
+                    self.queue.push(part_idx, part)
+            self._process_queue()
+
+    def _on_part_finished(self, split: SplitDownload, idx: int, result: DownloadTaskResult) -> None:
+        if not split.part_finished(idx, result):
+            if result.status != "success":
+                # без одной части склеивать нечего
+                for part in list(split.pending):
+                    if self.queue.remove(part):
+                        self._finish(part, DownloadTaskResult(
+                            index=part, status="cancelled", message="⛔ Отменено"
+                        ))
+                    else:
+                        self.downloader.cancel(part)
+            return
+        self._concats.add(split.index)
+        self._executor.submit(self._run_concat, split)
+
+    def _run_concat(self, split: SplitDownload) -> None:
+        result = split.finish(self.archive)
+        with self._lock:
+            self._concats.discard(split.index)
+            self._finish(split.index, result)
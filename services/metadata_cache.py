@@ -0,0 +1,160 @@
+# services/metadata_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+
+from core.config import cfg
+from core.utils import Logger
+
+logger = Logger("MetadataCache")
+
+_YOUTUBE_ID_RE = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)"
+    r"(?P<id>[0-9A-Za-z_-]{11})"
+)
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """ID ролика YouTube из ссылки без обращения к сети."""
+    m = _YOUTUBE_ID_RE.search(url)
+    return m.group("id") if m else None
+
+
+def canonical_key(url: str) -> str:
+    """Ключ кэша: ID видео для YouTube, хэш ссылки для остальных сайтов."""
+    video_id = extract_video_id(url)
+    if video_id:
+        return f"youtube_{video_id}"
+    return "url_" + hashlib.sha1(url.strip().encode("utf-8")).hexdigest()[:16]
+
+
+class MetadataCache:
+    """
+    Дисковый кэш info.json (результат экстракции yt-dlp).
+    mtime файла — время экстракции (TTL), atime — последнее обращение (LRU).
+    """
+
+    CACHE_DIR = os.path.join(cfg.base_dir, ".info_cache")
+    TTL = 3 * 3600  # ссылки на потоки YouTube живут ~6 часов
+    MAX_ENTRIES = 200
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir or self.CACHE_DIR
+        self.ttl = self.TTL if ttl is None else ttl
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, List] = {}  # ключ -> [блокировка, сколько задач её держат или ждут]
+
+    # ---------- публичные методы ----------
+    def path_for(self, url: str) -> str:
+        return os.path.join(self.cache_dir, f"{canonical_key(url)}.info.json")
+
+    def get(self, url: str) -> Optional[str]:
+        """Путь к свежему info.json или None."""
+        path = self.path_for(url)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        now = time.time()
+        if now - st.st_mtime > self.ttl:
+            return None
+        try:
+            os.utime(path, (now, st.st_mtime))
+        except OSError:
+            pass
+        return path
+
+    def load(self, url: str) -> Optional[dict]:
+        """Разобранный info dict из кэша (без экстракции)."""
+        path = self.get(url)
+        if not path:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Повреждённая запись кэша {path}: {e}")
+            return None
+
+    def put(self, url: str, info: dict) -> str:
+        path = self.path_for(url)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._evict()
+        return path
+
+    def get_or_extract(self, url: str, extract: Callable[[str], Optional[dict]]) -> Optional[str]:
+        """
+        Вернуть путь к info.json, при промахе вызвать extract(url).
+        Параллельные задачи по одной ссылке ждут единственную экстракцию.
+        Если extract вернул None (например, плейлист), ничего не кэшируется.
+        """
+        key = canonical_key(url)
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                path = self.get(url)
+                if path:
+                    logger.info(f"Метаданные {key} взяты из кэша")
+                    return path
+                started = time.time()
+                info = extract(url)
+                if info is None:
+                    return None
+                path = self.put(url, info)
+                logger.info(f"Метаданные {key} извлечены за {time.time() - started:.1f} с")
+                return path
+        finally:
+            # блокировка живёт, пока ссылку ждёт хоть одна задача: словарь не растёт с каждой ссылкой
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    # ---------- вспомогательные методы ----------
+    def _evict(self) -> None:
+        """Удалить просроченные записи и самые давно использованные сверх лимита."""
+        now = time.time()
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".info.json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                entries.append((st.st_atime, path))
+
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
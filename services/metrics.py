@@ -0,0 +1,285 @@
+# services/metrics.py
+import os
+import re
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+from core.config import cfg
+from core.utils import Logger
+
+logger = Logger("Metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Длительности фаз: от обложки (доли секунды) до склейки часовых видео
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RATE_BUCKETS = tuple(mbit * 125_000 for mbit in (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500))  # байт/с
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labels: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: нужны метки {self.labels}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонный счётчик с метками."""
+
+    kind = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            self.registry.version += 1
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels(key)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами (накопительные, как в Prometheus)."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = SECONDS_BUCKETS):
+        super().__init__(*args)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Tuple[str, ...], list] = {}  # метки -> [счётчики корзин, сумма]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            self.registry.version += 1
+
+    def _samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{self._labels(key, le)} {count}"
+            yield f"{self.name}_sum{self._labels(key)} {_number(total)}"
+            yield f"{self.name}_count{self._labels(key)} {counts[-1]}"
+
+
+class MetricsRegistry:
+    """Набор метрик процесса; render() — текстовый формат Prometheus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0  # растёт с каждым изменением: файл не переписывается без нужды
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labels, buckets=buckets))
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self.lock:
+            return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Атомарная запись (для textfile-коллектора node_exporter)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+registry = MetricsRegistry()
+
+# ---------- метрики приложения ----------
+QUEUE_WAIT = registry.histogram(
+    "omnipresent_queue_wait_seconds", "Ожидание задачи в очереди пула до слота загрузки", ("lane",)
+)
+PHASE_SECONDS = registry.histogram(
+    "omnipresent_phase_seconds",
+    "Длительность фаз задачи: extract, download, postprocess, cover",
+    ("phase",),
+)
+DOWNLOADED_BYTES = registry.counter(
+    "omnipresent_downloaded_bytes_total", "Скачано байт успешными задачами", ("mode",)
+)
+THROUGHPUT = registry.histogram(
+    "omnipresent_download_throughput_bytes_per_second",
+    "Средняя скорость загрузки задачи",
+    ("mode",),
+    buckets=RATE_BUCKETS,
+)
+TASKS = registry.counter("omnipresent_tasks_total", "Завершённые задачи по итогу", ("status",))
+FAILURES = registry.counter("omnipresent_failures_total", "Ошибки задач по классу причины", ("reason",))
+COOKIE_STRATEGY = registry.histogram(
+    "omnipresent_cookie_strategy_seconds",
+    "Время стратегии извлечения cookies",
+    ("strategy", "result"),
+)
+
+# (класс, шаблон) — первый совпавший; текст ошибки — хвост вывода yt-dlp или наш итог
+_FAILURE_CLASSES = [
+    ("stall", re.compile(r"Зависание", re.I)),
+    ("rate_limited", re.compile(r"HTTP Error 429|Too Many Requests", re.I)),
+    ("forbidden", re.compile(r"HTTP Error 403|Forbidden", re.I)),
+    ("auth", re.compile(r"Sign in|cookies|login|age-restricted|confirm your age", re.I)),
+    ("unavailable", re.compile(r"unavailable|private video|not available|removed|HTTP Error 404", re.I)),
+    ("timeout", re.compile(r"timed? ?out|таймаут", re.I)),
+    ("network", re.compile(r"connection|network|resolve|unreachable|Errno", re.I)),
+    ("postprocess", re.compile(r"ffmpeg|postprocess|merg|Склейка", re.I)),
+    ("no_events", re.compile(r"Нет событий")),
+]
+
+
+def classify_failure(message: str) -> str:
+    for reason, pattern in _FAILURE_CLASSES:
+        if pattern.search(message or ""):
+            return reason
+    return "other"
+
+
+# ---------- экспорт ----------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # опрос раз в несколько секунд не засоряет download.log
+
+
+class MetricsExporter:
+    """
+    Выгрузка метрик: текстовый файл раз в interval секунд (только если что-то
+    изменилось) и, если задан порт, HTTP /metrics на 127.0.0.1.
+    """
+
+    def __init__(self, path: Optional[str], port: int = 0, interval: float = 15.0):
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self._written = -1
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+            self._thread.start()
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer(("127.0.0.1", self.port), _Handler)
+            except OSError as e:
+                logger.warning(f"Порт метрик {self.port} недоступен: {e}")
+                return
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Метрики: http://127.0.0.1:{self.port}/metrics")
+
+    def flush(self) -> None:
+        """Записать файл сейчас, если метрики изменились с прошлой записи."""
+        if not self.path or registry.version == self._written:
+            return
+        version = registry.version
+        try:
+            registry.write_textfile(self.path)
+            self._written = version
+        except OSError as e:
+            logger.warning(f"Не удалось записать метрики в {self.path}: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+_exporter: Optional[MetricsExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def start_export() -> MetricsExporter:
+    """
+    Запустить выгрузку один раз на процесс. Обе выгрузки выключены по умолчанию:
+    metrics_file (путь, относительный — от папки программы; "" — без файла),
+    metrics_port (0 — без HTTP), metrics_interval_sec.
+    """
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            path = cfg.load_setting("metrics_file", "")
+            _exporter = MetricsExporter(
+                os.path.join(cfg.base_dir, path) if path else None,
+                int(cfg.load_setting("metrics_port", 0)),
+                float(cfg.load_setting("metrics_interval_sec", 15)),
+            )
+            _exporter.start()
+        return _exporter
+
+
+def flush_export() -> None:
+    """Дописать последние значения (при остановке пула)."""
+    if _exporter is not None:
+        _exporter.flush()
@@ -0,0 +1,70 @@
+# services/playlist_expander.py
+import re
+import threading
+from collections import deque
+from typing import Iterator, Optional
+
+from services.video_downloader import VideoDownloader
+
+_COLLECTION_RE = re.compile(
+    r"youtube\.com/(playlist\b|channel/|c/|user/|@)|[?&]list=",
+    re.IGNORECASE,
+)
+
+
+def is_collection_url(url: str) -> bool:
+    """Ссылка на плейлист или канал (раскрывается в отдельные задачи)."""
+    return bool(_COLLECTION_RE.search(url))
+
+
+def entry_url(entry: dict, parent_url: str) -> Optional[str]:
+    """Ссылка на элемент плоского плейлиста."""
+    if entry.get("_type") == "url":
+        return entry.get("url")
+    page = entry.get("webpage_url")
+    # У встроенных в страницу видео своей страницы нет — берём прямую ссылку
+    return page if page and page != parent_url else entry.get("url")
+
+
+class PlaylistExpander:
+    """
+    Перебор плейлиста/канала в ссылки на отдельные видео (без Qt).
+    Вкладки канала (Видео, Shorts, Трансляции) раскрываются после перебора
+    родителя: вложенный перебор внутри внешнего держал бы второй воркер yt-dlp,
+    и несколько каналов разом занимали бы весь пул.
+    """
+
+    MAX_DEPTH = 2
+
+    def __init__(self, downloader: VideoDownloader):
+        self.downloader = downloader
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Остановить перебор (yt-dlp прерывается на следующем элементе)."""
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def urls(self, url: str) -> Iterator[str]:
+        """Ссылки на видео по мере перебора, без повторов."""
+        seen = set()
+        pending = deque([(url, 0)])  # (ссылка, глубина) — ещё не перебранные
+        while pending:
+            parent, depth = pending.popleft()
+            for entry in self.downloader.expand_playlist(parent):
+                if self._cancelled.is_set():
+                    return
+                link = entry_url(entry, parent)
+                if not link or link in seen:
+                    continue
+                seen.add(link)
+                nested = entry.get("ie_key") == "YoutubeTab" or (
+                    entry.get("_type") == "url" and is_collection_url(link)
+                )
+                if nested:
+                    if depth < self.MAX_DEPTH:
+                        pending.append((link, depth + 1))
+                else:
+                    yield link
@@ -0,0 +1,62 @@
+# services/playlist_worker.py
+import time
+from dataclasses import replace
+from typing import List
+
+from PySide6.QtCore import QObject, Signal, QRunnable
+
+from core.models import DownloadTask
+from services.video_downloader import VideoDownloader
+from services.playlist_expander import PlaylistExpander
+from core.utils import Logger
+
+logger = Logger("PlaylistExpander")
+
+
+class ExpandSignals(QObject):
+    entries = Signal(list)   # пачка DownloadTask
+    finished = Signal(int)   # число найденных видео
+
+
+class PlaylistExpandRunnable(QRunnable):
+    """
+    Раскрывает плейлист/канал в задачи по мере перебора.
+
+    Первая ссылка отдаётся сразу, чтобы загрузки начались до конца перебора,
+    дальше — пачками не больше BATCH_SIZE или раз в BATCH_INTERVAL секунд.
+    """
+
+    BATCH_SIZE = 25
+    BATCH_INTERVAL = 0.5
+
+    def __init__(self, task: DownloadTask, downloader: VideoDownloader):
+        super().__init__()
+        self.task = task
+        self.expander = PlaylistExpander(downloader)
+        self.signals = ExpandSignals()
+
+    def cancel(self) -> None:
+        self.expander.cancel()
+
+    def is_cancelled(self) -> bool:
+        return self.expander.is_cancelled()
+
+    def run(self):
+        count = 0
+        batch: List[DownloadTask] = []
+        last_emit = time.monotonic()
+        try:
+            for url in self.expander.urls(self.task.url):
+                batch.append(replace(self.task, url=url))
+                count += 1
+                now = time.monotonic()
+                if count == 1 or len(batch) >= self.BATCH_SIZE or now - last_emit >= self.BATCH_INTERVAL:
+                    self.signals.entries.emit(batch)
+                    batch, last_emit = [], now
+        except Exception as e:
+            logger.error(f"Не удалось раскрыть {self.task.url}: {e}")
+        finally:
+            if batch:
+                self.signals.entries.emit(batch)
+            logger.info(f"{self.task.url}: найдено видео {count}")
+            self.signals.finished.emit(count)
@@ -0,0 +1,57 @@
+# services/postprocess_stage.py
+import os
+import threading
+from typing import Callable, List, Optional, Set
+
+from core.config import cfg
+from core.utils import Logger
+
+logger = Logger("PostprocessStage")
+
+StageListener = Callable[[int], None]
+
+
+class PostprocessStage:
+    """
+    Вторая стадия конвейера загрузок: склейка потоков, исправления ffmpeg,
+    конвертация обложек.
+
+    Когда yt-dlp задачи переходит к постобработке, сеть ей больше не нужна:
+    задача занимает место на этой стадии (мест по числу ядер), а её слот
+    загрузки, доля скорости и фрагментов отдаются следующей задаче.
+    Если стадия заполнена, задача обрабатывается, не отдавая слот, —
+    так загрузки не обгоняют постобработку больше чем на размер стадии.
+    """
+
+    def __init__(self, slots: Optional[int] = None):
+        self.slots = max(1, slots or os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._jobs: Set[int] = set()
+        self._listeners: List[StageListener] = []
+
+    def subscribe(self, listener: StageListener) -> None:
+        """listener(idx) вызывается в потоке загрузки, когда задача перешла на стадию."""
+        self._listeners.append(listener)
+
+    def enter(self, idx: int) -> bool:
+        """Занять место для задачи. Returns: False, если стадия заполнена."""
+        with self._lock:
+            if idx in self._jobs:
+                return True
+            if len(self._jobs) >= self.slots:
+                return False
+            self._jobs.add(idx)
+            busy = len(self._jobs)
+        logger.info(f"#{idx}: загрузка завершена, постобработка ({busy}/{self.slots})")
+        for listener in self._listeners:
+            listener(idx)
+        return True
+
+    def leave(self, idx: int) -> None:
+        with self._lock:
+            self._jobs.discard(idx)
+
+
+def create_stage() -> PostprocessStage:
+    """Стадия постобработки с числом мест из настройки postprocess_slots (0 — по числу ядер)."""
+    return PostprocessStage(int(cfg.load_setting("postprocess_slots", 0)) or None)
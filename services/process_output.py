@@ -0,0 +1,80 @@
+# services/process_output.py
+import threading
+from collections import deque
+from typing import Callable, IO, Optional
+
+import psutil
+
+
+class RingBuffer:
+    """Последние строки вывода процесса. Память ограничена: max_lines × max_line_len."""
+
+    def __init__(self, max_lines: int = 200, max_line_len: int = 500):
+        self._lines: deque = deque(maxlen=max_lines)
+        self._max_line_len = max_line_len
+        self._lock = threading.Lock()
+
+    def append(self, line: str) -> None:
+        line = line.rstrip()
+        if not line:
+            return
+        with self._lock:
+            self._lines.append(line[:self._max_line_len])
+
+    def last_error(self) -> Optional[str]:
+        """Последняя строка с ERROR — она информативнее хвоста с предупреждениями."""
+        with self._lock:
+            for line in reversed(self._lines):
+                if line.startswith("ERROR"):
+                    return line
+        return None
+
+    def tail(self, max_chars: int = 150) -> str:
+        with self._lock:
+            text = "\n".join(self._lines)
+        return text[-max_chars:]
+
+    def summary(self, max_chars: int = 150) -> str:
+        """Текст для сообщения об ошибке: строка ERROR или хвост вывода."""
+        return (self.last_error() or self.tail(max_chars))[:max_chars]
+
+
+def drain_stream(
+    stream: IO[str],
+    buffer: RingBuffer,
+    on_line: Optional[Callable[[str], None]] = None,
+) -> threading.Thread:
+    """
+    Читать поток в отдельном потоке до EOF, чтобы процесс не встал
+    на заполненном буфере канала. Хранится только хвост в RingBuffer.
+    """
+
+    def _reader() -> None:
+        try:
+            for line in stream:
+                buffer.append(line)
+                if on_line:
+                    on_line(line.rstrip())
+        except (OSError, ValueError):
+            pass  # поток закрыт при завершении процесса
+
+    thread = threading.Thread(target=_reader, daemon=True)
+    thread.start()
+    return thread
+
+
+def kill_process_tree(pid: int) -> None:
+    """
+    Убить процесс вместе с потомками (ffmpeg, запущенный yt-dlp).
+    Корень не ожидается здесь: его статус забирает владелец (Popen/Process).
+    """
+    try:
+        root = psutil.Process(pid)
+        children = root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return
+    for proc in [root] + children:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
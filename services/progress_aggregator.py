@@ -0,0 +1,74 @@
+# services/progress_aggregator.py
+import threading
+from typing import Dict, List, Optional
+
+
+class ProgressState:
+    """Последнее состояние задачи. Компактно: без __dict__, обновляется на месте."""
+
+    __slots__ = ("index", "status", "percent", "speed", "eta", "message", "filename")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.status = "pending"
+        self.percent = 0.0
+        self.speed: Optional[str] = None
+        self.eta: Optional[str] = None
+        self.message = ""
+        self.filename: Optional[str] = None
+
+    def copy(self) -> "ProgressState":
+        clone = ProgressState(self.index)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
+
+
+class ProgressAggregator:
+    """
+    Сводит прогресс воркеров к последнему состоянию каждой задачи.
+
+    Воркеры только перезаписывают состояние под короткой блокировкой и никогда
+    не ждут UI; поток интерфейса забирает изменившиеся состояния по таймеру.
+    Память ограничена числом задач, а медленный UI просто реже видит обновления.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: Dict[int, ProgressState] = {}
+        self._dirty: Dict[int, None] = {}  # упорядоченное множество
+
+    def update(self, index: int, progress) -> None:
+        """Вызывается из потока загрузки для каждого события прогресса."""
+        with self._lock:
+            state = self._states.get(index)
+            if state is None:
+                state = self._states[index] = ProgressState(index)
+            state.status = progress.status
+            state.percent = progress.percent
+            state.speed = progress.speed
+            state.eta = progress.eta
+            state.message = progress.message
+            state.filename = getattr(progress, "filename", None) or state.filename
+            self._dirty[index] = None
+
+    def drain(self) -> List[ProgressState]:
+        """Изменившиеся с прошлого вызова состояния (копии) — для потока UI."""
+        with self._lock:
+            if not self._dirty:
+                return []
+            changed = [self._states[i].copy() for i in self._dirty]
+            self._dirty.clear()
+        return changed
+
+    def discard(self, index: int) -> Optional[ProgressState]:
+        """
+        Забыть задачу после завершения.
+        Returns: её последнее состояние, если UI его ещё не забрал, иначе None.
+        """
+        with self._lock:
+            state = self._states.pop(index, None)
+            if index not in self._dirty:
+                return None
+            del self._dirty[index]
+        return state
@@ -1,10 +1,10 @@
 ﻿from PySide6.QtCore import QObject, Signal, QRunnable
-from typing import List, Optional
+from concurrent.futures import Future
+from typing import Optional
 from core.models import DownloadTask, DownloadTaskResult
 from services.video_downloader import VideoDownloader, DownloadProgress
-from core.utils import Logger
-
-logger = Logger("SingleDownloadWorker")
+from services.progress_aggregator import ProgressAggregator
+from services.async_engine import AsyncDownloadEngine
 
 
 class DownloadSignals(QObject):
@@ -20,45 +20,60 @@ class SingleDownloadRunnable(QRunnable):
             task: DownloadTask,
             index: int,
             downloader: VideoDownloader,
-            handler=None
+            handler=None,
+            aggregator: Optional[ProgressAggregator] = None
     ):
         super().__init__()
         self.task = task
         self.index = index
         self.downloader = downloader
         self.handler = handler
+        self.aggregator = aggregator
         self.signals = DownloadSignals()
 
     def run(self):
-        try:
-            # Генерируем промежуточные события
-            for progress in self.downloader.download_with_progress(self.task, self.index, self.handler):
-                self.signals.progress.emit(progress)
+        on_progress = (
+            (lambda progress: self.aggregator.update(self.index, progress))
+            if self.aggregator else self.signals.progress.emit
+        )
+        result = self.downloader.run_task(self.task, self.index, self.handler, on_progress)
+        self.signals.finished.emit(result)
+
+
+class AsyncDownloadJob:
+    """
+    Задача движка asyncio с интерфейсом SingleDownloadRunnable (task, index, signals).
+    Сигналы испускаются из потока цикла событий и доставляются в поток UI очередью.
+    """
 
-                if progress.status == "finished":
-                    result = DownloadTaskResult(
-                        index=self.index,
-                        status="success",
-                        message=progress.message,
-                        cookie_source=self.downloader.cookie_source
-                    )
-                    self.signals.finished.emit(result)
-                    break
+    def __init__(
+            self,
+            task: DownloadTask,
+            index: int,
+            engine: AsyncDownloadEngine,
+            aggregator: Optional[ProgressAggregator] = None
+    ):
+        self.task = task
+        self.index = index
+        self.engine = engine
+        self.aggregator = aggregator
+        self.signals = DownloadSignals()
 
-                elif progress.status == "error":
-                    result = DownloadTaskResult(
-                        index=self.index,
-                        status="unknown",
-                        message=progress.message
-                    )
-                    self.signals.finished.emit(result)
-                    break
+    def start(self):
+        on_progress = (
+            (lambda progress: self.aggregator.update(self.index, progress))
+            if self.aggregator else self.signals.progress.emit
+        )
+        future = self.engine.submit(self.task, self.index, on_progress)
+        future.add_done_callback(self._on_done)
 
-        except Exception as e:
-            logger.error(f"Критическая ошибка в worker #{self.index}: {e}", exc=True)
+    def _on_done(self, future: Future):
+        if future.cancelled():
+            result = DownloadTaskResult(index=self.index, status="cancelled", message="⛔ Отменено")
+        elif future.exception() is not None:
             result = DownloadTaskResult(
-                index=self.index,
-                status="unknown",
-                message=f"Сбой: {e}"
+                index=self.index, status="unknown", message=f"Сбой: {future.exception()}"
             )
-            self.signals.finished.emit(result)
\ No newline at end of file
+        else:
+            result = future.result()
+        self.signals.finished.emit(result)
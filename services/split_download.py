@@ -0,0 +1,272 @@
+# services/split_download.py
+import os
+import re
+import math
+import shutil
+import subprocess
+from dataclasses import replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.config import cfg
+from core.models import DownloadTask, DownloadTaskResult
+from services.video_downloader import VideoDownloader
+from services.download_archive import DownloadArchive
+from core.utils import Logger
+
+logger = Logger("SplitDownload")
+
+MIN_PART_SECONDS = 60  # часть короче не окупает свою экстракцию и запуск ffmpeg
+PROBE_TIMEOUT = 30
+PART_TEMPLATE = "part_{:03d}.%(ext)s"
+_PART_RE = re.compile(r"part_(\d{3})\.\w+")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+_TIMEBASE_RE = re.compile(r"^#tb 0: (\d+)/(\d+)", re.MULTILINE)
+
+Keyframe = Tuple[float, float]  # (pts, dts), сек
+
+
+def can_split(task: DownloadTask) -> bool:
+    """Задачу можно качать частями: один режим, целиком, с потоками."""
+    return (
+        task.split_parts > 1
+        and task.mode != "none"
+        and not task.outputs
+        and not task.time_sections
+        and not task.resume
+    )
+
+
+# ---------- ffmpeg ----------
+def _ffmpeg(args: List[str], timeout: float) -> Optional[subprocess.CompletedProcess]:
+    try:
+        return subprocess.run(
+            [cfg.ffmpeg_path, "-hide_banner", "-nostdin", *args],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"ffmpeg: {e}")
+        return None
+
+
+def _headers_args(headers: Optional[Dict[str, str]]) -> List[str]:
+    if not headers:
+        return []
+    return ["-headers", "".join(f"{key}: {value}\r\n" for key, value in headers.items())]
+
+
+def probe_duration(url: str, headers: Optional[Dict[str, str]] = None) -> Optional[float]:
+    """Длительность по заголовку контейнера (если экстрактор её не знает)."""
+    proc = _ffmpeg([*_headers_args(headers), "-i", url], PROBE_TIMEOUT)
+    match = _DURATION_RE.search(proc.stderr) if proc else None
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_keyframe(url: str, at: float, headers: Optional[Dict[str, str]] = None) -> Optional[Keyframe]:
+    """
+    Ключевой кадр видеодорожки не позже at: (pts, dts) по шкале потока.
+    Читается один пакет — запрос на несколько килобайт, без декодирования.
+    """
+    proc = _ffmpeg([
+        "-loglevel", "error",
+        *_headers_args(headers),
+        "-ss", f"{at:.3f}",
+        "-i", url,
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-frames:v", "1",
+        "-copyts",
+        "-f", "framemd5",
+        "-",
+    ], PROBE_TIMEOUT)
+    if not proc or proc.returncode:
+        return None
+    timebase = _TIMEBASE_RE.search(proc.stdout)
+    packets = [line for line in proc.stdout.splitlines() if line and not line.startswith("#")]
+    if not timebase or not packets:
+        return None
+    num, den = int(timebase.group(1)), int(timebase.group(2))
+    fields = [field.strip() for field in packets[0].split(",")]
+    dts, pts = int(fields[1]), int(fields[2])
+    return pts * num / den, dts * num / den
+
+
+def keyframe_cuts(
+    url: str,
+    duration: float,
+    parts: int,
+    headers: Optional[Dict[str, str]] = None,
+) -> List[Tuple[float, float]]:
+    """
+    Разбить [0, duration) на parts отрезков по ключевым кадрам.
+
+    Часть начинается с ключевого кадра (его pts), а предыдущая кончается на его dts:
+    при копии потоков ffmpeg обрезает по времени декодирования, и кадры, которые
+    декодируются после ключевого, в предыдущую часть не попадают. Склейка
+    без перекодирования даёт ровно кадры исходника. Без видеодорожки
+    (аудио) каждый пакет ключевой — границы берутся как есть.
+    """
+    base = probe_keyframe(url, 0, headers)
+    offset = base[0] if base else 0.0  # шкала потока может начинаться не с нуля
+    frames: List[Keyframe] = [(0.0, 0.0)]
+    for j in range(1, parts):
+        nominal = duration * j / parts
+        if base:
+            frame = probe_keyframe(url, nominal, headers)
+            if frame is None:
+                continue  # граница без ключевого кадра дала бы повтор кадров
+            frame = (frame[0] - offset, frame[1] - offset)
+        else:
+            frame = (nominal, nominal)
+        if frame[1] > frames[-1][0]:  # длинный GOP мог свести две границы к одному кадру
+            frames.append(frame)
+
+    cuts = []
+    for j, (pts, _) in enumerate(frames):
+        # начало — вверх, конец — вниз: округление не захватывает соседний кадр
+        start = math.ceil(pts * 1e6) / 1e6
+        end = math.floor(frames[j + 1][1] * 1e6) / 1e6 if j + 1 < len(frames) else math.inf
+        cuts.append((start, end))
+    return cuts
+
+
+# ---------- разбитая загрузка ----------
+class SplitDownload:
+    """
+    Одна задача, скачиваемая частями в слотах пула (без Qt).
+
+    Части — обычные задачи с одним фрагментом, они скачиваются во временную
+    папку рядом с итоговым файлом. Пул сообщает сюда их итоги; когда пришли
+    все, finish() склеивает части ffmpeg (concat, копия потоков) в итоговый файл.
+    """
+
+    def __init__(self, index: int, task: DownloadTask, target: str, workdir: str, parts: List[DownloadTask]):
+        self.index = index  # номер итоговой задачи в пуле
+        self.task = task
+        self.target = target
+        self.workdir = workdir
+        self.parts = parts
+        self.pending: Set[int] = set()
+        self.results: Dict[int, DownloadTaskResult] = {}
+        self.cancelled = False
+
+    def attach(self, idx: int) -> None:
+        """Часть поставлена в очередь пула под номером idx."""
+        self.pending.add(idx)
+
+    def cancel(self) -> None:
+        """Загрузка отменена: finish() не склеивает, а только убирает части."""
+        self.cancelled = True
+
+    def part_finished(self, idx: int, result: DownloadTaskResult) -> bool:
+        """Учесть итог части. Returns: True, когда итоги есть у всех частей."""
+        self.pending.discard(idx)
+        self.results[idx] = result
+        return not self.pending
+
+    def failure(self) -> Optional[DownloadTaskResult]:
+        """Итог группы, если хоть одна часть не скачалась (остальные отменяются)."""
+        failed = [r for r in self.results.values() if r.status != "success"]
+        if not failed:
+            return None
+        reason = next((r for r in failed if r.status != "cancelled"), failed[0])
+        return DownloadTaskResult(index=self.index, status=reason.status, message=reason.message)
+
+    def finish(self, archive: DownloadArchive) -> DownloadTaskResult:
+        """Склеить части в итоговый файл. Временная папка удаляется в любом случае."""
+        try:
+            if self.cancelled:
+                return DownloadTaskResult(index=self.index, status="cancelled", message="⛔ Отменено")
+            failed = self.failure()
+            if failed:
+                return failed
+            files = self._part_files()
+            if len(files) != len(self.parts):
+                raise RuntimeError(f"скачано частей {len(files)} из {len(self.parts)}")
+            self._concat(files)
+            archive.record(self.task, {self.task.mode: self.target})
+            logger.info(f"#{self.index}: склеено частей {len(files)} — {os.path.basename(self.target)}")
+            return DownloadTaskResult(
+                index=self.index, status="success", message=f"✅ Готово (частей: {len(files)})"
+            )
+        except Exception as e:
+            logger.error(f"#{self.index}: не удалось склеить части: {e}")
+            return DownloadTaskResult(index=self.index, status="unknown", message=f"❌ Склейка: {e}")
+        finally:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _part_files(self) -> List[str]:
+        """Итоговые файлы частей по порядку (без .part и промежуточных форматов)."""
+        try:
+            names = os.listdir(self.workdir)
+        except OSError:
+            return []
+        return [os.path.join(self.workdir, n) for n in sorted(names) if _PART_RE.fullmatch(n)]
+
+    def _concat(self, files: List[str]) -> None:
+        if os.path.exists(self.target):
+            raise RuntimeError(f"файл уже существует: {os.path.basename(self.target)}")
+        listing = os.path.join(self.workdir, "parts.txt")
+        with open(listing, "w", encoding="utf-8") as f:
+            for path in files:
+                f.write(f"file '{os.path.basename(path)}'\n")
+        proc = _ffmpeg([
+            "-loglevel", "error",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", listing,
+            "-map", "0",
+            "-c", "copy",
+            "-n",
+            self.target,
+        ], float(cfg.load_setting("postprocess_timeout_sec", 1800)))
+        if proc is None or proc.returncode:
+            error = proc.stderr.strip()[-150:] if proc else "ffmpeg не запустился"
+            raise RuntimeError(error)
+
+
+def plan_split(downloader: VideoDownloader, index: int, task: DownloadTask) -> Optional[SplitDownload]:
+    """
+    Разбить задачу на части по ключевым кадрам. None — качать целиком
+    (короткое видео, неизвестна длительность, форматы не выбрались).
+    """
+    streams = downloader.resolve_streams(task)
+    if not streams or not streams.get("filename") or os.path.exists(streams["filename"]):
+        return None  # уже скачанный файл yt-dlp пропустит сам
+    url, headers = streams["urls"][0], streams.get("headers")
+    duration = streams.get("duration") or probe_duration(url, headers)
+    if not duration:
+        logger.info(f"#{index}: длительность неизвестна, качаем целиком")
+        return None
+    parts = min(task.split_parts, int(duration // MIN_PART_SECONDS))
+    if parts < 2:
+        return None
+
+    cuts = keyframe_cuts(url, duration, parts, headers)
+    if len(cuts) < 2:
+        return None
+    workdir = os.path.join(task.path, f".split_{index}_{os.getpid()}")
+    part_tasks = [
+        replace(
+            task,
+            path=workdir,
+            time_sections=(cut,),
+            precise_cuts=False,
+            split_parts=0,
+            download_cover=False,
+            output_template=PART_TEMPLATE.format(j),
+        )
+        for j, cut in enumerate(cuts)
+    ]
+    logger.info(
+        f"#{index}: {len(cuts)} частей по ключевым кадрам: "
+        + ", ".join(f"{start:g}-{end:g}" for start, end in cuts)
+    )
+    return SplitDownload(index, task, streams["filename"], workdir, part_tasks)
@@ -0,0 +1,50 @@
+# services/split_worker.py
+from typing import Optional
+
+from PySide6.QtCore import QObject, Signal, QRunnable
+
+from core.models import DownloadTask
+from services.video_downloader import VideoDownloader
+from services.download_archive import DownloadArchive
+from services.split_download import SplitDownload, plan_split
+from core.utils import Logger
+
+logger = Logger("SplitDownload")
+
+
+class SplitSignals(QObject):
+    planned = Signal(object)   # SplitDownload или None — качать целиком
+    finished = Signal(object)  # DownloadTaskResult склейки
+
+
+class SplitPlanRunnable(QRunnable):
+    """Выбор форматов и поиск ключевых кадров для разбитой загрузки (в фоне)."""
+
+    def __init__(self, index: int, task: DownloadTask, downloader: VideoDownloader):
+        super().__init__()
+        self.index = index
+        self.task = task
+        self.downloader = downloader
+        self.signals = SplitSignals()
+
+    def run(self):
+        plan: Optional[SplitDownload] = None
+        try:
+            plan = plan_split(self.downloader, self.index, self.task)
+        except Exception as e:
+            logger.error(f"#{self.index}: не удалось разбить {self.task.url}: {e}")
+        finally:
+            self.signals.planned.emit(plan)
+
+
+class SplitConcatRunnable(QRunnable):
+    """Склейка скачанных частей в итоговый файл."""
+
+    def __init__(self, split: SplitDownload, archive: DownloadArchive):
+        super().__init__()
+        self.split = split
+        self.archive = archive
+        self.signals = SplitSignals()
+
+    def run(self):
+        self.signals.finished.emit(self.split.finish(self.archive))
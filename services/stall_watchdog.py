@@ -0,0 +1,127 @@
+# services/stall_watchdog.py
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+from core.utils import Logger
+
+logger = Logger("StallWatchdog")
+
+StallCallback = Callable[[str], None]
+ActivityProbe = Callable[[], Optional[int]]  # растущее число (байт на диске) или None
+
+
+class _Watch:
+    __slots__ = (
+        "on_stall", "activity", "activity_mark", "phase", "downloaded",
+        "last_progress", "phase_started", "fired",
+    )
+
+    def __init__(self, on_stall: StallCallback, activity: Optional[ActivityProbe]):
+        now = time.monotonic()
+        self.on_stall = on_stall
+        self.activity = activity
+        self.activity_mark = activity() if activity else None
+        self.phase = "download"
+        self.downloaded = -1
+        self.last_progress = now
+        self.phase_started = now
+        self.fired = False
+
+
+class StallWatchdog:
+    """
+    Один поток-наблюдатель на все задачи пула.
+
+    В фазе загрузки задача считается зависшей, если число скачанных байт
+    не растёт stall_timeout секунд. Постобработка (склейка, конвертация)
+    прогресса не сообщает, поэтому у неё отдельный бюджет на всю фазу.
+    Загрузка без событий прогресса (фрагменты через ffmpeg) передаёт activity:
+    пока его значение меняется, задача не зависла. Опрашивается он только
+    по истечении stall_timeout без событий.
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, stall_timeout: float = 60, postprocess_timeout: float = 1800):
+        self.stall_timeout = stall_timeout
+        self.postprocess_timeout = postprocess_timeout
+        self._lock = threading.Lock()
+        self._watches: Dict[int, _Watch] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- публичные методы ----------
+    def register(self, idx: int, on_stall: StallCallback, activity: Optional[ActivityProbe] = None) -> None:
+        """Начать наблюдение. on_stall вызывается из потока наблюдателя один раз."""
+        watch = _Watch(on_stall, activity)  # первый замер activity — вне блокировки
+        with self._lock:
+            self._watches[idx] = watch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._monitor, daemon=True)
+                self._thread.start()
+
+    def unregister(self, idx: int) -> None:
+        with self._lock:
+            self._watches.pop(idx, None)
+
+    def touch(self, idx: int, phase: str = "download", downloaded: Optional[int] = None) -> None:
+        """Отметить событие задачи. Прогрессом считается только рост числа байт."""
+        now = time.monotonic()
+        with self._lock:
+            watch = self._watches.get(idx)
+            if watch is None:
+                return
+            if phase != watch.phase:
+                watch.phase = phase
+                watch.phase_started = now
+                watch.last_progress = now
+            if downloaded is not None and downloaded != watch.downloaded:
+                watch.downloaded = downloaded
+                watch.last_progress = now
+
+    # ---------- поток наблюдателя ----------
+    def _monitor(self) -> None:
+        while True:
+            time.sleep(self.CHECK_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    (idx, watch, reason)
+                    for idx, watch in self._watches.items()
+                    if not watch.fired and (reason := self._check(watch, now))
+                ]
+            for idx, watch, reason in due:
+                if watch.phase == "download" and self._has_activity(watch):
+                    continue
+                with self._lock:
+                    if self._watches.get(idx) is not watch or watch.fired:
+                        continue  # задача уже завершилась
+                    watch.fired = True
+                logger.warning(f"Задача #{idx}: {reason}")
+                try:
+                    watch.on_stall(reason)
+                except Exception as e:
+                    logger.error(f"Не удалось остановить зависшую задачу #{idx}: {e}")
+
+    def _has_activity(self, watch: _Watch) -> bool:
+        """Изменился ли activity с прошлого замера; если да — это прогресс."""
+        if watch.activity is None:
+            return False
+        try:
+            mark = watch.activity()
+        except Exception:
+            mark = None
+        if mark is None or mark == watch.activity_mark:
+            return False
+        with self._lock:
+            watch.activity_mark = mark
+            watch.last_progress = time.monotonic()
+        return True
+
+    def _check(self, watch: _Watch, now: float) -> Optional[str]:
+        if watch.phase == "postprocess":
+            if now - watch.phase_started > self.postprocess_timeout:
+                return f"обработка дольше {self.postprocess_timeout:.0f} с"
+        elif now - watch.last_progress > self.stall_timeout:
+            return f"нет прогресса {self.stall_timeout:.0f} с"
+        return None
@@ -0,0 +1,228 @@
+# services/stream_cache.py
+import os
+import re
+import json
+import time
+import shutil
+import pathlib
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.config import cfg
+from core.utils import Logger
+
+logger = Logger("StreamCache")
+
+MB = 1024 * 1024
+_UNSAFE_RE = re.compile(r"[^0-9A-Za-z_-]")
+# Поля фрагментированной раздачи: кэшированный поток — один локальный файл
+_REMOTE_FIELDS = ("fragments", "fragment_base_url", "manifest_url", "downloader_options")
+
+
+def video_key(info: dict) -> Optional[str]:
+    """Ключ видео между сессиями: экстрактор + ID (ссылки на потоки меняются)."""
+    extractor, video_id = info.get("extractor_key") or info.get("extractor"), info.get("id")
+    if not extractor or not video_id:
+        return None
+    return _UNSAFE_RE.sub("_", f"{extractor}_{video_id}".lower())
+
+
+class StreamCache:
+    """
+    Дисковый кэш исходных потоков между сессиями: (видео, format_id) -> файл.
+
+    Скачанные целиком потоки остаются здесь вместо удаления после склейки.
+    Следующая задача по тому же видео — другой режим или другой фрагмент —
+    получает info.json, где у кэшированных форматов ссылка заменена на локальный
+    файл: yt-dlp выбирает форматы как обычно, но читает их с диска.
+    Размер ограничен (stream_cache_mb, по умолчанию 0 — кэш выключен), вытесняются
+    давно использованные потоки: atime файла — последнее обращение, как в MetadataCache.
+    """
+
+    CACHE_DIR = os.path.join(cfg.base_dir, ".stream_cache")
+    DEFAULT_MB = 0  # кэш включается настройкой: он держит гигабайты на диске
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or cfg.load_setting("stream_cache_dir") or self.CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(cfg.load_setting("stream_cache_mb", self.DEFAULT_MB)) * MB
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._leases: Dict[int, Tuple[Optional[str], Set[str]]] = {}  # idx -> (info.json, файлы)
+        # копирование на другой диск — вне слота загрузки, по одному файлу
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-cache")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ---------- выдача ----------
+    def formats(self, key: str) -> Dict[str, str]:
+        """Кэшированные потоки видео: {format_id: путь}."""
+        folder = os.path.join(self.cache_dir, key)
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return {}
+        found = {}
+        for name in names:
+            format_id, dot, ext = name.rpartition(".")
+            if dot and format_id and not name.endswith(".tmp"):
+                found[format_id] = os.path.join(folder, name)
+        return found
+
+    def serve(self, idx: int, info_json: str, sections: bool = False) -> Tuple[Optional[str], str]:
+        """
+        Подготовить задачу idx. Returns: (ключ видео, info.json для загрузки) —
+        копия с локальными файлами вместо ссылок или исходный путь, если в кэше
+        ничего нет. Выданные файлы не вытесняются до release(idx).
+
+        sections — задача режет фрагменты: поток читает ffmpeg, который получает
+        file: URL как есть, без раскодирования. Путь с пробелом, кириллицей или %
+        ему не выдаётся — такой поток скачивается из сети.
+        """
+        try:
+            with open(info_json, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None, info_json
+        key = video_key(info)
+        cached = self.formats(key) if key else {}
+        served: Set[str] = set()
+        for fmt in info.get("formats") or []:
+            path = cached.get(_UNSAFE_RE.sub("_", str(fmt.get("format_id"))))
+            if not path:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            uri = pathlib.Path(path).as_uri()
+            if sections and "%" in uri:
+                logger.debug(f"#{idx}: путь кэша требует кодирования, ffmpeg его не откроет: {path}")
+                continue
+            fmt["url"] = uri
+            fmt["protocol"] = "https"  # обычная загрузка одним файлом
+            fmt["filesize"] = size
+            for field in _REMOTE_FIELDS:
+                fmt.pop(field, None)
+            served.add(path)
+        if not served:
+            return key, info_json
+
+        now = time.time()
+        for path in served:
+            try:
+                os.utime(path, (now, os.stat(path).st_mtime))
+            except OSError:
+                pass
+        fd, patched = tempfile.mkstemp(prefix=f".serve_{idx}_", suffix=".info.json", dir=self.cache_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        with self._lock:
+            self._leases[idx] = (patched, served)
+        logger.info(f"#{idx}: потоков из кэша: {len(served)} ({key})")
+        return key, patched
+
+    def release(self, idx: int) -> None:
+        """Задача больше не читает выданные файлы."""
+        with self._lock:
+            patched, _ = self._leases.pop(idx, (None, set()))
+        if patched:
+            try:
+                os.remove(patched)
+            except OSError:
+                pass
+
+    # ---------- пополнение ----------
+    def store(self, key: str, format_id: str, path: str, move: bool) -> None:
+        """
+        Положить скачанный целиком поток в кэш. move=True — файл нужен только
+        кэшу и переносится; иначе (файл пользователя) — жёсткая ссылка или копия.
+        """
+        ext = path.rsplit(".", 1)[-1] if "." in os.path.basename(path) else "bin"
+        folder = os.path.join(self.cache_dir, key)
+        target = os.path.join(folder, f"{_UNSAFE_RE.sub('_', format_id)}.{ext}")
+        try:
+            # Поток уже в кэше (пришёл из него) или больше всего кэша и вытеснил бы
+            # всё остальное. Файл, оставленный только для кэша, удаляется, как удалил бы yt-dlp
+            if os.path.exists(target) or os.path.getsize(path) > self.max_bytes:
+                if move:
+                    os.remove(path)
+                return
+            os.makedirs(folder, exist_ok=True)
+            tmp = target + ".tmp"
+            try:
+                if move:
+                    os.replace(path, tmp)
+                else:
+                    os.link(path, tmp)
+            except OSError:
+                # другой диск или ФС без ссылок: копия гигабайтов не держит слот загрузки
+                context = contextvars.copy_context()
+                self._executor.submit(context.run, self._copy_in, key, format_id, path, tmp, target, move)
+                return
+            os.replace(tmp, target)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить поток {key}/{format_id} в кэш: {e}")
+            return
+        self._stored(key, format_id)
+
+    def _copy_in(self, key: str, format_id: str, path: str, tmp: str, target: str, move: bool) -> None:
+        """Скопировать поток в кэш в фоне; перенесённый исходник удаляется."""
+        try:
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+            if move:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить поток {key}/{format_id} в кэш: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._stored(key, format_id)
+
+    def _stored(self, key: str, format_id: str) -> None:
+        logger.info(f"Поток {key}/{format_id} сохранён в кэш")
+        self._evict()
+
+    # ---------- вытеснение ----------
+    def _evict(self) -> None:
+        """Удалять давно использованные потоки, пока кэш больше лимита."""
+        with self._lock:
+            pinned = {path for _, paths in self._leases.values() for path in paths}
+        entries: List[Tuple[float, int, str]] = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            if root == self.cache_dir:
+                continue  # копии info.json выдаваемых задач
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                total += st.st_size
+                entries.append((st.st_atime, st.st_size, path))
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in pinned:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            logger.info(f"Поток вытеснен из кэша: {os.path.relpath(path, self.cache_dir)}")
+            try:
+                os.rmdir(os.path.dirname(path))  # пустая папка видео
+            except OSError:
+                pass
@@ -0,0 +1,161 @@
+# services/task_scheduler.py
+import re
+import time
+import heapq
+import itertools
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.models import DownloadTask
+from services.metadata_cache import MetadataCache
+from services.metrics import QUEUE_WAIT
+
+# Оценки без метаданных, байт
+DEFAULT_BYTES = {
+    "none": 200_000,
+    "audio": 5_000_000,
+    "video": 200_000_000,
+    "together": 250_000_000,
+}
+SMALL_MODES = ("audio", "none")
+
+_HEIGHT_RE = re.compile(r"height\s*(<=|=)\s*(\d+)")
+
+
+def _format_bytes(fmt: dict, duration: Optional[float]) -> float:
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if not size and fmt.get("tbr") and duration:
+        size = fmt["tbr"] * 125 * duration  # кбит/с → байт
+    return size or 0
+
+
+def estimate_bytes(task: DownloadTask, info: Optional[dict]) -> float:
+    """Ожидаемый объём загрузки задачи: по форматам из метаданных или по режиму."""
+    if task.mode == "none":
+        return DEFAULT_BYTES["none"]
+
+    size = 0.0
+    duration = info.get("duration") if info else None
+    if info and info.get("formats"):
+        limit = _HEIGHT_RE.search(task.quality_format or "")
+        audio, video = [], []
+        for fmt in info["formats"]:
+            vcodec, acodec = fmt.get("vcodec"), fmt.get("acodec")
+            if vcodec == "none" and acodec not in (None, "none"):
+                audio.append(_format_bytes(fmt, duration))
+            elif vcodec not in (None, "none"):
+                height = fmt.get("height") or 0
+                if limit and height and height > int(limit.group(2)):
+                    continue
+                video.append(_format_bytes(fmt, duration))
+        best_audio, best_video = max(audio, default=0), max(video, default=0)
+        size = {
+            "audio": best_audio,
+            "video": best_video,
+            "together": best_audio + best_video,
+        }.get(task.mode, 0)
+    if not size:
+        size = DEFAULT_BYTES.get(task.mode, DEFAULT_BYTES["together"])
+
+    if task.time_sections:
+        length = sum(max(0, end - start) for start, end in task.time_sections)
+        # без длительности считаем эталонное видео 10 минут
+        size *= min(1.0, length / (duration or 600))
+    return size
+
+
+class TaskScheduler:
+    """
+    Очередь задач пула: сначала короткие (по ожидаемому объёму).
+
+    Ключ кучи — объём + AGING_BYTES_PER_SEC × время постановки, поэтому каждая
+    секунда ожидания равносильна уменьшению задачи на AGING_BYTES_PER_SEC байт
+    и большие задачи не голодают. Мелкие задачи (аудио, обложки) лежат в отдельной
+    полосе: последние RESERVED_SMALL слотов всегда оставлены за ними, большие задачи
+    их не занимают, даже когда мелких в очереди нет (если слотов больше резерва).
+    """
+
+    AGING_BYTES_PER_SEC = 1_000_000
+    RESERVED_SMALL = 1
+
+    def __init__(self, metadata_cache: Optional[MetadataCache] = None):
+        self.metadata_cache = metadata_cache
+        self._heaps: Dict[bool, List[list]] = {True: [], False: []}  # small -> куча
+        self._entries: Dict[int, list] = {}  # idx -> [key, seq, idx, task, время постановки]
+        self._seq = itertools.count()
+        self._estimates: Dict[Tuple[str, str, str, Optional[tuple]], float] = {}
+
+    # ---------- интерфейс очереди ----------
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def __iter__(self) -> Iterator[Tuple[int, DownloadTask]]:
+        """Задачи в порядке приоритета."""
+        for _, _, idx, task, _ in sorted(self._entries.values()):
+            yield idx, task
+
+    def clear(self) -> None:
+        self._heaps = {True: [], False: []}
+        self._entries.clear()
+        self._estimates.clear()
+
+    # ---------- публичные методы ----------
+    @staticmethod
+    def is_small(task: DownloadTask) -> bool:
+        return task.mode in SMALL_MODES
+
+    def push(self, idx: int, task: DownloadTask) -> None:
+        now = time.monotonic()
+        key = self.estimate(task) + self.AGING_BYTES_PER_SEC * now
+        entry = [key, next(self._seq), idx, task, now]
+        self._entries[idx] = entry
+        heapq.heappush(self._heaps[self.is_small(task)], entry)
+
+    def pop(self, large_running: int, slots: int) -> Optional[Tuple[int, DownloadTask]]:
+        """
+        Следующая задача для свободного слота.
+        large_running — сколько больших задач уже выполняется.
+        None — очередь пуста или свободны только слоты, оставленные мелким задачам.
+        """
+        small = self._peek(True)
+        large = self._peek(False)
+        lane_full = large_running >= slots - self.RESERVED_SMALL
+        if small is None:
+            # резервные слоты не отдаём большим задачам; при слотах <= резерва его нет
+            if large is None or (lane_full and slots > self.RESERVED_SMALL):
+                return None
+            entry = large
+        elif large is None or lane_full or small[:2] < large[:2]:
+            entry = small
+        else:
+            entry = large
+        heapq.heappop(self._heaps[entry is small])
+        del self._entries[entry[2]]
+        QUEUE_WAIT.observe(
+            time.monotonic() - entry[4], lane="small" if entry is small else "large"
+        )
+        return entry[2], entry[3]
+
+    def remove(self, idx: int) -> bool:
+        """Убрать задачу из очереди (из кучи удаляется лениво)."""
+        entry = self._entries.pop(idx, None)
+        if entry is None:
+            return False
+        entry[3] = None
+        return True
+
+    def estimate(self, task: DownloadTask) -> float:
+        key = (task.url, task.mode, task.quality_format, task.time_sections)
+        if key not in self._estimates:
+            info = self.metadata_cache.load(task.url) if self.metadata_cache else None
+            self._estimates[key] = estimate_bytes(task, info)
+        return self._estimates[key]
+
+    # ---------- вспомогательные методы ----------
+    def _peek(self, small: bool) -> Optional[list]:
+        heap = self._heaps[small]
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)  # удалённая через remove()
+        return heap[0] if heap else None
@@ -1,17 +1,108 @@
 ﻿import os
 import re
+import glob
 import json
+import time
+import threading
 import subprocess
 from datetime import datetime
-from typing import List, Optional, Literal, Iterator, Protocol
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Literal, Iterator, Protocol, Set
 from dataclasses import dataclass
 
 from core.config import cfg
+from core.models import DownloadTask, DownloadTaskResult
 from services.cookie_manager import CookieManager
-from core.utils import Logger
+from services.ytdlp_farm import YtDlpWorkerFarm
+from services.metadata_cache import MetadataCache
+from services.download_planner import build_format, derive_outputs, is_single_pass
+from services.fragment_tuner import FragmentTuner
+from services.bandwidth_governor import BandwidthGovernor
+from services.process_output import RingBuffer, drain_stream, kill_process_tree
+from services.stall_watchdog import StallWatchdog
+from services.download_archive import DownloadArchive
+from services.postprocess_stage import PostprocessStage
+from services.stream_cache import StreamCache
+from services.cover_fetcher import CoverFetcher
+from services.metrics import (
+    DOWNLOADED_BYTES,
+    FAILURES,
+    PHASE_SECONDS,
+    TASKS,
+    THROUGHPUT,
+    classify_failure,
+)
+from core.utils import Logger, log_context, set_log_phase
 
 logger = Logger("VideoDownloader")
 
+# Прогресс для запуска через yt-dlp.exe: одна JSON-строка на обновление
+PROGRESS_TEMPLATE = (
+    '{"status":%(progress.status)j,'
+    '"downloaded":%(progress.downloaded_bytes)j,'
+    '"total":%(progress.total_bytes,progress.total_bytes_estimate)j,'
+    '"speed":%(progress.speed)j,'
+    '"eta":%(progress.eta)j,'
+    '"fragments":%(progress.fragment_count)j,'
+    '"filename":%(progress.filename)j,'
+    '"format_id":%(info.format_id)j}'
+)
+# Начало постобработки (как postprocessor_hooks в воркере пула). Печатается в stdout
+# до склейки и исправлений; шаблон прогресса постобработки ушёл бы в stderr
+POSTPROCESS_TEMPLATE = 'post_process:{"postprocessor":null,"status":"started"}'
+# Итоговый файл после постобработки (как post_hooks в воркере пула)
+MOVED_TEMPLATE = 'after_move:{"filepath":%(filepath)j}'
+# Выбранные форматы без загрузки (resolve_streams)
+STREAMS_TEMPLATE = (
+    '{"filename":%(filename)j,'
+    '"urls":%(urls)j,'
+    '"headers":%(http_headers)j,'
+    '"duration":%(duration)j}'
+)
+_NA_RE = re.compile(r':NA(?=[,}])')
+# Строки прогресса в тексте yt-dlp/ffmpeg: в журнал — с прореживанием
+_PROGRESS_LINE_RE = re.compile(r"^\[download\]\s+[\d.]+%|^(?:frame|size)=\s*\d")
+# Аргументы отдельного процесса yt-dlp: прогресс и итоговые файлы JSON-строками в stdout
+SUBPROCESS_OUTPUT_ARGS = [
+    "--progress-template", PROGRESS_TEMPLATE,
+    "--print", POSTPROCESS_TEMPLATE,
+    "--print", MOVED_TEMPLATE,
+    "--progress",  # --print включает тихий режим, прогресс возвращаем
+    "--newline",
+]
+
+
+def _format_speed(speed: Optional[float]) -> str:
+    if not speed:
+        return "—"
+    for unit in ("B/s", "KiB/s", "MiB/s"):
+        if speed < 1024:
+            return f"{speed:.1f} {unit}"
+        speed /= 1024
+    return f"{speed:.1f} GiB/s"
+
+
+def _format_eta(eta: Optional[float]) -> str:
+    if eta is None:
+        return "—"
+    minutes, seconds = divmod(int(eta), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def output_logger(idx: Optional[int]) -> Callable[[str], None]:
+    """
+    Запись строк вывода yt-dlp задачи idx в журнал (log_ytdlp_output).
+    Вызывается и из потока чтения stderr, где контекста задачи нет: номер — явно.
+    """
+    def log_line(line: str) -> None:
+        if _PROGRESS_LINE_RE.match(line):
+            logger.progress(f"[yt-dlp] {line}", task=idx)
+        else:
+            logger.info(f"[yt-dlp] {line}", task=idx)
+    return log_line
+
+
 # ---------- протоколы ----------
 class DownloadEventHandler(Protocol):
     def on_cookie_missing(self) -> bool: ...
@@ -19,40 +110,78 @@ class DownloadEventHandler(Protocol):
     def on_task_finished(self, result: "DownloadTaskResult") -> None: ...
 
 # ---------- модели ----------
-@dataclass
-class DownloadTask:
-    url: str
-    path: str
-    mode: Literal["audio", "video", "together", "none"]
-    quality_format: str
-    time_section: Optional[tuple[int, int]] = None
-    download_cover: bool = False
-
-
 @dataclass
 class DownloadProgress:
     index: int
-    status: Literal["pending", "downloading", "converting", "finished", "error"]
+    status: Literal["pending", "downloading", "converting", "finished", "error", "cancelled"]
     percent: float = 0.0
     speed: Optional[str] = None
     eta: Optional[str] = None
     message: str = ""
+    filename: Optional[str] = None
 
 
-@dataclass
-class DownloadTaskResult:
-    index: int
-    status: Literal["success", "auth_error", "network_error", "unknown"]
-    message: str
-    cookie_source: Optional[str] = None
+class DownloadRun:
+    """Накопленное за одну загрузку: файлы, скорости и хвост вывода текущей попытки."""
+
+    def __init__(self, single_pass: bool = True):
+        self.single_pass = single_pass  # один элемент формата: после постобработки сеть не нужна
+        self.postprocessing = False  # задача передана на стадию постобработки
+        self.files: List[str] = []
+        self.streams: Dict[str, str] = {}  # скачанный поток -> format_id
+        self.video_key: Optional[str] = None  # ключ видео в кэше потоков
+        self.keep_streams = False  # -k добавлен ради кэша: промежуточные потоки переносятся в него
+        self.moved: List[str] = []  # итоговые файлы после постобработки
+        self.sizes: Dict[str, int] = {}  # скачанный поток -> байт
+        self.started = time.monotonic()
+        self.postprocess_at: Optional[float] = None  # начало склейки/конвертации
+        self.partial: Set[str] = set()  # все файлы, которые начинали скачиваться
+        self.speeds: List[float] = []
+        self.fragmented = False
+        self.output = RingBuffer()  # хвост вывода yt-dlp для текста ошибки
+        self.stalled: List[str] = []
+        self.result: Optional[DownloadProgress] = None  # итог попытки (finish_attempt)
+
+    def new_attempt(self) -> None:
+        self.output = RingBuffer()
+        self.stalled = []
+        self.result = None
 
 
 # ---------- основной класс ----------
 class VideoDownloader:
-    def __init__(self, cookie_manager: Optional[CookieManager] = None):
+    MAX_STALL_RETRIES = 2
+    EXTRACT_TIMEOUT = 120  # сек на экстракцию страницы
+
+    def __init__(
+        self,
+        cookie_manager: Optional[CookieManager] = None,
+        farm: Optional[YtDlpWorkerFarm] = None,
+        metadata_cache: Optional[MetadataCache] = None,
+        fragment_tuner: Optional[FragmentTuner] = None,
+        bandwidth_governor: Optional[BandwidthGovernor] = None,
+        watchdog: Optional[StallWatchdog] = None,
+        archive: Optional[DownloadArchive] = None,
+        postprocess_stage: Optional[PostprocessStage] = None,
+        stream_cache: Optional[StreamCache] = None,
+        cover_fetcher: Optional[CoverFetcher] = None,
+    ):
         self.cookie_manager = cookie_manager or CookieManager()
+        self.farm = farm
+        self.metadata_cache = metadata_cache or MetadataCache()
+        self.fragment_tuner = fragment_tuner or FragmentTuner()
+        self.bandwidth_governor = bandwidth_governor or BandwidthGovernor()
+        self.watchdog = watchdog or StallWatchdog()
+        self.archive = archive or DownloadArchive()
+        self.postprocess_stage = postprocess_stage
+        self.stream_cache = stream_cache or StreamCache()
+        self.cover_fetcher = cover_fetcher or CoverFetcher(self.metadata_cache, self._resolve_info_json)
         self.cookie_source: Optional[str] = None
-        self._cancelled = False
+        self._lock = threading.Lock()
+        self._active: Set[int] = set()
+        self._expected: Set[int] = set()  # переданы пулу, но ещё не начаты
+        self._cancelled: Set[int] = set()
+        self._processes: Dict[int, Any] = {}  # Popen или asyncio.subprocess.Process
 
     # ---------- публичный метод для одной задачи с прогрессом ----------
     def download_with_progress(
@@ -62,119 +191,764 @@ class VideoDownloader:
         handler: Optional[DownloadEventHandler] = None,
     ) -> Iterator[DownloadProgress]:
         """Генератор, выдающий промежуточное состояние загрузки."""
-        self._cancelled = False
+        self._begin_job(idx)
+        try:
+            yield from self._download(task, idx, handler)
+        finally:
+            self._end_job(idx)
 
-        # 1. Обложка (если нужна)
-        if task.download_cover:
+    def run_task(
+        self,
+        task: DownloadTask,
+        idx: int,
+        handler: Optional[DownloadEventHandler] = None,
+        on_progress: Optional[Callable[[DownloadProgress], None]] = None,
+    ) -> DownloadTaskResult:
+        """Выполнить задачу целиком и вернуть итог (для пулов без генераторов)."""
+        with log_context(task=idx, url=task.url):
             try:
-                self._download_cover(task.url, task.path)
-                yield DownloadProgress(
-                    index=idx, status="finished", message=f"Обложка #{idx} сохранена"
-                )
+                # Итог задачи определяется последним событием: обложка сообщает
+                # о себе до итога основной загрузки
+                last: Optional[DownloadProgress] = None
+                for progress in self.download_with_progress(task, idx, handler):
+                    last = progress
+                    if on_progress:
+                        on_progress(progress)
+                return self._task_result(idx, last)
+
             except Exception as e:
-                logger.warning(f"Ошибка обложки #{idx}: {e}")
-                yield DownloadProgress(
-                    index=idx, status="error", message=f"Ошибка обложки #{idx}"
-                )
+                logger.error(f"Критическая ошибка в задаче #{idx}: {e}", exc=True)
+                return DownloadTaskResult(index=idx, status="unknown", message=f"Сбой: {e}")
+
+    def _task_result(self, idx: int, last: Optional[DownloadProgress]) -> DownloadTaskResult:
+        """Итог задачи по её последнему событию."""
+        if last is not None and last.status == "finished":
+            result = DownloadTaskResult(
+                index=idx,
+                status="success",
+                message=last.message,
+                cookie_source=self.cookie_source
+            )
+        elif last is not None and last.status == "cancelled":
+            result = DownloadTaskResult(index=idx, status="cancelled", message=last.message)
+        else:
+            result = DownloadTaskResult(
+                index=idx,
+                status="unknown",
+                message=last.message if last else "Нет событий загрузки"
+            )
+        TASKS.inc(status=result.status)
+        if result.status == "unknown":
+            FAILURES.inc(reason=classify_failure(result.message))
+        return result
+
+    def expect(self, idx: int) -> None:
+        """
+        Задача передана пулу и скоро начнётся. Отмена до её старта
+        запоминается: задача сразу завершится "cancelled".
+        """
+        with self._lock:
+            self._expected.add(idx)
+
+    def _begin_job(self, idx: int) -> None:
+        with self._lock:
+            self._expected.discard(idx)
+            self._active.add(idx)  # отмену, пришедшую до старта, не сбрасываем
+
+    def _end_job(self, idx: int) -> None:
+        with self._lock:
+            self._active.discard(idx)
+            self._cancelled.discard(idx)
+        if self.postprocess_stage:
+            self.postprocess_stage.leave(idx)
+        self.stream_cache.release(idx)
 
+    def _download(
+        self,
+        task: DownloadTask,
+        idx: int,
+        handler: Optional[DownloadEventHandler],
+    ) -> Iterator[DownloadProgress]:
+        if self._is_cancelled(idx):  # отменена, пока ждала старта
+            yield self._cancelled_progress(idx)
+            return
+
+        # 1. Только обложка: yt-dlp не запускается
         if task.mode == "none":
+            set_log_phase("cover")
+            if task.download_cover and not self._is_cancelled(idx):
+                yield self._cover_progress(idx, self.cover_fetcher.submit(task.url, task.path))
+            if self._is_cancelled(idx):
+                yield self._cancelled_progress(idx)
             return
 
-        # 2. Собираем команду
-        cmd = self._build_command(task, idx, handler)
-        logger.info(f"Команда yt-dlp: {' '.join(cmd)}")
+        # 2. Метаданные: одна экстракция на видео, остальные задачи берут их из кэша
+        set_log_phase("extract")
+        info_json = self._resolve_info_json(task.url, idx)
+        set_log_phase("download")
 
-        # 3. Запускаем процесс с JSON-прогрессом
-        cmd.extend([
-            "--progress-template",
-            '{"status":"%(progress.status)s",'
-            '"downloaded":%(progress.downloaded_bytes)s,'
-            '"total":%(progress.total_bytes)s,'
-            '"speed":"%(progress.speed)s",'
-            '"eta":"%(progress.eta)s"}'
-        ])
+        # 3. Обложка качается в фоне, параллельно с видео. Её событие выдаётся
+        # перед итоговым: итог задачи — по основной загрузке
+        cover = None
+        if task.download_cover and not self._is_cancelled(idx):
+            cover = self.cover_fetcher.submit(task.url, task.path, info_json)
+        for progress in self._download_media(task, idx, handler, info_json):
+            if progress.status in ("finished", "error", "cancelled") and cover is not None:
+                if not self._is_cancelled(idx):
+                    yield self._cover_progress(idx, cover)
+                cover = None
+            yield progress
 
-        yield DownloadProgress(index=idx, status="downloading", message="Старт...")
+    @staticmethod
+    def _cover_progress(idx: int, cover: "Future[str]") -> DownloadProgress:
+        """Дождаться обложки и сообщить об итоге."""
+        try:
+            cover.result()
+            return DownloadProgress(index=idx, status="finished", message=f"Обложка #{idx} сохранена")
+        except Exception as e:
+            logger.warning(f"Ошибка обложки #{idx}: {e}")
+            return DownloadProgress(index=idx, status="error", message=f"Ошибка обложки #{idx}")
 
+    def _download_media(
+        self,
+        task: DownloadTask,
+        idx: int,
+        handler: Optional[DownloadEventHandler],
+        info_json: Optional[str],
+    ) -> Iterator[DownloadProgress]:
+        if self._is_cancelled(idx):
+            yield self._cancelled_progress(idx)
+            return
+
+        # Собираем команду
+        run = DownloadRun(is_single_pass(task))
         try:
+            cmd = self.prepare_command(task, idx, handler, info_json, run)
+
+            yield DownloadProgress(index=idx, status="downloading", message="Старт...")
+
+            # Запускаем yt-dlp (воркер пула или отдельный процесс)
+            for progress in self.attempts(task, idx, run):
+                if progress is not None:
+                    yield progress
+                    continue
+                for event in self._run_yt_dlp(cmd, job_id=idx, output=run.output):
+                    if event.get("event") == "done":
+                        self.finish_attempt(task, idx, run, event, info_json)
+                    else:
+                        progress = self.apply_event(idx, run, event)
+                        if progress:
+                            yield progress
+        except Exception as e:
+            logger.error(f"Критическая ошибка #{idx}: {e}")
+            yield DownloadProgress(index=idx, status="error", message=f"Сбой: {e}")
+        finally:
+            self._release_resources(idx, run)
+
+    # ---------- попытки загрузки (общие для всех движков) ----------
+    def attempts(self, task: DownloadTask, idx: int, run: "DownloadRun") -> Iterator[Optional[DownloadProgress]]:
+        """
+        Цикл попыток загрузки. None — движку запустить yt-dlp: события передаются
+        в apply_event, событие done — в finish_attempt. Остальное — прогресс для UI,
+        последним идёт итог. Зависшую попытку наблюдатель убивает, и она
+        повторяется: .part докачивается.
+        """
+        for attempt in range(self.MAX_STALL_RETRIES + 1):
+            if self._is_cancelled(idx):
+                yield self._cancelled_progress(idx)
+                return
+            run.new_attempt()
+            self.watchdog.register(
+                idx, lambda reason: self._on_stall(idx, run.stalled, reason), self._output_activity(task)
+            )
+            try:
+                yield None
+            finally:
+                self.watchdog.unregister(idx)
+            if run.result is not None:
+                yield run.result
+                return
+
+            if attempt < self.MAX_STALL_RETRIES:
+                yield self._retry_progress(idx, run, attempt)
+        yield DownloadProgress(index=idx, status="error", message=f"❌ Зависание: {run.stalled[0]}")
+
+    def apply_event(self, idx: int, run: "DownloadRun", event: dict) -> Optional[DownloadProgress]:
+        """Учесть событие yt-dlp (кроме done); вернуть прогресс для UI, если он есть."""
+        if self._is_cancelled(idx):
+            self._kill_job(idx)  # отмена пришла раньше, чем запустился процесс
+            return None
+        kind = event.get("event")
+        if kind == "progress":
+            if event.get("speed"):
+                run.speeds.append(event["speed"])
+                self.bandwidth_governor.report(idx, event["speed"])
+            run.fragmented = run.fragmented or bool(event.get("fragments"))
+            finished = event.get("status") == "finished"
+            if event.get("filename"):
+                run.partial.add(event["filename"])
+                size = event.get("downloaded") or event.get("total")
+                if size:
+                    run.sizes[event["filename"]] = size
+                if finished:
+                    run.files.append(event["filename"])
+                    if event.get("format_id"):
+                        run.streams[event["filename"]] = str(event["format_id"])
+            # после скачивания потока начинается склейка/конвертация
+            self.watchdog.touch(
+                idx,
+                "postprocess" if finished else "download",
+                event.get("downloaded"),
+            )
+        elif kind == "postprocess":
+            self.watchdog.touch(idx, "postprocess")
+            if run.postprocess_at is None:
+                run.postprocess_at = time.monotonic()
+                set_log_phase("postprocess")
+            if event.get("status") == "started":
+                self._enter_postprocess(idx, run)
+        elif kind == "moved" and event.get("filepath"):
+            run.moved.append(event["filepath"])
+        elif kind == "log":
+            level, msg = event.get("level", "").upper(), event.get("msg", "")
+            run.output.append(msg if msg.startswith(level) else f"{level}: {msg}")
+            return None
+        return self._progress_from_event(idx, event)
+
+    def finish_attempt(
+        self,
+        task: DownloadTask,
+        idx: int,
+        run: "DownloadRun",
+        event: dict,
+        info_json: Optional[str],
+    ) -> Optional[DownloadProgress]:
+        """
+        Итог попытки по событию done (он же — в run.result); None — попытка зависла
+        и будет повторена. Блокируется на разборе выходов и записи в архив и кэш.
+        """
+        run.result = self._attempt_result(task, idx, run, event, info_json)
+        return run.result
+
+    def _attempt_result(
+        self,
+        task: DownloadTask,
+        idx: int,
+        run: "DownloadRun",
+        event: dict,
+        info_json: Optional[str],
+    ) -> Optional[DownloadProgress]:
+        if self._is_cancelled(idx):
+            self._cleanup_partial(idx, run.partial)
+            return self._cancelled_progress(idx)
+        if run.stalled:
+            return None
+        if event.get("returncode") == 0:
+            self._record_metrics(task, run)
+            self._cache_streams(task, run)  # до разбора -k: потоки ещё на своих местах
+            # без -k раздельные файлы yt-dlp пишет сразу итоговыми: разбирать нечего
+            keep_parts = bool(task.outputs) and build_format(task)[1]
+            produced = self._derive_outputs(task, idx, run.files, info_json) if keep_parts else []
+            self.archive.record(task, self._output_paths(task, run.moved or run.files, produced))
+            return DownloadProgress(index=idx, status="finished", message="✅ Готово")
+        err = (event.get("error") or run.output.summary())[:150]
+        return DownloadProgress(index=idx, status="error", message=f"❌ {err}")
+
+    @staticmethod
+    def _record_metrics(task: DownloadTask, run: "DownloadRun") -> None:
+        """Фазы загрузки и постобработки, объём и скорость успешной задачи."""
+        now = time.monotonic()
+        downloading = (run.postprocess_at or now) - run.started
+        PHASE_SECONDS.observe(downloading, phase="download")
+        if run.postprocess_at is not None:
+            PHASE_SECONDS.observe(now - run.postprocess_at, phase="postprocess")
+        size = sum(run.sizes.values())
+        if size:
+            DOWNLOADED_BYTES.inc(size, mode=task.mode)
+            if downloading > 0:
+                THROUGHPUT.observe(size / downloading, mode=task.mode)
+
+    def _cache_streams(self, task: DownloadTask, run: "DownloadRun") -> None:
+        """Скачанные целиком потоки — в кэш: файлы пользователя ссылкой, остальные переносом."""
+        if not (run.video_key and self._caches_streams(task)):
+            return
+        final = set(run.moved)
+        for path, format_id in run.streams.items():
+            if os.path.exists(path):
+                move = run.keep_streams and path not in final
+                self.stream_cache.store(run.video_key, format_id, path, move)
+
+    def _caches_streams(self, task: DownloadTask) -> bool:
+        """Фрагменты скачиваются частично — такой поток кэшу не годится."""
+        return self.stream_cache.enabled and task.mode != "none" and not task.time_sections
+
+    def _enter_postprocess(self, idx: int, run: "DownloadRun") -> None:
+        """
+        Потоки скачаны, дальше только ffmpeg: перевести задачу на стадию
+        постобработки и отдать сетевые ресурсы. Слот пула освобождает
+        подписчик стадии. Если стадия заполнена, задача держит слот до конца.
+        """
+        if run.postprocessing or not (run.single_pass and run.files and self.postprocess_stage):
+            return
+        if self.postprocess_stage.enter(idx):
+            run.postprocessing = True
+            self._release_resources(idx, run)
+
+    def _retry_progress(self, idx: int, run: "DownloadRun", attempt: int) -> DownloadProgress:
+        return DownloadProgress(
+            index=idx,
+            status="downloading",
+            message=f"⚠️ {run.stalled[0]}, повтор {attempt + 1}/{self.MAX_STALL_RETRIES}",
+        )
+
+    def _release_resources(self, idx: int, run: "DownloadRun") -> None:
+        """Вернуть долю фрагментов и скорости (повторный вызов ничего не делает)."""
+        avg_speed = sum(run.speeds) / len(run.speeds) if run.speeds else None
+        self.fragment_tuner.release(idx, avg_speed, run.fragmented)
+        self.bandwidth_governor.release(idx)
+
+    # ---------- запуск yt-dlp ----------
+    def _run_yt_dlp(
+        self,
+        cmd: List[str],
+        job_id: Optional[int] = None,
+        output: Optional[RingBuffer] = None,
+    ) -> Iterator[dict]:
+        """События yt-dlp в едином формате; последним всегда идёт {"event": "done"}."""
+        if self.farm:
+            yield from self.farm.run(cmd[1:], job_id=job_id)
+        else:
+            yield from self._run_subprocess(cmd, output or RingBuffer(), job_id)
+
+    def _apply_rate(self, idx: int, rate: int) -> None:
+        """Новая доля общего лимита. Применяется на лету только в воркерах пула."""
+        if self.farm:
+            self.farm.send(idx, {"cmd": "set_rate", "rate": rate})
+
+    @staticmethod
+    def _output_activity(task: DownloadTask) -> Optional[Callable[[], Optional[int]]]:
+        """
+        Фрагменты (--download-sections) качает ffmpeg, и событие прогресса
+        приходит одно — в конце. Прогресс такой загрузки для наблюдателя —
+        рост файлов в папке задачи, изменённых после старта попытки. Если имя
+        задано шаблоном с постоянным началом (части разбитой загрузки в общей
+        папке), учитываются только файлы этой задачи.
+        """
+        if not task.time_sections:
+            return None
+        since = time.time() - 1
+        prefix = (task.output_template or "").split("%(")[0]
+
+        def written() -> Optional[int]:
+            total = 0
+            try:
+                with os.scandir(task.path) as entries:
+                    for entry in entries:
+                        if entry.name.startswith(prefix) and entry.is_file():
+                            st = entry.stat()
+                            if st.st_mtime >= since:
+                                total += st.st_size
+            except OSError:
+                return None
+            return total
+
+        return written
+
+    def _on_stall(self, idx: int, stalled: List[str], reason: str) -> None:
+        """Вызывается наблюдателем: пометить попытку зависшей и убить её процесс."""
+        stalled.append(reason)
+        self._kill_job(idx)
+
+    def _kill_job(self, idx: int) -> bool:
+        """Убить процесс задачи вместе с дочерним ffmpeg."""
+        if self.farm:
+            return self.farm.kill(idx)
+        proc = self._processes.get(idx)
+        if proc is None or proc.returncode is not None:
+            return False
+        kill_process_tree(proc.pid)
+        return True
+
+    def _run_subprocess(
+        self,
+        cmd: List[str],
+        output: RingBuffer,
+        job_id: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """
+        Запасной путь без библиотеки yt_dlp: отдельный процесс с JSON-прогрессом.
+        stderr вычитывается отдельным потоком, иначе при заполненном канале
+        yt-dlp встанет на записи, пока мы ждём stdout. Хранится только хвост вывода.
+        """
+        proc = subprocess.Popen(
+            cmd + SUBPROCESS_OUTPUT_ARGS,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+        )
+        on_line = None
+        if cfg.load_setting("log_ytdlp_output", False):
+            on_line = output_logger(job_id)
+        stderr_reader = drain_stream(proc.stderr, output, on_line)
+        if job_id is not None:
+            self._processes[job_id] = proc
+        try:
+            for line in proc.stdout:
+                event = self._parse_output_line(line, output, on_line)
+                if event:
+                    yield event
+
+            # зависание после закрытия stdout тоже ловит наблюдатель
+            proc.wait()
+        finally:
+            self._processes.pop(job_id, None)
+            if proc.poll() is None:
+                proc.kill()  # потребитель прервал генератор
+            stderr_reader.join(timeout=5)
+
+        err = output.summary() if proc.returncode else ""
+        yield {"event": "done", "returncode": proc.returncode, "error": err}
+
+    @staticmethod
+    def _parse_output_line(
+        line: str,
+        output: RingBuffer,
+        on_line: Optional[Callable[[str], None]] = None,
+    ) -> Optional[dict]:
+        """Строка stdout процесса yt-dlp -> событие; прочий текст уходит в хвост вывода."""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            # отсутствующие поля шаблон печатает как NA, а не null
+            data = json.loads(_NA_RE.sub(":null", line))
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            # не-json строка
+            output.append(line)
+            if on_line:
+                on_line(line)
+            return None
+        if "filepath" in data:
+            data["event"] = "moved"
+        elif "postprocessor" in data:
+            data["event"] = "postprocess"
+        else:
+            data["event"] = "progress"
+        return data
+
+    @staticmethod
+    def _progress_from_event(idx: int, event: dict) -> Optional[DownloadProgress]:
+        kind = event.get("event")
+        pp = event.get("postprocessor")
+        if kind == "postprocess" and event.get("status") == "started" and pp != "MoveFiles":
+            return DownloadProgress(
+                index=idx,
+                status="converting",
+                message=f"⚙️ Обработка ({pp})..." if pp else "⚙️ Обработка...",
+            )
+        if kind != "progress" or event.get("status") != "downloading":
+            return None
+
+        downloaded = event.get("downloaded") or 0
+        total = event.get("total") or 1
+        percent = (downloaded / total) * 100
+        speed = _format_speed(event.get("speed"))
+        eta = _format_eta(event.get("eta"))
+        return DownloadProgress(
+            index=idx,
+            status="downloading",
+            percent=percent,
+            speed=speed,
+            eta=eta,
+            message=f"{percent:.1f}% | {speed} | ETA {eta}",
+            filename=event.get("filename"),
+        )
+
+    def _derive_outputs(
+        self,
+        task: DownloadTask,
+        idx: int,
+        files: List[str],
+        info_json: Optional[str],
+    ) -> List[str]:
+        """Раздельные аудио/видео из потоков, скачанных для склейки."""
+        info = None
+        if info_json:
+            try:
+                with open(info_json, "r", encoding="utf-8") as f:
+                    info = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        produced = derive_outputs(task, files, info)
+        expected = [m for m in task.outputs if m != "together"]
+        if len(produced) < len(expected):
+            logger.warning(f"#{idx}: получено {len(produced)} из {len(expected)} раздельных файлов")
+        for path in produced:
+            logger.info(f"#{idx}: сохранён {os.path.basename(path)}")
+        return produced
+
+    @staticmethod
+    def _output_paths(task: DownloadTask, final: List[str], produced: List[str]) -> Dict[str, str]:
+        """Итоговый файл каждого режима задачи — для архива загрузок."""
+        if not final:
+            return {}
+        if not task.outputs:
+            return {task.mode: final[-1]}
+        paths: Dict[str, str] = {}
+        for path in produced:
+            mode = "audio" if "_audio." in os.path.basename(path) else "video"
+            paths[mode] = path
+        merged = [p for p in final if p not in produced and os.path.exists(p)]
+        if "together" in task.outputs and merged:
+            paths["together"] = merged[0]
+        if "video" in task.outputs and "video" not in paths and len(merged) > 1:
+            paths["video"] = merged[-1]  # отдельный видеопоток после склеенного файла
+        return paths
+
+    # ---------- метаданные ----------
+    def _resolve_info_json(self, url: str, idx: Optional[int] = None) -> Optional[str]:
+        """
+        Путь к info.json для --load-info-json или None (качаем по ссылке).
+        idx — задача, которой принадлежит экстракция: cancel(idx) её прерывает.
+        """
+        try:
+            return self.metadata_cache.get_or_extract(url, lambda u: self._extract_info(u, idx))
+        except Exception as e:
+            logger.warning(f"Не удалось получить метаданные {url}: {e}")
+            return None
+
+    def _extract_command(self, url: str) -> List[str]:
+        cmd = [cfg.yt_dlp_path]
+        cmd.extend(["--extractor-args", "youtube:player_client=default,-tv_simply"])
+        cmd.extend(self._get_cookies_args(None))
+        cmd.append(url)
+        return cmd
+
+    def _extract_info(self, url: str, job_id: Optional[int] = None) -> Optional[dict]:
+        """
+        Одна экстракция страницы. Плейлисты не кэшируются.
+        Не дольше EXTRACT_TIMEOUT; по job_id процесс убивает cancel().
+        """
+        cmd = self._extract_command(url)
+        started = time.monotonic()
+
+        info = None
+        if self.farm:
+            for event in self.farm.run(cmd[1:], kind="extract", job_id=job_id, timeout=self.EXTRACT_TIMEOUT):
+                if event.get("event") == "info":
+                    info = event["info"]
+                elif event.get("event") == "done" and event.get("returncode"):
+                    raise RuntimeError(event.get("error") or "yt-dlp вернул ошибку")
+        else:
             proc = subprocess.Popen(
-                cmd,
+                cmd + ["--dump-single-json", "--no-warnings"],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                bufsize=1,
+                encoding="utf-8",
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+            )
+            if job_id is not None:
+                self._processes[job_id] = proc
+            try:
+                stdout, stderr = proc.communicate(timeout=self.EXTRACT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                kill_process_tree(proc.pid)
+                proc.communicate()
+                raise RuntimeError(f"Таймаут экстракции ({self.EXTRACT_TIMEOUT} с)")
+            finally:
+                if job_id is not None:
+                    self._processes.pop(job_id, None)
+            if proc.returncode:
+                raise RuntimeError(stderr.strip()[-150:])
+            info = json.loads(stdout)
+
+        PHASE_SECONDS.observe(time.monotonic() - started, phase="extract")
+        return self._single_video(info)
+
+    def resolve_streams(self, task: DownloadTask) -> Optional[dict]:
+        """
+        Что скачает задача, без загрузки: {"filename": итоговый путь, "urls": [прямые
+        ссылки выбранных форматов], "headers": {...}, "duration": сек или None}.
+        Форматы выбираются по тем же метаданным, что и у загрузки.
+        """
+        info_json = self._resolve_info_json(task.url)
+        cmd = [cfg.yt_dlp_path, "--paths", task.path]
+        cmd.extend(["--output", task.output_template or self.output_template(task, 0)])
+        cmd.extend(["--extractor-args", "youtube:player_client=default,-tv_simply"])
+        cmd.extend(self._get_cookies_args(None))
+        cmd.extend(self._format_args(task))
+        cmd.extend(["--print", STREAMS_TEMPLATE, "--no-warnings"])
+        cmd.extend(["--load-info-json", info_json] if info_json else [task.url])
+        try:
+            proc = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
                 creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+                timeout=120,
             )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"Не удалось выбрать форматы {task.url}: {e}")
+            return None
+        for line in reversed(proc.stdout.splitlines()):
+            try:
+                streams = json.loads(_NA_RE.sub(":null", line.strip()))
+            except json.JSONDecodeError:
+                continue
+            if isinstance(streams, dict) and streams.get("urls"):
+                streams["urls"] = streams["urls"].splitlines()
+                return streams
+        logger.warning(f"Не удалось выбрать форматы {task.url}: {proc.stderr.strip()[-150:]}")
+        return None
+
+    @staticmethod
+    def _single_video(info: Optional[dict]) -> Optional[dict]:
+        """Кэшируются только метаданные одного видео."""
+        if not info or info.get("_type", "video") != "video":
+            return None
+        return info
 
+    def expand_playlist(self, url: str) -> Iterator[dict]:
+        """
+        Элементы плейлиста/канала по мере получения (плоская экстракция, без
+        обращения к страницам видео). Первые ссылки приходят до конца перебора.
+        """
+        cmd = [cfg.yt_dlp_path, "--flat-playlist"]
+        cmd.extend(["--extractor-args", "youtube:player_client=default,-tv_simply"])
+        cmd.extend(self._get_cookies_args(None))
+        cmd.append(url)
+
+        if self.farm:
+            for event in self.farm.run(cmd[1:], kind="expand"):
+                if event.get("event") == "entry":
+                    yield event["entry"]
+                elif event.get("event") == "done" and event.get("returncode"):
+                    raise RuntimeError(event.get("error") or "yt-dlp вернул ошибку")
+            return
+
+        proc = subprocess.Popen(
+            cmd + ["--dump-json", "--no-warnings"],  # одна JSON-строка на элемент
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+        )
+        output = RingBuffer()
+        stderr_reader = drain_stream(proc.stderr, output)
+        try:
             for line in proc.stdout:
-                line = line.strip()
-                if not line:
-                    continue
                 try:
-                    data = json.loads(line)
-                    if data.get("status") == "downloading":
-                        downloaded = data.get("downloaded", 0)
-                        total = data.get("total", 1) or 1
-                        percent = (downloaded / total) * 100
-                        yield DownloadProgress(
-                            index=idx,
-                            status="downloading",
-                            percent=percent,
-                            speed=data.get("speed"),
-                            eta=data.get("eta"),
-                            message=f"{percent:.1f}% | {data.get('speed')} | ETA {data.get('eta')}",
-                        )
+                    yield json.loads(line)
                 except json.JSONDecodeError:
-                    # не-json строка
-                    if "error" in line.lower():
-                        yield DownloadProgress(index=idx, status="error", message=line)
-
-            proc.wait(timeout=600)
-            if proc.returncode == 0:
-                yield DownloadProgress(index=idx, status="finished", message="✅ Готово")
-            else:
-                err = proc.stderr.read()[:150]
-                yield DownloadProgress(index=idx, status="error", message=f"❌ {err}")
-
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            yield DownloadProgress(index=idx, status="error", message="⏱️ Таймаут")
-        except Exception as e:
-            logger.error(f"Критическая ошибка #{idx}: {e}")
-            yield DownloadProgress(index=idx, status="error", message=f"Сбой: {e}")
+                    continue
+            proc.wait()
+        finally:
+            if proc.poll() is None:
+                kill_process_tree(proc.pid)  # перебор прерван (отмена)
+                proc.wait()
+            stderr_reader.join(timeout=5)
+        if proc.returncode:
+            raise RuntimeError(output.summary())
 
     # ---------- вспомогательные методы ----------
+    def prepare_command(
+        self,
+        task: DownloadTask,
+        idx: int,
+        handler: Optional[DownloadEventHandler],
+        info_json: Optional[str],
+        run: Optional["DownloadRun"] = None,
+    ) -> List[str]:
+        """
+        Команда загрузки с долей фрагментов и скорости (освобождаются в _release_resources).
+        Потоки из кэша подставляются локальными файлами (до _end_job).
+        """
+        served = info_json
+        if run is not None and info_json and self.stream_cache.enabled:
+            run.video_key, served = self.stream_cache.serve(idx, info_json, bool(task.time_sections))
+        fragments = self.fragment_tuner.acquire(idx)
+        rate = self.bandwidth_governor.acquire(idx, lambda r: self._apply_rate(idx, r))
+        cmd = self._build_command(task, idx, handler, served, fragments)
+        if served != info_json:
+            cmd[1:1] = ["--enable-file-urls"]
+        if run is not None and run.video_key and self._caches_streams(task):
+            run.keep_streams = not (task.outputs and build_format(task)[1])
+            if run.keep_streams:
+                cmd[1:1] = ["--keep-video"]  # потоки после склейки уходят в кэш, а не удаляются
+        if rate:
+            # ratelimit действует на каждое соединение; воркер пула уточнит его на лету
+            cmd[1:1] = ["--limit-rate", str(max(1, rate // fragments))]
+        logger.info(f"Команда yt-dlp: {' '.join(cmd)}")
+        return cmd
+
     def _build_command(
         self,
         task: DownloadTask,
         idx: int,
         handler: Optional[DownloadEventHandler],
+        info_json: Optional[str] = None,
+        fragments: int = 1,
     ) -> List[str]:
         cmd = [cfg.yt_dlp_path]
         cmd.extend(["--ffmpeg-location", cfg.ffmpeg_path])
         cmd.extend(["--paths", task.path])
         cmd.extend(["--no-overwrites"])
+        cmd.extend(["--concurrent-fragments", str(fragments)])
         cmd.extend(["--extractor-args", "youtube:player_client=default,-tv_simply"])
         cmd.extend(self._get_cookies_args(handler))
+        if task.resume:
+            cmd.append("--continue")
 
-        timestamp = datetime.now().strftime("%H-%M-%S")
-        if task.time_section:
-            start, end = task.time_section
+        # Все фрагменты ссылки — одним процессом: одна экстракция, один выбор формата
+        for start, end in task.time_sections:
             cmd.extend(["--download-sections", f"*{start}-{end}"])
-            out_tmpl = f"%(title)s_frag_{idx}_{timestamp}.%(ext)s"
+        if task.time_sections and task.precise_cuts:
+            # точные границы ценой перекодирования; без флага ffmpeg копирует
+            # потоки и режет по ближайшему ключевому кадру
+            cmd.append("--force-keyframes-at-cuts")
+        cmd.extend(["--output", task.output_template or self.output_template(task, idx)])
+        cmd.extend(self._format_args(task))
+
+        if info_json:
+            cmd.extend(["--load-info-json", info_json])
         else:
-            out_tmpl = f"%(title)s_%(resolution)s.%(ext)s"
-        cmd.extend(["--output", out_tmpl])
+            cmd.append(task.url)
+        return cmd
 
+    @staticmethod
+    def _format_args(task: DownloadTask) -> List[str]:
+        """Выбор формата по режиму задачи."""
+        if task.outputs:
+            fmt, keep_parts = build_format(task)
+            return ["-f", fmt, "--keep-video"] if keep_parts else ["-f", fmt]
         if task.mode == "audio":
-            cmd.extend(["-f", "bestaudio[ext=m4a][acodec=aac]/bestaudio"])
-        elif task.mode == "video":
-            cmd.extend(["-f", "bestvideo"])
-        elif task.mode == "together":
-            cmd.extend(["-f", task.quality_format])
+            return ["-f", "bestaudio[ext=m4a][acodec=aac]/bestaudio"]
+        if task.mode == "video":
+            return ["-f", "bestvideo"]
+        if task.mode == "together":
+            return ["-f", task.quality_format]
+        return []
 
-        cmd.append(task.url)
-        return cmd
+    @staticmethod
+    def output_template(task: DownloadTask, idx: int) -> str:
+        """Шаблон имени файла. Фиксируется при постановке в очередь, чтобы докачка нашла .part."""
+        if task.time_sections:
+            timestamp = datetime.now().strftime("%H-%M-%S")
+            if len(task.time_sections) > 1:
+                return f"%(title)s_frag_{idx}_{timestamp}_%(section_start)ds.%(ext)s"
+            return f"%(title)s_frag_{idx}_{timestamp}.%(ext)s"
+        return "%(title)s_%(resolution)s.%(ext)s"
 
     def _get_cookies_args(
         self,
@@ -195,27 +969,37 @@ class VideoDownloader:
         logger.warning("Работаем без cookies (могут быть ограничения)")
         return []
 
-    def _download_cover(self, url: str, path: str) -> None:
-        cmd = [
-            cfg.yt_dlp_path,
-            "--write-thumbnail",
-            "--skip-download",
-            "--quiet",
-            "--convert-thumbnails",
-            "jpg",
-            "--ffmpeg-location",
-            cfg.ffmpeg_path,
-            "--paths",
-            path,
-            "--output",
-            "%(title)s.%(ext)s",
-            url,
-        ]
-        subprocess.run(
-            cmd,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
-            timeout=30,
-        )
+    # ---------- отмена ----------
+    def cancel(self, idx: Optional[int] = None) -> None:
+        """
+        Отменить задачу idx (или все активные и ожидающие старта). Процессы задачи
+        убиваются сразу, генератор завершается событием "cancelled" и освобождает слот пула.
+        """
+        with self._lock:
+            known = self._active | self._expected
+            targets = list(known) if idx is None else [idx] if idx in known else []
+            self._cancelled.update(targets)
+        for target in targets:
+            self._kill_job(target)
+            logger.info(f"Задача #{target} отменена")
+
+    def _is_cancelled(self, idx: int) -> bool:
+        with self._lock:
+            return idx in self._cancelled
+
+    @staticmethod
+    def _cancelled_progress(idx: int) -> DownloadProgress:
+        return DownloadProgress(index=idx, status="cancelled", message="⛔ Отменено")
 
-    def cancel(self) -> None:
-        self._cancelled = True
\ No newline at end of file
+    @staticmethod
+    def _cleanup_partial(idx: int, filenames: Set[str]) -> None:
+        """Политика cancel_part_policy: "keep" — оставить .part для докачки, "delete" — удалить."""
+        if cfg.load_setting("cancel_part_policy", "keep") != "delete":
+            return
+        for name in filenames:
+            leftovers = glob.glob(glob.escape(name) + ".part*") + glob.glob(glob.escape(name) + ".ytdl")
+            for path in leftovers:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"#{idx}: не удалось удалить {path}: {e}")
\ No newline at end of file
@@ -0,0 +1,392 @@
+# services/ytdlp_farm.py
+import time
+import queue
+import threading
+import importlib.util
+import multiprocessing as mp
+from typing import Dict, Hashable, Iterator, List, Optional
+
+from core.config import cfg
+from core.utils import Logger
+from services.process_output import kill_process_tree
+
+logger = Logger("YtDlpFarm")
+
+
+# ---------- код дочернего процесса ----------
+class _PipeLogger:
+    """Логгер yt-dlp, пересылающий предупреждения и ошибки в родительский процесс."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def debug(self, msg: str) -> None:
+        pass
+
+    def info(self, msg: str) -> None:
+        pass
+
+    def warning(self, msg: str) -> None:
+        self._conn.send({"event": "log", "level": "warning", "msg": msg})
+
+    def error(self, msg: str) -> None:
+        self._conn.send({"event": "log", "level": "error", "msg": msg})
+
+
+def _apply_controls(conn, params: dict, state: dict, d: dict) -> None:
+    """
+    Применить управляющие сообщения, пришедшие во время загрузки.
+    Лимит задачи делится на число соединений: ratelimit в yt-dlp действует
+    на каждый фрагмент отдельно. Лимит пишется в ydl.params: обычная загрузка
+    читает его оттуда на каждом блоке, загрузчик фрагментов DASH/HLS — через
+    _live_rate_fragments.
+    """
+    while conn.poll():
+        msg = conn.recv()
+        if msg and msg.get("cmd") == "set_rate":
+            state["rate"] = msg.get("rate") or 0
+    if state["rate"] is None:
+        return
+    connections = (params.get("concurrent_fragment_downloads") or 1) if d.get("fragment_count") else 1
+    params["ratelimit"] = state["rate"] / connections if state["rate"] else None
+
+
+def _live_rate_fragments(yt_dlp) -> None:
+    """
+    Фрагменты DASH/HLS качает HttpQuietDownloader с копией params, и новый
+    ratelimit до него не доходит. Подменяем класс: перед паузой на каждом
+    блоке лимит берётся из живого ydl.params. В версиях без этого класса
+    лимит фрагментированной загрузки остаётся стартовым.
+    """
+    fragment = getattr(getattr(yt_dlp, "downloader", None), "fragment", None)
+    base = getattr(fragment, "HttpQuietDownloader", None)
+    if base is None:
+        return
+
+    class LiveRateDownloader(base):
+        def slow_down(self, start_time, now, byte_counter):
+            self.params["ratelimit"] = self.ydl.params.get("ratelimit")
+            super().slow_down(start_time, now, byte_counter)
+
+    fragment.HttpQuietDownloader = LiveRateDownloader
+
+
+def _flat_entry(entry: dict) -> dict:
+    """Минимум полей элемента плейлиста для передачи в родительский процесс."""
+    flat = {k: entry.get(k) for k in ("_type", "id", "url", "webpage_url", "title", "ie_key")}
+    formats = entry.get("formats") or []
+    if not flat["url"] and len(formats) == 1:
+        flat["url"] = formats[0].get("url")  # прямая ссылка на файл без своей страницы
+    return flat
+
+
+def _run_job(yt_dlp, conn, job: dict) -> None:
+    """Выполнить одно задание: argv разбирается так же, как в yt-dlp.exe."""
+    params: dict = {}
+    state = {"rate": None}  # лимит всей задачи, байт/с (None — не управляется)
+
+    def progress_hook(d: dict) -> None:
+        _apply_controls(conn, params, state, d)
+        conn.send({
+            "event": "progress",
+            "status": d.get("status"),
+            "downloaded": d.get("downloaded_bytes"),
+            "total": d.get("total_bytes") or d.get("total_bytes_estimate"),
+            "speed": d.get("speed"),
+            "eta": d.get("eta"),
+            "fragments": d.get("fragment_count"),
+            "filename": d.get("filename"),
+            "format_id": (d.get("info_dict") or {}).get("format_id"),
+        })
+
+    def postprocessor_hook(d: dict) -> None:
+        conn.send({
+            "event": "postprocess",
+            "status": d.get("status"),
+            "postprocessor": d.get("postprocessor"),
+        })
+
+    def post_hook(filepath: str) -> None:
+        conn.send({"event": "moved", "filepath": filepath})
+
+    try:
+        parsed = yt_dlp.parse_options(job["argv"])
+        opts = dict(parsed.ydl_opts)
+        opts.update({
+            "logger": _PipeLogger(conn),
+            "noprogress": True,
+            "progress_hooks": [progress_hook],
+            "postprocessor_hooks": [postprocessor_hook],
+            "post_hooks": [post_hook],
+        })
+        if opts.get("ratelimit"):
+            state["rate"] = opts["ratelimit"] * (opts.get("concurrent_fragment_downloads") or 1)
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            params = ydl.params
+            if job.get("kind") == "extract":
+                info = ydl.extract_info(parsed.urls[0], download=False)
+                conn.send({"event": "info", "info": ydl.sanitize_info(info)})
+                code = 0
+            elif job.get("kind") == "expand":
+                # process=False: элементы плейлиста — ленивый генератор, страницы
+                # подгружаются по мере перебора, и каждая ссылка уходит сразу
+                info = ydl.extract_info(parsed.urls[0], download=False, process=False)
+                is_list = info.get("_type") in ("playlist", "multi_video")
+                for entry in (info.get("entries") or []) if is_list else [info]:
+                    if entry:
+                        conn.send({"event": "entry", "entry": _flat_entry(entry)})
+                code = 0
+            elif parsed.options.load_info_filename:
+                code = ydl.download_with_info_file(parsed.options.load_info_filename)
+            else:
+                code = ydl.download(parsed.urls)
+        conn.send({"event": "done", "returncode": code})
+    except yt_dlp.utils.DownloadError as e:
+        conn.send({"event": "done", "returncode": 1, "error": str(e)})
+    except BaseException as e:  # SystemExit от parse_options тоже ловим
+        conn.send({"event": "done", "returncode": 1, "error": f"{type(e).__name__}: {e}"})
+
+
+def _worker_main(conn) -> None:
+    """Точка входа процесса-воркера: импорт yt_dlp один раз, затем цикл заданий."""
+    try:
+        import yt_dlp
+        import yt_dlp.downloader.fragment  # noqa: F401 — для _live_rate_fragments
+    except Exception as e:
+        conn.send({"event": "failed", "error": str(e)})
+        return
+    _live_rate_fragments(yt_dlp)
+    conn.send({"event": "ready", "version": yt_dlp.version.__version__})
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        if "cmd" in job:
+            continue  # управление для уже завершённого задания
+        try:
+            _run_job(yt_dlp, conn, job)
+        except (EOFError, OSError):
+            break  # родительский процесс закрыл канал
+
+
+# ---------- родительская сторона ----------
+class FarmWorker:
+    """Один долгоживущий процесс yt-dlp и его конец канала."""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def wait_ready(self) -> None:
+        """Дождаться окончания импорта yt_dlp в процессе."""
+        if self.ready:
+            return
+        msg = self.conn.recv()
+        if msg.get("event") != "ready":
+            raise RuntimeError(msg.get("error") or "Воркер yt-dlp не запустился")
+        self.ready = True
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=2)
+        self.conn.close()
+
+
+class YtDlpWorkerFarm:
+    """
+    Пул прогретых процессов с библиотекой yt_dlp. Задания передаются через Pipe.
+    Запускается size процессов; если все заняты (задачи на стадии постобработки
+    держат свои), пул дорастает до max_size по требованию.
+    """
+
+    ACQUIRE_TIMEOUT = 600  # сек ожидания свободного воркера: дольше — ошибка задания, не зависание
+
+    def __init__(self, size: int = 3, max_size: Optional[int] = None):
+        self.size = size
+        self.max_size = max(size, max_size or size)
+        self._ctx = mp.get_context("spawn")
+        self._idle: "queue.Queue[Optional[FarmWorker]]" = queue.Queue()
+        self._all: List[FarmWorker] = []
+        self._jobs: Dict[Hashable, FarmWorker] = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    @staticmethod
+    def is_available() -> bool:
+        """Установлена ли библиотека yt_dlp."""
+        return importlib.util.find_spec("yt_dlp") is not None
+
+    def start(self) -> None:
+        """Запустить процессы заранее, чтобы импорт прошёл до первой задачи."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.size):
+                self._spawn()
+        logger.info(f"Запущено {self.size} воркеров yt-dlp")
+
+    def _spawn(self) -> FarmWorker:
+        worker = FarmWorker(self._ctx)
+        self._all.append(worker)
+        self._idle.put(worker)
+        return worker
+
+    def _acquire(self) -> FarmWorker:
+        self.start()
+        idle = self._idle
+        try:
+            worker = idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._all) < self.max_size:
+                    self._spawn()
+            try:
+                worker = idle.get(timeout=self.ACQUIRE_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(f"Нет свободного воркера yt-dlp за {self.ACQUIRE_TIMEOUT} с") from None
+        if worker is None:
+            idle.put(None)  # пул остановлен: будим следующего ждущего
+            raise RuntimeError("Воркеры yt-dlp остановлены")
+        try:
+            worker.wait_ready()
+        except Exception:
+            # импорт не удался или канал закрыт: заменяем, иначе пул сжимается навсегда
+            self._release(worker, healthy=False)
+            raise
+        return worker
+
+    def _release(self, worker: FarmWorker, healthy: bool) -> None:
+        if healthy and worker.is_alive():
+            with self._lock:
+                started = self._started
+            if started:
+                self._idle.put(worker)
+            else:
+                worker.stop()  # задание закончилось уже после shutdown()
+            return
+        # Воркер прерван посреди задания — заменяем новым
+        worker.kill()
+        with self._lock:
+            if worker in self._all:
+                self._all.remove(worker)
+            if self._started:
+                self._spawn()
+
+    def run(
+        self,
+        argv: List[str],
+        kind: str = "download",
+        job_id: Optional[Hashable] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[dict]:
+        """
+        Выполнить задание и выдавать события до финального {"event": "done"}.
+        По job_id заданию можно отправлять управляющие сообщения через send().
+        timeout — предельная длительность задания, сек: после неё процесс убивается.
+        """
+        worker = self._acquire()
+        deadline = time.monotonic() + timeout if timeout else None
+        done = False
+        if job_id is not None:
+            with self._lock:
+                self._jobs[job_id] = worker
+        try:
+            worker.conn.send({"kind": kind, "argv": argv})
+            while True:
+                if deadline is not None and not worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                    logger.warning(f"Задание yt-dlp (pid {worker.pid}) не уложилось в {timeout:.0f} с")
+                    kill_process_tree(worker.pid)  # воркер будет заменён
+                    yield {"event": "done", "returncode": -1, "error": f"Таймаут yt-dlp ({timeout:.0f} с)"}
+                    return
+                msg = worker.conn.recv()
+                if msg.get("event") == "done":
+                    done = True
+                yield msg
+                if done:
+                    return
+        except (EOFError, OSError) as e:
+            logger.error(f"Воркер yt-dlp (pid {worker.pid}) завершился аварийно: {e}")
+            worker.process.kill()  # процесс мог ещё не успеть завершиться — не возвращаем его в пул
+            yield {"event": "done", "returncode": -1, "error": "Процесс yt-dlp завершился аварийно"}
+        finally:
+            if job_id is not None:
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+            self._release(worker, healthy=done and worker.is_alive())
+
+    def send(self, job_id: Hashable, message: dict) -> bool:
+        """Отправить управляющее сообщение выполняющемуся заданию."""
+        with self._lock:
+            worker = self._jobs.get(job_id)
+            if worker is None:
+                return False
+            try:
+                worker.conn.send(message)
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def kill(self, job_id: Hashable) -> bool:
+        """
+        Убить процесс задания вместе с его ffmpeg.
+        run() завершится событием done, воркер будет заменён.
+        """
+        with self._lock:
+            worker = self._jobs.get(job_id)
+        if worker is None:
+            return False
+        logger.warning(f"Принудительная остановка воркера yt-dlp (pid {worker.pid})")
+        kill_process_tree(worker.pid)
+        return True
+
+    def shutdown(self) -> None:
+        """Остановить все процессы."""
+        with self._lock:
+            self._started = False
+            workers, self._all = self._all, []
+            idle, self._idle = self._idle, queue.Queue()
+        idle.put(None)  # потоки, ждущие воркера в старой очереди, получат ошибку
+        for worker in workers:
+            worker.stop()
+        logger.info("Воркеры yt-dlp остановлены")
+
+
+def create_farm(
+    size: int,
+    engine: Optional[str] = None,
+    max_size: Optional[int] = None,
+) -> Optional[YtDlpWorkerFarm]:
+    """Прогретые процессы с библиотекой yt_dlp; без неё — запуск yt-dlp.exe на задачу.
+    engine — "library" или "binary" (по умолчанию из настройки ytdlp_engine)."""
+    if (engine or cfg.load_setting("ytdlp_engine", "library")) != "library":
+        return None
+    if not YtDlpWorkerFarm.is_available():
+        logger.warning("Библиотека yt_dlp не найдена, используется yt-dlp.exe")
+        return None
+    farm = YtDlpWorkerFarm(size=size, max_size=max_size)
+    farm.start()
+    return farm
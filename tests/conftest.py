@@ -0,0 +1,29 @@
+"""
+Окружение тестов: приложение во временной папке, yt-dlp — заглушка
+benchmarks/fake_ytdlp.py (отдельный процесс, без сети).
+Настраивается до импорта services: пути кэшей берутся из cfg.base_dir при импорте.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from pool_benchmark import cfg, write_launcher  # noqa: E402
+
+BASE = tempfile.mkdtemp(prefix="omnipresent_tests_")
+cfg.base_dir = BASE
+cfg.config_file = os.path.join(BASE, "settings.json")
+cfg.cookies_path = os.path.join(BASE, "cookies.txt")
+cfg.yt_dlp_path = write_launcher(BASE)
+cfg.ffmpeg_path = shutil.which("ffmpeg") or cfg.ffmpeg_path  # тесты склейки без него пропускаются
+open(cfg.cookies_path, "w").close()  # без поиска cookies в браузерах
+with open(cfg.config_file, "w", encoding="utf-8") as f:
+    json.dump({
+        "ytdlp_engine": "binary",
+        "skip_downloaded": False,
+        "stream_cache_mb": 0,
+    }, f)
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from core.models import DownloadTask
+from services.async_engine import AsyncDownloadEngine
+from services.stall_watchdog import StallWatchdog
+from services.video_downloader import VideoDownloader
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(StallWatchdog, "CHECK_INTERVAL", 0.1)
+    engine = AsyncDownloadEngine(VideoDownloader(watchdog=StallWatchdog(stall_timeout=1)), max_concurrency=4)
+    yield engine
+    engine.shutdown()
+
+
+def _task(path, name: str, **kwargs) -> DownloadTask:
+    return DownloadTask(url=f"https://bench.invalid/watch/{name}", path=str(path),
+                        mode="together", quality_format="best", **kwargs)
+
+
+def test_download_and_cancel(engine, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_LINES", "50")
+    monkeypatch.setenv("FAKE_YTDLP_INTERVAL", "0.05")
+    done = engine.submit(_task(tmp_path, "async-done"), 1)
+    cancelled = engine.submit(_task(tmp_path, "async-cancel"), 2)
+    time.sleep(1)
+    engine.cancel(2)
+
+    assert cancelled.result(timeout=10).status == "cancelled"
+    result = done.result(timeout=10)
+    assert result.status == "success", result.message
+
+
+def test_hung_attempt_is_retried(engine, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_LINES", "100")
+    monkeypatch.setenv("FAKE_YTDLP_INTERVAL", "0.1")
+    monkeypatch.setenv("FAKE_YTDLP_SILENT", "1")
+    monkeypatch.setattr(VideoDownloader, "MAX_STALL_RETRIES", 1)
+    events = []
+    result = engine.submit(_task(tmp_path, "async-hung", time_sections=((0.0, 30.0),)), 3, events.append)
+
+    result = result.result(timeout=20)
+    assert result.status == "unknown"
+    assert "Зависание" in result.message
+    assert sum("повтор" in p.message for p in events) == 1
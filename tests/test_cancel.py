@@ -0,0 +1,21 @@
+from core.models import DownloadTask
+from services.video_downloader import VideoDownloader
+
+
+def _task(path) -> DownloadTask:
+    return DownloadTask(url="https://bench.invalid/watch/cancel", path=str(path), mode="together", quality_format="best")
+
+
+def test_cancel_before_start_is_kept(tmp_path):
+    downloader = VideoDownloader()
+    downloader.expect(7)  # передана пулу, runnable ещё не запущен
+    downloader.cancel(7)
+    result = downloader.run_task(_task(tmp_path), 7)
+    assert result.status == "cancelled"
+    assert not list(tmp_path.iterdir())  # yt-dlp не запускался
+
+
+def test_cancel_of_unknown_index_is_ignored(tmp_path):
+    downloader = VideoDownloader()
+    downloader.cancel(8)
+    assert downloader.run_task(_task(tmp_path), 8).status == "success"
@@ -0,0 +1,23 @@
+from dataclasses import replace
+
+from core.models import DownloadTask
+from services.download_archive import DownloadArchive
+
+URL = "https://www.youtube.com/watch?v=aaaaaaaaaaa"
+
+
+def test_hit_depends_on_folder_and_cuts(tmp_path):
+    archive = DownloadArchive(str(tmp_path / "archive.sqlite3"))
+    done = tmp_path / "clip.mp4"
+    done.write_bytes(b"x" * 10)
+    task = DownloadTask(url=URL, path=str(tmp_path), mode="video", quality_format="best",
+                        time_sections=((10.0, 20.0),))
+    archive.record(task, {"video": str(done)})
+
+    assert archive.find(task) == str(done)
+    assert archive.find(replace(task, path=str(tmp_path / "other"))) is None
+    assert archive.find(replace(task, precise_cuts=True)) is None
+
+    done.unlink()
+    assert archive.find(task) is None  # файл удалён — запись устарела
+    archive.close()
@@ -0,0 +1,42 @@
+import time
+import threading
+
+from services.metadata_cache import MetadataCache
+
+URL = "https://www.youtube.com/watch?v=aaaaaaaaaaa"
+
+
+def test_one_extraction_per_video(tmp_path):
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    calls = []
+
+    def extract(url):
+        calls.append(url)
+        time.sleep(0.2)  # остальные задачи успевают встать в ожидание
+        return {"id": "aaaaaaaaaaa"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_extract(URL, extract))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and results[0]
+    assert cache._key_locks == {}  # блокировки ссылок не копятся
+
+
+def test_key_lock_released_after_failure(tmp_path):
+    cache = MetadataCache(cache_dir=str(tmp_path))
+
+    def extract(url):
+        raise RuntimeError("сбой экстракции")
+
+    for url in (URL, "https://example.com/a", "https://example.com/b"):
+        try:
+            cache.get_or_extract(url, extract)
+        except RuntimeError:
+            pass
+    assert cache.get_or_extract("https://example.com/c", lambda url: None) is None
+    assert cache._key_locks == {}
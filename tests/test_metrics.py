@@ -0,0 +1,17 @@
+import os
+
+from core.config import cfg
+from services.metrics import MetricsExporter, registry, start_export
+
+
+def test_export_is_off_by_default():
+    exporter = start_export()
+    assert exporter.path is None and not exporter.port
+    exporter.flush()
+    assert not os.path.exists(os.path.join(cfg.base_dir, "metrics.prom"))
+
+
+def test_file_is_written_when_enabled(tmp_path):
+    path = tmp_path / "metrics.prom"
+    MetricsExporter(str(path)).flush()
+    assert path.read_text(encoding="utf-8") == registry.render()
@@ -0,0 +1,34 @@
+from services.playlist_expander import PlaylistExpander
+
+CHANNEL = "https://www.youtube.com/@chan"
+TABS = {
+    CHANNEL: [
+        {"_type": "url", "url": f"{CHANNEL}/videos", "ie_key": "YoutubeTab"},
+        {"_type": "url", "url": f"{CHANNEL}/shorts", "ie_key": "YoutubeTab"},
+    ],
+    f"{CHANNEL}/videos": [{"_type": "url", "url": "https://youtu.be/a"}, {"_type": "url", "url": "https://youtu.be/b"}],
+    f"{CHANNEL}/shorts": [{"_type": "url", "url": "https://youtu.be/b"}, {"_type": "url", "url": "https://youtu.be/c"}],
+}
+
+
+class FakeDownloader:
+    """expand_playlist как у VideoDownloader; считает одновременно открытые переборы (воркеры)."""
+
+    def __init__(self):
+        self.open = 0
+        self.max_open = 0
+
+    def expand_playlist(self, url):
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+        try:
+            yield from TABS[url]
+        finally:
+            self.open -= 1
+
+
+def test_channel_tabs_expand_one_at_a_time():
+    downloader = FakeDownloader()
+    urls = list(PlaylistExpander(downloader).urls(CHANNEL))
+    assert urls == ["https://youtu.be/a", "https://youtu.be/b", "https://youtu.be/c"]
+    assert downloader.max_open == 1
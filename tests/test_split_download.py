@@ -0,0 +1,119 @@
+import os
+import math
+import subprocess
+
+import pytest
+
+from core.config import cfg
+from core.models import DownloadTask, DownloadTaskResult
+from services.download_archive import DownloadArchive
+from services.split_download import SplitDownload, keyframe_cuts
+
+FPS = 25
+GOP = 50  # ключевой кадр каждые 2 с
+DURATION = 12
+
+needs_ffmpeg = pytest.mark.skipif(not os.path.isfile(cfg.ffmpeg_path), reason="нужен ffmpeg")
+
+
+def _ffmpeg(*args: str) -> str:
+    proc = subprocess.run(
+        [cfg.ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin", *args],
+        capture_output=True, text=True, check=True,
+    )
+    return proc.stdout
+
+
+def _frame_hashes(path: str) -> list:
+    """md5 декодированных кадров видеодорожки по порядку (без меток времени)."""
+    out = _ffmpeg("-i", path, "-map", "0:v:0", "-f", "framemd5", "-")
+    return [line.rsplit(",", 1)[1].strip() for line in out.splitlines() if line and not line.startswith("#")]
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    """H.264 с B-кадрами: dts ключевого кадра раньше его pts."""
+    path = str(tmp_path_factory.mktemp("src") / "src.mp4")
+    _ffmpeg(
+        "-f", "lavfi", "-i", f"testsrc=size=160x120:rate={FPS}:duration={DURATION}",
+        "-c:v", "libx264", "-g", str(GOP), "-keyint_min", str(GOP), "-sc_threshold", "0",
+        "-bf", "2", "-pix_fmt", "yuv420p", path,
+    )
+    return path
+
+
+def _task(path) -> DownloadTask:
+    return DownloadTask(url="https://bench.invalid/watch/split", path=str(path), mode="video", quality_format="best")
+
+
+def _download_part(source: str, cut, target: str) -> None:
+    """Как FFmpegFD yt-dlp для --download-sections: -ss/-t перед входом, копия потоков."""
+    start, end = cut
+    args = ["-ss", str(start)] if start else []
+    if not math.isinf(end):
+        args += ["-t", str(end - start)]
+    _ffmpeg(*args, "-i", source, "-map", "0", "-c", "copy", target)
+
+
+@needs_ffmpeg
+def test_keyframe_cuts_start_on_keyframes(source):
+    cuts = keyframe_cuts(source, DURATION, 4)
+    starts = [start for start, _ in cuts]
+    # номинальные границы 3, 6, 9 с -> ключевые кадры не позже них
+    assert starts == pytest.approx([0, 2, 6, 8], abs=1e-3)
+    assert math.isinf(cuts[-1][1])
+    for (start, end), (next_start, _) in zip(cuts, cuts[1:]):
+        assert start < end < next_start  # конец — dts следующего ключевого кадра
+
+
+@needs_ffmpeg
+def test_parts_concat_to_source_packets(source, tmp_path):
+    cuts = keyframe_cuts(source, DURATION, 4)
+    workdir = tmp_path / ".split"
+    workdir.mkdir()
+    for j, cut in enumerate(cuts):
+        _download_part(source, cut, str(workdir / f"part_{j:03d}.mp4"))
+
+    target = str(tmp_path / "video.mp4")
+    parts = [_task(workdir)] * len(cuts)
+    split = SplitDownload(1, _task(tmp_path), target, str(workdir), parts)
+    for j in range(len(cuts)):
+        split.attach(10 + j)
+    results = [split.part_finished(10 + j, DownloadTaskResult(10 + j, "success", "")) for j in range(len(cuts))]
+    assert results == [False] * (len(cuts) - 1) + [True]
+
+    result = split.finish(DownloadArchive(str(tmp_path / "archive.sqlite3")))
+    assert result.status == "success", result.message
+    assert _frame_hashes(target) == _frame_hashes(source)  # ровно кадры исходника, без повторов
+    assert not workdir.exists()
+
+
+def test_failed_part_fails_the_group(tmp_path):
+    workdir = tmp_path / ".split"
+    workdir.mkdir()
+    split = SplitDownload(1, _task(tmp_path), str(tmp_path / "v.mp4"), str(workdir), [_task(workdir)] * 3)
+    for idx in (1, 2, 3):
+        split.attach(idx)
+    split.part_finished(1, DownloadTaskResult(1, "cancelled", "⛔ Отменено"))
+    split.part_finished(2, DownloadTaskResult(2, "unknown", "❌ HTTP Error 403"))
+    assert split.part_finished(3, DownloadTaskResult(3, "success", "✅ Готово"))
+
+    result = split.finish(DownloadArchive(str(tmp_path / "archive.sqlite3")))
+    assert (result.index, result.status, result.message) == (1, "unknown", "❌ HTTP Error 403")
+    assert not workdir.exists()
+
+
+def test_missing_part_file_is_an_error(tmp_path):
+    workdir = tmp_path / ".split"
+    workdir.mkdir()
+    for j in range(2):
+        (workdir / f"part_{j:03d}.mp4").write_bytes(b"")
+    (workdir / "part_002.mp4.part").write_bytes(b"")  # недокачанная часть не считается
+    split = SplitDownload(1, _task(tmp_path), str(tmp_path / "v.mp4"), str(workdir), [_task(workdir)] * 3)
+    for idx in (1, 2, 3):
+        split.attach(idx)
+        split.part_finished(idx, DownloadTaskResult(idx, "success", ""))
+
+    result = split.finish(DownloadArchive(str(tmp_path / "archive.sqlite3")))
+    assert result.status == "unknown"
+    assert "2 из 3" in result.message
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from core.models import DownloadTask
+from services.stall_watchdog import StallWatchdog
+from services.video_downloader import VideoDownloader
+
+
+@pytest.fixture
+def watchdog(monkeypatch):
+    monkeypatch.setattr(StallWatchdog, "CHECK_INTERVAL", 0.1)
+    return StallWatchdog(stall_timeout=1)
+
+
+def _section_task(path, name: str) -> DownloadTask:
+    return DownloadTask(
+        url=f"https://bench.invalid/watch/{name}",
+        path=str(path),
+        mode="together",
+        quality_format="best",
+        time_sections=((0.0, 30.0),),
+    )
+
+
+def test_activity_resets_stall_timer(watchdog, tmp_path):
+    target = tmp_path / "out.part"
+    target.write_bytes(b"")
+    fired = []
+    watchdog.register(1, fired.append, lambda: target.stat().st_size)
+    try:
+        for _ in range(25):  # 2.5 с без событий, но файл растёт
+            with open(target, "ab") as f:
+                f.write(b"x")
+            time.sleep(0.1)
+        assert not fired
+
+        # файл перестал расти; рост, замеченный последним опросом, даёт ещё stall_timeout
+        time.sleep(2.5)
+        assert fired and "нет прогресса" in fired[0]
+    finally:
+        watchdog.unregister(1)
+
+
+def test_no_activity_probe_is_a_stall(watchdog):
+    fired = []
+    watchdog.register(1, fired.append)
+    try:
+        time.sleep(1.5)
+        assert len(fired) == 1
+    finally:
+        watchdog.unregister(1)
+
+
+def test_silent_section_download_outlives_stall_timeout(watchdog, tmp_path, monkeypatch):
+    # ffmpeg качает фрагмент 2.5 с без единого события прогресса
+    monkeypatch.setenv("FAKE_YTDLP_LINES", "25")
+    monkeypatch.setenv("FAKE_YTDLP_INTERVAL", "0.1")
+    events = []
+    result = VideoDownloader(watchdog=watchdog).run_task(
+        _section_task(tmp_path, "silent"), 1, on_progress=events.append
+    )
+    assert result.status == "success", result.message
+    assert not any("повтор" in p.message for p in events)
+
+
+def test_hung_section_download_is_killed(watchdog, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_YTDLP_LINES", "100")
+    monkeypatch.setenv("FAKE_YTDLP_INTERVAL", "0.1")
+    monkeypatch.setenv("FAKE_YTDLP_SILENT", "1")
+    monkeypatch.setattr(VideoDownloader, "MAX_STALL_RETRIES", 0)
+    started = time.monotonic()
+    result = VideoDownloader(watchdog=watchdog).run_task(_section_task(tmp_path, "hung"), 1)
+    assert result.status == "unknown"
+    assert "Зависание" in result.message
+    assert time.monotonic() - started < 8
@@ -0,0 +1,60 @@
+import json
+import urllib.request
+
+import pytest
+
+from services.stream_cache import MB, StreamCache
+
+
+def _info(path) -> str:
+    info = {
+        "extractor_key": "Bench", "id": "abc",
+        "formats": [{"format_id": "137", "url": "https://bench.invalid/v", "protocol": "https",
+                     "fragments": [{"url": "https://bench.invalid/f1"}]}],
+    }
+    path.write_text(json.dumps(info), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    def make(folder: str) -> StreamCache:
+        cache = StreamCache(cache_dir=str(tmp_path / folder), max_bytes=10 * MB)
+        source = tmp_path / "137.mp4"
+        source.write_bytes(b"x" * 1000)
+        cache.store("bench_abc", "137", str(source), move=True)
+        cache._executor.shutdown(wait=True)
+        return cache
+    return make
+
+
+def _served_format(info_json: str) -> dict:
+    with open(info_json, encoding="utf-8") as f:
+        return json.load(f)["formats"][0]
+
+
+def test_serves_local_file(cache, tmp_path):
+    stream_cache = cache("cache")
+    key, served = stream_cache.serve(1, _info(tmp_path / "a.info.json"), sections=True)
+    fmt = _served_format(served)
+    assert key == "bench_abc"
+    assert fmt["url"].startswith("file:") and "fragments" not in fmt
+    stream_cache.release(1)
+
+
+def test_quoted_path_is_not_served_to_ffmpeg(cache, tmp_path):
+    stream_cache = cache("кэш потоков")
+    info_json = _info(tmp_path / "a.info.json")
+    # фрагменты режет ffmpeg: он не раскодирует %20 и %D0..
+    assert stream_cache.serve(1, info_json, sections=True) == ("bench_abc", info_json)
+    # целиком поток читает urllib, которому кодирование не мешает
+    _, served = stream_cache.serve(2, info_json)
+    with urllib.request.urlopen(_served_format(served)["url"]) as f:
+        assert len(f.read()) == 1000
+    stream_cache.release(2)
+
+
+def test_disabled_by_default(monkeypatch):
+    from core.config import cfg
+    monkeypatch.setattr(cfg, "load_setting", lambda key, default=None: default)
+    assert not StreamCache(cache_dir="unused").enabled
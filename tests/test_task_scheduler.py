@@ -0,0 +1,27 @@
+from core.models import DownloadTask
+from services.task_scheduler import TaskScheduler
+
+
+def _task(n, mode="video"):
+    return DownloadTask(url=f"https://www.youtube.com/watch?v=video{n:06d}", path="", mode=mode, quality_format="")
+
+
+def test_reserved_slot_stays_free_without_small_tasks():
+    queue = TaskScheduler()
+    queue.push(1, _task(1))
+    queue.push(2, _task(2))
+
+    assert queue.pop(large_running=2, slots=3) is None  # последний слот — мелким задачам
+    assert len(queue) == 2
+    assert queue.pop(large_running=1, slots=3)[0] == 1
+
+    queue.push(3, _task(3, mode="audio"))
+    assert queue.pop(large_running=2, slots=3)[0] == 3  # мелкая задача занимает резерв
+
+
+def test_single_slot_has_no_reserve():
+    queue = TaskScheduler()
+    queue.push(1, _task(1))
+
+    assert queue.pop(large_running=0, slots=1)[0] == 1
+    assert queue.pop(large_running=0, slots=1) is None  # очередь пуста
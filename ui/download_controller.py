@@ -3,6 +3,7 @@ from PySide6.QtCore import QObject, Signal
 from PySide6.QtWidgets import QMessageBox
 
 from services.download_pool_manager import DownloadPoolManager
+from services.download_planner import plan_tasks
 from services.video_downloader import DownloadTask, DownloadTaskResult, DownloadProgress
 from services.cookie_worker import CookieManagerAsync, CookieRunnable
 from core.utils import Logger
@@ -17,6 +18,7 @@ class DownloadController(QObject):
     progress = Signal(str)          # текст в статус-бар
     task_done = Signal(DownloadTaskResult)
     pool_status = Signal(int, int)  # активные, в очереди
+    bandwidth_status = Signal(int, int)  # используемая скорость, лимит (байт/с)
     finished = Signal(bool)         # True – всё успешно
     cookie_progress = Signal(str)   # прогресс получения cookies
 
@@ -26,8 +28,12 @@ class DownloadController(QObject):
         # --- пул параллельных загрузок ---
         self.pool = DownloadPoolManager(max_threads=3)
         self.pool.task_progress.connect(self._on_task_progress)
-        self.pool.task_finished.connect(self.task_done.emit)
-        self.pool.pool_status.connect(self.pool_status.emit)
+        self.pool.task_finished.connect(self._on_task_finished)
+        self.pool.pool_status.connect(self._on_pool_status)
+        self.pool.bandwidth_status.connect(self.bandwidth_status.emit)
+
+        self._running = False
+        self._failed = 0
 
         # --- асинхронные cookies ---
         self.cookie_async = CookieManagerAsync()
@@ -36,17 +42,48 @@ class DownloadController(QObject):
     # ---------- публичные методы ----------
     def start(self, tasks: list[DownloadTask]) -> None:
         """Запустить загрузки в пуле."""
-        if self.pool.active_tasks or self.pool.queue:
+        if self.pool.is_busy():
             logger.warning("Загрузка уже запущена")
             return
 
-        self.pool.add_tasks(tasks)
+        self._begin()
+        self.pool.add_tasks(plan_tasks(tasks))
+
+    def unfinished_tasks(self) -> list:
+        """Незавершённые задачи прошлого запуска: [(id в журнале, DownloadTask)]."""
+        return self.pool.journal.unfinished()
+
+    def resume(self, entries: list) -> None:
+        """Докачать задачи из журнала."""
+        self._begin()
+        self.pool.resume_tasks(entries)
+
+    def discard_unfinished(self) -> None:
+        """Отказаться от докачки: задачи помечаются отменёнными."""
+        self.pool.journal.cancel_unfinished()
+
+    def _begin(self) -> None:
+        self._running = True
+        self._failed = 0
 
     def cancel(self) -> None:
         """Отменить все загрузки."""
         self.pool.cancel_all()
         logger.info("Загрузки отменены пользователем")
 
+    def cancel_task(self, url: str) -> None:
+        """Отменить загрузку одной строки очереди (у плейлиста — все его видео)."""
+        self.pool.cancel_source(url)
+        logger.info(f"Загрузка отменена пользователем: {url}")
+
+    def set_bandwidth_limit(self, mbit: int) -> None:
+        """Общий лимит скорости (Мбит/с, 0 — без ограничения). Применяется сразу, без сохранения."""
+        self.pool.set_bandwidth_limit(mbit)
+
+    def shutdown(self) -> None:
+        """Остановить пул перед закрытием окна."""
+        self.pool.shutdown()
+
     def fetch_cookies_async(self) -> None:
         """Получить cookies в фоне."""
         if self._current_cookie_worker:
@@ -58,6 +95,17 @@ class DownloadController(QObject):
         self._current_cookie_worker = worker
 
     # ---------- слоты ----------
+    def _on_task_finished(self, index: int, result: DownloadTaskResult):
+        if result.status not in ("success", "cancelled"):
+            self._failed += 1
+        self.task_done.emit(result)
+
+    def _on_pool_status(self, active: int, queued: int):
+        self.pool_status.emit(active, queued)
+        if self._running and not active and not queued:
+            self._running = False
+            self.finished.emit(self._failed == 0)
+
     def _on_task_progress(self, index: int, progress: DownloadProgress):
         """Пересылаем живой прогресс в UI."""
         self.progress.emit(progress.message)
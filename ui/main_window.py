@@ -1,14 +1,17 @@
 ﻿import os
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QComboBox,
-    QLineEdit, QPushButton, QLabel, QFileDialog, QScrollArea, QMessageBox, QFrame
+    QLineEdit, QPushButton, QLabel, QFileDialog, QMessageBox, QFrame,
+    QSpinBox, QApplication
 )
 from PySide6.QtCore import Qt, QTimer, Signal
 from PySide6.QtGui import QIcon
 
 from core.config import cfg, VIDEO_QUALITIES
 from core.utils import play_sound
-from ui.ui_qt_widgets import UrlInputRow
+from ui.ui_qt_widgets import UrlQueueView
+from ui.url_queue_model import UrlQueueModel
+from core.utils import parse_urls
 from ui.download_controller import DownloadController
 from services.video_downloader import DownloadTask, DownloadTaskResult, DownloadProgress
 
@@ -23,16 +26,19 @@ class MainWindow(QMainWindow):
 
         self._build_ui()
         self._controller = DownloadController(self)
+        self._cancel_requested = False
 
         # --- подключение новых сигналов ---
         self._controller.progress.connect(self.status_label.setText)
         self._controller.pool_status.connect(self._on_pool_status)
+        self._controller.bandwidth_status.connect(self._on_bandwidth_status)
         self._controller.task_done.connect(self._on_task_done)
         self._controller.finished.connect(self._on_download_finished)
         self._controller.cookie_progress.connect(self.status_label.setText)
 
         self._load_settings()
         self._check_cookies_status()
+        QTimer.singleShot(0, self._offer_resume)
 
     # ---------- UI ----------
     def _build_ui(self) -> None:
@@ -70,10 +76,35 @@ class MainWindow(QMainWindow):
 
         lay.addWidget(self._section("Дополнительно"))
         self.cb_fragment = QCheckBox("✂️ Фрагмент (Timecode)")
+        self.cb_fragment.setToolTip("Ctrl+D в списке — ещё один фрагмент той же ссылки")
+        self.cb_precise = QCheckBox("🎯 Точная нарезка (перекодирование)")
+        self.cb_precise.setToolTip(
+            "Без галочки фрагменты режутся по ключевым кадрам без перекодирования: "
+            "быстро, но границы могут сдвинуться на доли секунды"
+        )
+        self.cb_precise.setEnabled(False)
         self.cb_queue = QCheckBox("📝 Очередь ссылок")
         lay.addWidget(self.cb_fragment)
+        lay.addWidget(self.cb_precise)
         lay.addWidget(self.cb_queue)
 
+        self.spin_split = QSpinBox()
+        self.spin_split.setRange(1, 16)
+        self.spin_split.setPrefix("⚡ Частей: ")
+        self.spin_split.setSpecialValueText("⚡ Качать целиком")
+        self.spin_split.setToolTip(
+            "Длинное видео делится по ключевым кадрам, части качаются параллельно "
+            "и склеиваются без перекодирования"
+        )
+        lay.addWidget(self.spin_split)
+
+        self.spin_bandwidth = QSpinBox()
+        self.spin_bandwidth.setRange(0, 10000)
+        self.spin_bandwidth.setSuffix(" Мбит/с")
+        self.spin_bandwidth.setSpecialValueText("🌐 Скорость без ограничения")
+        self.spin_bandwidth.setToolTip("Общий лимит скорости для всех загрузок")
+        lay.addWidget(self.spin_bandwidth)
+
         lay.addWidget(self._section("Папка сохранения"))
         self.path_edit = QLineEdit()
         self.path_edit.setPlaceholderText("📁 Выберите папку...")
@@ -117,15 +148,34 @@ class MainWindow(QMainWindow):
         title.setObjectName("TitleLabel")
         lay.addWidget(title)
 
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll.setMinimumHeight(400)
-        self.scroll_content = QWidget()
-        self.rows_layout = QVBoxLayout(self.scroll_content)
-        self.rows_layout.setAlignment(Qt.AlignTop)
-        self.rows_layout.setSpacing(10)
-        scroll.setWidget(self.scroll_content)
-        lay.addWidget(scroll)
+        tools = QHBoxLayout()
+        btn_paste = QPushButton("📋 Вставить из буфера")
+        btn_paste.setObjectName("SecondaryBtn")
+        btn_paste.clicked.connect(self._paste_urls)
+        btn_import = QPushButton("📄 Импорт из файла")
+        btn_import.setObjectName("SecondaryBtn")
+        btn_import.clicked.connect(self._import_urls)
+        btn_clear = QPushButton("🗑️ Очистить")
+        btn_clear.setObjectName("SecondaryBtn")
+        btn_clear.clicked.connect(self._clear_urls)
+        self.urls_count = QLabel("")
+        self.urls_count.setStyleSheet("color: #aaa; font-size: 12px;")
+        for btn in (btn_paste, btn_import, btn_clear):
+            tools.addWidget(btn)
+        tools.addStretch()
+        tools.addWidget(self.urls_count)
+        lay.addLayout(tools)
+
+        self.url_model = UrlQueueModel(self)
+        self.url_model.rowsInserted.connect(self._update_urls_count)
+        self.url_model.rowsRemoved.connect(self._update_urls_count)
+        self.url_model.modelReset.connect(self._update_urls_count)
+        self.url_view = UrlQueueView(self.url_model)
+        self.url_view.setMinimumHeight(400)
+        self.url_view.show_time(False)
+        self.url_view.urls_pasted.connect(self._add_urls)  # Ctrl+V — как кнопка вставки
+        self.url_view.cancel_requested.connect(self._cancel_rows)
+        lay.addWidget(self.url_view)
 
         bottom = QFrame()
         bottom.setObjectName("StatusBar")
@@ -135,14 +185,25 @@ class MainWindow(QMainWindow):
         self.status_label = QLabel("✅ Готов к работе")
         self.status_label.setStyleSheet("color: #00d4ff; font-size: 14px;")
 
+        self.bandwidth_label = QLabel("")
+        self.bandwidth_label.setStyleSheet("color: #aaa; font-size: 12px;")
+
         self.btn_download = QPushButton("⬇️ СКАЧАТЬ")
         self.btn_download.setObjectName("DownloadBtn")
         self.btn_download.setFixedHeight(50)
         self.btn_download.setMinimumWidth(200)
         self.btn_download.clicked.connect(self._start_download)
 
+        self.btn_cancel = QPushButton("⏹ Отмена")
+        self.btn_cancel.setObjectName("SecondaryBtn")
+        self.btn_cancel.setFixedHeight(50)
+        self.btn_cancel.setDisabled(True)
+        self.btn_cancel.clicked.connect(self._cancel_download)
+
         blay.addWidget(self.status_label)
         blay.addStretch()
+        blay.addWidget(self.bandwidth_label)
+        blay.addWidget(self.btn_cancel)
         blay.addWidget(self.btn_download)
 
         lay.addWidget(bottom)
@@ -157,10 +218,17 @@ class MainWindow(QMainWindow):
     def _load_settings(self) -> None:
         if path := cfg.load_setting("download_path"):
             self.path_edit.setText(path)
+        self.spin_bandwidth.setValue(int(cfg.load_setting("bandwidth_limit_mbit", 0)))
+        self.spin_bandwidth.valueChanged.connect(self._controller.set_bandwidth_limit)
+        # в файл — по окончании ввода, а не на каждом шаге счётчика
+        self.spin_bandwidth.editingFinished.connect(self._save_bandwidth_limit)
 
         self.cb_fragment.clicked.connect(lambda: self._toggle_fragments(self.cb_fragment.isChecked()))
         self.cb_queue.clicked.connect(lambda: self._toggle_queue(self.cb_queue.isChecked()))
-        self.add_row()
+        self.url_model.set_multi(self.cb_queue.isChecked())
+
+    def _save_bandwidth_limit(self) -> None:
+        cfg.save_setting("bandwidth_limit_mbit", self.spin_bandwidth.value())
 
     # ---------- cookies ----------
     def _check_cookies_status(self) -> None:
@@ -184,44 +252,49 @@ class MainWindow(QMainWindow):
         """Запускаем фоновое обновление cookies."""
         self._controller.fetch_cookies_async()
 
-    # ---------- строки URL ----------
-    def add_row(self) -> None:
-        if len(self.url_rows) >= 8:
+    # ---------- очередь ссылок ----------
+    def _paste_urls(self) -> None:
+        self._add_urls(parse_urls(QApplication.clipboard().text()))
+
+    def _import_urls(self) -> None:
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Файл со ссылками", "", "Текст (*.txt *.csv *.list);;Все файлы (*)"
+        )
+        if not path:
             return
-        idx = len(self.url_rows)
-        row = UrlInputRow(idx)
-        row.text_started.connect(self._on_row_typing)
-        self.rows_layout.addWidget(row)
-        self.url_rows.append(row)
-        QTimer.singleShot(0, lambda: row.toggle_time(self.cb_fragment.isChecked()))
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                urls = parse_urls(f.read())
+        except OSError as e:
+            self.status_label.setText(f"❌ Не удалось прочитать файл: {e}")
+            return
+        self._add_urls(urls)
+
+    def _add_urls(self, urls: list[str]) -> None:
+        if len(urls) > 1 and not self.cb_queue.isChecked():
+            # Несколько ссылок — включаем очередь
+            self.cb_queue.setChecked(True)
+            self._toggle_queue(True)
+        self._on_urls_added(self.url_model.add_urls(urls))
+
+    def _on_urls_added(self, added: int) -> None:
+        self.status_label.setText(f"➕ Добавлено ссылок: {added}" if added else "Новых ссылок нет")
 
-    def _on_row_typing(self) -> None:
-        if self.cb_queue.isChecked():
-            self.add_row()
+    def _clear_urls(self) -> None:
+        self.url_model.clear()
+
+    def _update_urls_count(self, *args) -> None:
+        count = self.url_model.url_count()
+        self.urls_count.setText(f"Ссылок: {count}" if count else "")
 
     # ---------- фрагменты ----------
     def _toggle_fragments(self, show: bool) -> None:
-        for row in self.url_rows:
-            QTimer.singleShot(0, lambda r=row, s=show: r.toggle_time(s))
-        QTimer.singleShot(10, self.scroll_content.adjustSize)
+        self.url_view.show_time(show)
+        self.cb_precise.setEnabled(show)
 
     # ---------- очередь ----------
     def _toggle_queue(self, state: bool) -> None:
-        if not state:
-            QTimer.singleShot(0, self._clear_extra_rows)
-        else:
-            if self.url_rows and self.url_rows[-1].get_url():
-                self.add_row()
-
-    def _clear_extra_rows(self) -> None:
-        while len(self.url_rows) > 1:
-            row = self.url_rows.pop()
-            self.rows_layout.removeWidget(row)
-            row.setParent(None)
-            row.deleteLater()
-        if self.url_rows:
-            self.url_rows[0].url_input.clear()
-            self.url_rows[0]._emitted = False
+        self.url_model.set_multi(state)
 
     # ---------- загрузка ----------
     def _start_download(self) -> None:
@@ -242,23 +315,60 @@ class MainWindow(QMainWindow):
 
         self.btn_download.setDisabled(True)
         self.btn_download.setText("⏳ Загрузка...")
+        self.btn_cancel.setDisabled(False)
+        self.url_view.set_downloading(True)
+        self._cancel_requested = False
         self._controller.start(tasks)
 
+    def _cancel_download(self) -> None:
+        self._cancel_requested = True
+        self.btn_cancel.setDisabled(True)
+        self.url_view.set_downloading(False)
+        self.status_label.setText("⏹ Отмена...")
+        self._controller.cancel()
+
+    def _cancel_rows(self, urls: list[str]) -> None:
+        """Отмена из контекстного меню строк: остальные загрузки продолжаются."""
+        for url in urls:
+            self._controller.cancel_task(url)
+
+    def _offer_resume(self) -> None:
+        """Предложить докачать задачи, прерванные закрытием или сбоем."""
+        entries = self._controller.unfinished_tasks()
+        if not entries:
+            return
+        ans = QMessageBox.question(
+            self,
+            "Незавершённые загрузки",
+            f"Найдено незавершённых загрузок: {len(entries)}.\n\n"
+            "Продолжить их? Уже скачанные части будут использованы.",
+            QMessageBox.Yes | QMessageBox.No,
+        )
+        if ans != QMessageBox.Yes:
+            self._controller.discard_unfinished()
+            return
+        self.btn_download.setDisabled(True)
+        self.btn_download.setText("⏳ Загрузка...")
+        self.btn_cancel.setDisabled(False)
+        self.url_view.set_downloading(True)
+        self._cancel_requested = False
+        self._controller.resume(entries)
+
     def _collect_tasks(self) -> list[DownloadTask]:
         tasks: list[DownloadTask] = []
         fmt_key = self.combo_quality.currentText()
         quality = VIDEO_QUALITIES[fmt_key]
 
-        for row in self.url_rows:
-            url = row.get_url()
-            if not url:
-                continue
+        # Строки одной ссылки сводятся в одну задачу: все фрагменты — за один проход
+        sections: dict[str, list[tuple[int, int]]] = {}
+        for url, section in self.url_model.entries():
+            sections.setdefault(url, [])
+            if self.cb_fragment.isChecked() and section and section[1] > section[0]:
+                sections[url].append(section)
 
-            time_sec = None
-            if self.cb_fragment.isChecked():
-                time_sec = row.time_widget.get_seconds()
-                if not time_sec:
-                    continue
+        for url, url_sections in sections.items():
+            if self.cb_fragment.isChecked() and not url_sections:
+                continue
 
             modes = []
             if self.cb_together.isChecked():
@@ -277,7 +387,9 @@ class MainWindow(QMainWindow):
                         path=self.path_edit.text(),
                         mode=mode,
                         quality_format=quality,
-                        time_section=time_sec,
+                        time_sections=tuple(sorted(set(url_sections))),
+                        precise_cuts=self.cb_precise.isChecked(),
+                        split_parts=self.spin_split.value(),
                         download_cover=self.cb_cover.isChecked() and mode == modes[0],
                     )
                 )
@@ -306,11 +418,24 @@ class MainWindow(QMainWindow):
     def _on_pool_status(self, active: int, queued: int):
         self.status_label.setText(f"Активно: {active}  |  В очереди: {queued}")
 
+    def _on_bandwidth_status(self, used: int, total: int):
+        used_mbit = used / 125_000
+        if total:
+            self.bandwidth_label.setText(f"Канал: {used_mbit:.1f} / {total / 125_000:.0f} Мбит/с")
+        elif used:
+            self.bandwidth_label.setText(f"Канал: {used_mbit:.1f} Мбит/с")
+        else:
+            self.bandwidth_label.setText("")
+
     def _on_download_finished(self, success: bool):
         self.btn_download.setDisabled(False)
         self.btn_download.setText("⬇️ СКАЧАТЬ")
+        self.btn_cancel.setDisabled(True)
+        self.url_view.set_downloading(False)
 
-        if success:
+        if self._cancel_requested:
+            self.status_label.setText("⛔ Загрузка отменена")
+        elif success:
             self.status_label.setText("✅ Все файлы загружены!")
             play_sound(True)
         else:
@@ -326,9 +451,7 @@ class MainWindow(QMainWindow):
             self.status_label.setText("⚠️ Ошибка (см. логи)")
             play_sound(False)
 
-    # ---------- свойства ----------
-    @property
-    def url_rows(self):
-        if not hasattr(self, "_url_rows"):
-            self._url_rows: list[UrlInputRow] = []
-        return self._url_rows
\ No newline at end of file
+    def closeEvent(self, event) -> None:
+        self._save_bandwidth_limit()  # значение, изменённое стрелками без потери фокуса
+        self._controller.shutdown()
+        super().closeEvent(event)
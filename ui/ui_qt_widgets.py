@@ -1,98 +1,106 @@
-﻿from PySide6.QtWidgets import (QWidget, QHBoxLayout, QLineEdit, QSpinBox,
-                               QLabel, QFrame)
-from PySide6.QtCore import Qt, Signal
+﻿from PySide6.QtWidgets import (QTableView, QStyledItemDelegate, QTimeEdit,
+                               QHeaderView, QAbstractItemView, QApplication, QMenu)
+from PySide6.QtCore import Qt, QTime, Signal
+from PySide6.QtGui import QKeySequence
 
+from ui.url_queue_model import UrlQueueModel
+from core.utils import parse_time, parse_urls
 
-class TimeSpinBox(QSpinBox):
 
-    def __init__(self, max_val=59):
-        super().__init__()
-        self.setRange(0, max_val)
-        self.setButtonSymbols(QSpinBox.NoButtons)  # Убираем стрелочки
-        self.setAlignment(Qt.AlignCenter)
-        self.setFixedWidth(35)
-
-    def textFromValue(self, val):
-        return f"{val:02d}"
-
-
-class TimeSectionWidget(QWidget):
-    """Группа: Начало (ЧЧ:ММ:СС) — Конец (ЧЧ:ММ:СС)"""
-
-    def __init__(self):
-        super().__init__()
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setSpacing(2)
-
-        self.start_h = TimeSpinBox(23)
-        self.start_m = TimeSpinBox(59)
-        self.start_s = TimeSpinBox(59)
-
-        self.end_h = TimeSpinBox(23)
-        self.end_m = TimeSpinBox(59)
-        self.end_s = TimeSpinBox(59)
-
-        # Добавляем виджеты (Начало)
-        for w in [self.start_h, self.start_m, self.start_s]:
-            layout.addWidget(w)
+class TimeSectionDelegate(QStyledItemDelegate):
+    """Редактор ЧЧ:ММ:СС для колонок «Начало»/«Конец». Создаётся только на время правки."""
 
-        layout.addWidget(QLabel(" — "))
+    def createEditor(self, parent, option, index):
+        editor = QTimeEdit(parent)
+        editor.setDisplayFormat("HH:mm:ss")
+        editor.setButtonSymbols(QTimeEdit.NoButtons)  # Убираем стрелочки
+        editor.setAlignment(Qt.AlignCenter)
+        return editor
 
-        # Добавляем виджеты (Конец)
-        for w in [self.end_h, self.end_m, self.end_s]:
-            layout.addWidget(w)
+    def setEditorData(self, editor, index):
+        seconds = parse_time(index.data(Qt.EditRole) or "") or 0
+        editor.setTime(QTime(0, 0).addSecs(seconds))
 
-    def get_seconds(self):
-        """Возвращает (start_sec, end_sec) или None"""
-        start = (self.start_h.value() * 3600 +
-                 self.start_m.value() * 60 +
-                 self.start_s.value())
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.time().toString("HH:mm:ss"), Qt.EditRole)
 
-        end = (self.end_h.value() * 3600 +
-               self.end_m.value() * 60 +
-               self.end_s.value())
 
-        # Проверка на валидность
-        if start >= end and end > 0:
-            return None
-        return (start, end)
+class UrlQueueView(QTableView):
+    """
+    Таблица ссылок: Delete удаляет выделенное, Ctrl+V отдаёт ссылки из буфера
+    окну (оно добавляет их так же, как кнопка вставки), Ctrl+D повторяет строку
+    для ещё одного фрагмента той же ссылки. Во время загрузки контекстное меню
+    отменяет загрузку выделенных строк.
+    """
+    urls_pasted = Signal(list)  # ссылки из буфера обмена
+    cancel_requested = Signal(list)  # ссылки строк, загрузку которых нужно отменить
 
-
-class UrlInputRow(QWidget):
-    """Строка: [Поле ввода URL] [Виджет времени (скрыт/показан)]"""
-    text_started = Signal()
-
-    def __init__(self, index):
+    def __init__(self, model: UrlQueueModel):
         super().__init__()
-        self.layout = QHBoxLayout(self)
-        self.layout.setContentsMargins(0, 5, 0, 5)
-        self.layout.setSpacing(10)
-
-        self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText(f"Ссылка #{index + 1}")
-        self.url_input.textChanged.connect(self._on_text_change)
-
-        self.time_widget = TimeSectionWidget()
-        self.time_widget.setVisible(False)  # Скрыто по умолчанию
-
-        self.layout.addWidget(self.url_input)
-        self.layout.addWidget(self.time_widget)
-
-        self._emitted = False
-
-    def _on_text_change(self, text):
-        if text and not self._emitted:
-            self.text_started.emit()
-            self._emitted = True
-
-    def toggle_time(self, show):
-        """Показать/скрыть виджет времени с обновлением layout."""
-        self.time_widget.setVisible(show)
-        self.time_widget.updateGeometry()
-        self.updateGeometry()
-        if self.parent():
-            self.parent().updateGeometry()
-
-    def get_url(self):
-        return self.url_input.text().strip()
\ No newline at end of file
+        self.setModel(model)
+        self.setItemDelegateForColumn(UrlQueueModel.COL_START, TimeSectionDelegate(self))
+        self.setItemDelegateForColumn(UrlQueueModel.COL_END, TimeSectionDelegate(self))
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setEditTriggers(
+            QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed
+            | QAbstractItemView.AnyKeyPressed
+        )
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+        self._downloading = False
+
+        # Фиксированная высота строк: представлению не нужно измерять тысячи строк
+        rows = self.verticalHeader()
+        rows.setVisible(False)
+        rows.setSectionResizeMode(QHeaderView.Fixed)
+        rows.setDefaultSectionSize(30)
+
+        cols = self.horizontalHeader()
+        cols.setSectionResizeMode(QHeaderView.Fixed)
+        cols.setSectionResizeMode(UrlQueueModel.COL_URL, QHeaderView.Stretch)
+        cols.resizeSection(UrlQueueModel.COL_INDEX, 50)
+        cols.resizeSection(UrlQueueModel.COL_START, 90)
+        cols.resizeSection(UrlQueueModel.COL_END, 90)
+
+    def queue_model(self) -> UrlQueueModel:
+        return self.model()
+
+    def show_time(self, show: bool) -> None:
+        """Показать/скрыть колонки фрагмента."""
+        self.setColumnHidden(UrlQueueModel.COL_START, not show)
+        self.setColumnHidden(UrlQueueModel.COL_END, not show)
+
+    def set_downloading(self, active: bool) -> None:
+        """Идёт загрузка: в контекстном меню строк доступна отмена."""
+        self._downloading = active
+
+    def contextMenuEvent(self, event):
+        row = self.rowAt(event.pos().y())
+        if not self._downloading or not 0 <= row < self.queue_model().url_count():
+            return
+        if row not in {i.row() for i in self.selectionModel().selectedRows()}:
+            self.selectRow(row)
+        rows = sorted({i.row() for i in self.selectionModel().selectedRows()})
+        urls = list(dict.fromkeys(
+            self.queue_model().index(r, UrlQueueModel.COL_URL).data()
+            for r in rows if r < self.queue_model().url_count()
+        ))
+        menu = QMenu(self)
+        action = menu.addAction("⏹ Отменить загрузку" if len(urls) == 1 else f"⏹ Отменить загрузки ({len(urls)})")
+        if menu.exec(event.globalPos()) is action:
+            self.cancel_requested.emit(urls)
+
+    def keyPressEvent(self, event):
+        if self.state() != QAbstractItemView.EditingState:
+            if event.matches(QKeySequence.Paste):
+                self.urls_pasted.emit(parse_urls(QApplication.clipboard().text()))
+                return
+            if event.key() in (Qt.Key_Delete, Qt.Key_Backspace):
+                rows = [i.row() for i in self.selectionModel().selectedRows()]
+                self.queue_model().remove_rows(rows)
+                return
+            if event.key() == Qt.Key_D and event.modifiers() == Qt.ControlModifier:
+                rows = [i.row() for i in self.selectionModel().selectedRows()]
+                self.queue_model().duplicate_rows(rows)
+                return
+        super().keyPressEvent(event)
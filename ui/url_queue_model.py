@@ -0,0 +1,197 @@
+# ui/url_queue_model.py
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PySide6.QtGui import QColor
+
+from core.utils import format_time, parse_time
+
+Section = Optional[Tuple[int, int]]
+
+
+class UrlQueueModel(QAbstractTableModel):
+    """
+    Очередь ссылок для QTableView.
+
+    Хранит только строки и пары секунд — без виджета на ссылку, поэтому
+    тысячи ссылок занимают сотни килобайт, а представление рисует лишь
+    видимые строки. Последняя строка всегда пустая: ввод в неё добавляет ссылку.
+    Вставка не повторяет ссылки; вторая строка той же ссылки (ещё один фрагмент)
+    создаётся через duplicate_rows.
+    """
+
+    COL_INDEX, COL_URL, COL_START, COL_END = range(4)
+    HEADERS = ("#", "Ссылка", "Начало", "Конец")
+    PLACEHOLDER = "Вставьте ссылку..."
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._urls: List[str] = []
+        self._sections: List[Section] = []
+        self._known: Counter = Counter()  # ссылка -> число строк с ней
+        self.multi = True  # False — одна ссылка (режим без очереди)
+
+    # ---------- Qt API ----------
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._urls) + (1 if self._can_add() else 0)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() != self.COL_INDEX:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        placeholder = row >= len(self._urls)
+
+        if role == Qt.ForegroundRole and placeholder:
+            return QColor("#666")
+        if role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        if placeholder:
+            return self.PLACEHOLDER if col == self.COL_URL and role == Qt.DisplayRole else ""
+        if col == self.COL_INDEX:
+            return str(row + 1)
+        if col == self.COL_URL:
+            return self._urls[row]
+        section = self._sections[row]
+        if col == self.COL_START:
+            return format_time(section[0] if section else None)
+        return format_time(section[1] if section else None)
+
+    def setData(self, index, value, role=Qt.EditRole) -> bool:
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        row, col = index.row(), index.column()
+
+        if col == self.COL_URL:
+            url = str(value).strip()
+            if row >= len(self._urls):
+                return bool(url) and self.add_urls([url]) > 0
+            if not url:
+                self.remove_rows([row])
+                return True
+            self._forget(self._urls[row])
+            self._urls[row] = url
+            self._known[url] += 1
+            self.dataChanged.emit(index, index)
+            return True
+
+        if row >= len(self._urls):
+            return False
+        seconds = parse_time(str(value)) if str(value).strip() else None
+        start, end = self._sections[row] or (0, 0)
+        if col == self.COL_START:
+            start = seconds or 0
+        else:
+            end = seconds or 0
+        self._sections[row] = (start, end) if start or end else None
+        self.dataChanged.emit(self.index(row, self.COL_START), self.index(row, self.COL_END))
+        return True
+
+    # ---------- публичные методы ----------
+    def add_urls(self, urls: Iterable[str]) -> int:
+        """Добавить ссылки одной вставкой (без дубликатов). Returns: сколько добавлено."""
+        fresh = list(dict.fromkeys(url for url in urls if url and url not in self._known))
+        if not self.multi:
+            fresh = fresh[:max(0, 1 - len(self._urls))]
+        if not fresh:
+            return 0
+        # учитываются только вставленные: отброшенные в режиме одной ссылки — не дубликаты
+        for url in fresh:
+            self._known[url] += 1
+
+        if not self.multi:
+            # одна строка — проще пересобрать модель
+            self.beginResetModel()
+            self._urls.extend(fresh)
+            self._sections.extend([None] * len(fresh))
+            self.endResetModel()
+            return len(fresh)
+
+        # новые строки встают перед пустой строкой ввода
+        first = len(self._urls)
+        self.beginInsertRows(QModelIndex(), first, first + len(fresh) - 1)
+        self._urls.extend(fresh)
+        self._sections.extend([None] * len(fresh))
+        self.endInsertRows()
+        return len(fresh)
+
+    def remove_rows(self, rows: Iterable[int]) -> None:
+        """Удалить строки (индексы представления)."""
+        rows = sorted({r for r in rows if 0 <= r < len(self._urls)}, reverse=True)
+        while rows:
+            # снизу вверх непрерывными диапазонами: одно уведомление на диапазон
+            last = first = rows.pop(0)
+            while rows and rows[0] == first - 1:
+                first = rows.pop(0)
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for url in self._urls[first:last + 1]:
+                self._forget(url)
+            del self._urls[first:last + 1]
+            del self._sections[first:last + 1]
+            self.endRemoveRows()
+
+    def duplicate_rows(self, rows: Iterable[int]) -> int:
+        """Повторить строки под исходными (та же ссылка, новый фрагмент). Returns: сколько добавлено."""
+        if not self.multi:
+            return 0
+        rows = sorted({r for r in rows if 0 <= r < len(self._urls)}, reverse=True)
+        for row in rows:
+            url = self._urls[row]
+            self.beginInsertRows(QModelIndex(), row + 1, row + 1)
+            self._urls.insert(row + 1, url)
+            self._sections.insert(row + 1, None)
+            self._known[url] += 1
+            self.endInsertRows()
+        return len(rows)
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self._urls.clear()
+        self._sections.clear()
+        self._known.clear()
+        self.endResetModel()
+
+    def set_multi(self, multi: bool) -> None:
+        """Режим очереди; без него остаётся только первая ссылка."""
+        self.beginResetModel()
+        self.multi = multi
+        if not multi:
+            for url in self._urls[1:]:
+                self._forget(url)
+            del self._urls[1:]
+            del self._sections[1:]
+        self.endResetModel()
+
+    def entries(self) -> Iterator[Tuple[str, Section]]:
+        """(ссылка, (начало, конец) или None) для каждой строки."""
+        return zip(self._urls, self._sections)
+
+    def url_count(self) -> int:
+        return len(self._urls)
+
+    # ---------- вспомогательные методы ----------
+    def _can_add(self) -> bool:
+        return self.multi or not self._urls
+
+    def _forget(self, url: str) -> None:
+        self._known[url] -= 1
+        if self._known[url] <= 0:
+            del self._known[url]